@@ -1,6 +1,12 @@
 #!/usr/bin/env python3
 
+import os
+import datetime
+import threading
 import initIOCs
+from initIOCs import WITH_YAML, ConfigurationError, IOCActionManager, config_tooltips, create_actions, initIOC_print, \
+    init_iocs_cli, optional_config_keys, optional_ioc_keys, print_start_message, print_supported_drivers, read_ioc_config, \
+    required_ioc_keys, validate_ioc_config, write_ioc_config
 
 #-------------------------------------------------
 #---------------- MAIN GUI CLASSES ---------------
@@ -13,15 +19,314 @@ try:
     from tkinter import *
     from tkinter import messagebox
     from tkinter import simpledialog
+    from tkinter import filedialog
     import tkinter.scrolledtext as ScrolledText
     from tkinter import font as tkFont
     from tkinter import ttk
-    import threading
     import webbrowser
 except ImportError:
     WITH_GUI=False
 
 
+# Appended to drivers in the IOC type dropdown that are in the bundle, but were not built
+missing_executable_marker = ' (no executable)'
+
+
+# Configuration file key of each configuration input in the GUI
+gui_config_keys = {
+    'IOC_DIR' :         'ioc_dir',
+    'TOP_BINARY_DIR' :  'bundle_location',
+    'PREFIX' :          'beamline_prefix',
+    'ENGINEER' :        'engineer',
+    'HOSTNAME' :        'hostname',
+    'CA_ADDRESS' :      'ca_address_ip',
+}
+
+
+# Number of rows inserted into the IOC table per pass of the Tk main loop
+ioc_table_batch_size = 500
+
+
+class IOCTableModel:
+    """Class representing the rows of the IOC generation table, independent of the widget displaying them.
+
+    Each row is checked when it is added or changed. Only rows sharing a name or a telnet port with
+    the changed row are checked again, so edits stay fast in tables with thousands of IOCs. Telnet
+    ports are compared per IOC server, rows without a hostname using the top level hostname.
+
+    Attributes
+    ----------
+    columns : list of str
+        IOC configuration keys shown as table columns
+    rows : dict of str -> dict of {str, str}
+        values of each row by row id, in insertion order
+    errors : dict of str -> list of str
+        problems found with each row, empty if the row is valid
+    names : dict of str -> set of str
+        ids of rows using each IOC name
+    host_ports : dict of (str, int) -> set of str
+        ids of rows using each hostname and telnet port
+    default_hostname : str
+        top level hostname, used for rows that do not set their own
+    known_types : set of str
+        IOC types found in the bundle, None while the bundle is being scanned, so that types are not checked
+    """
+
+    columns = required_ioc_keys + optional_ioc_keys
+
+
+    def __init__(self):
+        """Constructor for IOCTableModel
+        """
+
+        self.rows = {}
+        self.errors = {}
+        self.names = {}
+        self.host_ports = {}
+        self.row_counter = 0
+        self.default_hostname = ''
+        self.known_types = None
+
+
+    def get_index_keys(self, values):
+        """Function that gets the keys under which a row is indexed for duplicate detection
+
+        Parameters
+        ----------
+        values : dict of {str, str}
+            values of the row
+
+        Returns
+        -------
+        name : str
+            IOC name, or None if empty
+        host_port : tuple of (str, int)
+            effective hostname and telnet port, or None if the port is not a valid number
+        """
+
+        name = values.get('name', '')
+        # Hostnames are not case sensitive, and a row may set the top level hostname explicitly
+        hostname = (values.get('hostname', '') or self.default_hostname).lower()
+        try:
+            host_port = (hostname, int(values.get('telnet_port', '')))
+        except ValueError:
+            host_port = None
+        return (name if name != '' else None), host_port
+
+
+    def index_row(self, row_id, add):
+        """Function that adds or removes a row from the duplicate detection indexes
+
+        Returns
+        -------
+        affected : set of str
+            ids of other rows sharing a name or telnet port with the row
+        """
+
+        affected = set()
+        for index, key in zip((self.names, self.host_ports), self.get_index_keys(self.rows[row_id])):
+            if key is None:
+                continue
+            ids = index.setdefault(key, set())
+            if add:
+                ids.add(row_id)
+            else:
+                ids.discard(row_id)
+            affected.update(ids)
+            if len(ids) == 0:
+                del index[key]
+        affected.discard(row_id)
+        return affected
+
+
+    def check_row(self, row_id):
+        """Function that finds problems with a single row
+
+        Returns
+        -------
+        errors : list of str
+            description of each problem, empty if the row is valid
+        """
+
+        values = self.rows[row_id]
+        errors = []
+        for key in required_ioc_keys:
+            if values.get(key, '') == '':
+                errors.append('Missing value for {}'.format(key))
+        name, host_port = self.get_index_keys(values)
+        if name is not None and len(self.names[name]) > 1:
+            errors.append('IOC name {} is used more than once'.format(name))
+        if values.get('telnet_port', '') != '':
+            if host_port is None or not 0 < host_port[1] < 65536:
+                errors.append('Telnet port must be a number between 1 and 65535')
+            elif len(self.host_ports[host_port]) > 1:
+                errors.append('Telnet port {} is used more than once'.format(host_port[1]))
+        if self.known_types is not None and values.get('type', '') != '' and values['type'] not in self.known_types:
+            errors.append('IOC type {} was not found in the bundle'.format(values['type']))
+        return errors
+
+
+    def set_default_hostname(self, hostname):
+        """Function that changes the top level hostname, indexing the rows without their own hostname again
+
+        Returns
+        -------
+        affected : set of str
+            ids of all rows whose errors were checked again
+        """
+
+        if hostname == self.default_hostname:
+            return set()
+        inheriting = [row_id for row_id, values in self.rows.items() if values.get('hostname', '') == '']
+        affected = set(inheriting)
+        for row_id in inheriting:
+            affected.update(self.index_row(row_id, False))
+        self.default_hostname = hostname
+        for row_id in inheriting:
+            affected.update(self.index_row(row_id, True))
+        self.recheck_rows(affected)
+        return affected
+
+
+    def set_known_types(self, known_types):
+        """Function that sets the IOC types found in the bundle once it is scanned, and checks every row against them
+
+        Returns
+        -------
+        affected : set of str
+            ids of all rows, as all were checked again
+        """
+
+        self.known_types = None if known_types is None else set(known_types)
+        self.recheck_rows(self.rows.keys())
+        return set(self.rows.keys())
+
+
+    def recheck_rows(self, row_ids):
+        for row_id in row_ids:
+            self.errors[row_id] = self.check_row(row_id)
+
+
+    def add_row(self, values):
+        """Function that adds a row to the end of the table
+
+        Parameters
+        ----------
+        values : dict
+            IOC configuration entry, missing columns are left empty
+
+        Returns
+        -------
+        row_id : str
+            id of the new row
+        affected : set of str
+            ids of all rows whose errors were checked again, including the new row
+        """
+
+        self.row_counter = self.row_counter + 1
+        row_id = 'I{}'.format(self.row_counter)
+        self.rows[row_id] = {key : ('' if values.get(key) is None else str(values.get(key))) for key in self.columns}
+        affected = self.index_row(row_id, True)
+        affected.add(row_id)
+        self.recheck_rows(affected)
+        return row_id, affected
+
+
+    def update_row(self, row_id, values):
+        """Function that replaces the values of a row
+
+        Returns
+        -------
+        affected : set of str
+            ids of all rows whose errors were checked again
+        """
+
+        affected = self.index_row(row_id, False)
+        self.rows[row_id] = {key : ('' if values.get(key) is None else str(values.get(key))) for key in self.columns}
+        affected.update(self.index_row(row_id, True))
+        affected.add(row_id)
+        self.recheck_rows(affected)
+        return affected
+
+
+    def remove_row(self, row_id):
+        """Function that removes a row from the table
+
+        Returns
+        -------
+        affected : set of str
+            ids of the remaining rows whose errors were checked again
+        """
+
+        affected = self.index_row(row_id, False)
+        del self.rows[row_id]
+        del self.errors[row_id]
+        self.recheck_rows(affected)
+        return affected
+
+
+    def clear(self):
+        self.rows.clear()
+        self.errors.clear()
+        self.names.clear()
+        self.host_ports.clear()
+
+
+    def get_row_values(self, row_id):
+        """Function that gets the values of a row in column order, for display
+        """
+
+        return [self.rows[row_id][key] for key in self.columns]
+
+
+    def invalid_rows(self):
+        return [row_id for row_id in self.rows.keys() if len(self.errors[row_id]) > 0]
+
+
+    def to_config(self, configuration):
+        """Function that combines the table with top level configuration values into a configuration
+
+        Parameters
+        ----------
+        configuration : dict
+            top level configuration keys and values
+
+        Returns
+        -------
+        config : dict
+            configuration in the format read by validate_ioc_config. Empty optional values are left out.
+        """
+
+        config = dict(configuration)
+        config['iocs'] = []
+        for values in self.rows.values():
+            config['iocs'].append({key : value for key, value in values.items() if key in required_ioc_keys or value != ''})
+        return config
+
+
+    def load_config(self, config):
+        """Function that replaces all rows with the IOC entries of a configuration
+
+        Returns
+        -------
+        row_ids : list of str
+            ids of the loaded rows, in order
+        """
+
+        self.clear()
+        self.default_hostname = config.get('hostname', self.default_hostname)
+        row_ids = []
+        # Index every row before checking them, rather than checking again for each duplicate
+        for ioc in config.get('iocs', []):
+            self.row_counter = self.row_counter + 1
+            row_id = 'I{}'.format(self.row_counter)
+            self.rows[row_id] = {key : ('' if ioc.get(key) is None else str(ioc.get(key))) for key in self.columns}
+            self.index_row(row_id, True)
+            row_ids.append(row_id)
+        self.recheck_rows(row_ids)
+        return row_ids
+
+
 
 
 class ToolTip:
@@ -111,8 +416,8 @@ class InitIOCGui:
         the containing window
     frame : tk frame
         the main frame
-    ioc_num_counter : int
-        counter for number of IOCs deployed.
+    ioc_table : IOCTableModel
+        rows of the ioc panel
     actions, configuration, bin_flat : list of IOCAction, dict of {str,str}, bool
         configuration of IOCs to generate
 
@@ -120,10 +425,12 @@ class InitIOCGui:
     -------
     initWindow()
         initializes the window
-    writeToIOCPanel()
-        writes to the ioc panel
-    readGUIConfig()
-        parses gui data into actions, configuration, binflat
+    addIOCRow()
+        adds an IOC to the ioc panel
+    loadIOCConfig()
+        replaces the configuration and ioc panel with a loaded configuration
+    read_gui_config()
+        parses gui data into actions and the manager
     execute()
         executes the ioc actions
     save()
@@ -158,6 +465,8 @@ class InitIOCGui:
 
         filemenu = Menu(menubar, tearoff=0)
         filemenu.add_command(label='Save Configuration',    command=self.save)
+        filemenu.add_command(label='Import IOCs...',        command=self.importIOCs)
+        filemenu.add_command(label='Export IOCs...',        command=self.exportIOCs)
         filemenu.add_command(label='Save Log',              command=self.saveLog)
         filemenu.add_command(label='Clear Log',             command=self.clearLog)
         filemenu.add_command(label='Exit',                  command=self.thread_cleanup)
@@ -165,6 +474,8 @@ class InitIOCGui:
 
         editmenu = Menu(menubar, tearoff=0)
         editmenu.add_command(label='Add IOC',           command=self.openAddIOCWindow)
+        editmenu.add_command(label='Edit Selected IOC', command=self.openEditIOCWindow)
+        editmenu.add_command(label='Remove Selected IOCs', command=self.removeSelectedIOCs)
         editmenu.add_command(label='Clear IOC table',   command=self.initIOCPanel)
         editmenu.add_checkbutton(label='Toggle Popups',             onvalue=True, offvalue=False, variable=self.showPopups)
         editmenu.add_checkbutton(label='Ask to Add Multiple IOCs',  onvalue=True, offvalue=False, variable=self.askAnother)
@@ -200,16 +511,44 @@ class InitIOCGui:
             CreateToolTip(elem_entry, config_tooltips[elem])
             row_counter = row_counter + 1
 
+        # Drivers in the bundle are scanned in the background whenever TOP_BINARY_DIR changes
+        self.bundle_scanner     = initIOCs.BundleScanner()
+        self.bundle_scan        = None
+        self.bundle_scan_after  = None
+        self.driver_choices     = []
+        self.driver_listeners   = []
+
         self.master.title('initIOC GUI')
 
         ttk.Separator(self.frame, orient=HORIZONTAL).grid(row=row_counter, columnspan=3, padx = 5, sticky = 'ew')
 
-        Label(self.frame, text='IOC Generation Table - You may edit this table manually, or add new IOCs with the Add Button').grid(row = 0, column = 3, columnspan = 5, padx = 10, pady = 10)
-        self.iocPanel = ScrolledText.ScrolledText(self.frame, width = '75', height = '15')
-        self.iocPanel.grid(row = 1, column = 3, padx = 15, pady = 15, columnspan = 5, rowspan = row_counter + 1)
+        Label(self.frame, text='IOC Generation Table - Double click an IOC to edit it, or add new IOCs with the Add Button').grid(row = 0, column = 3, columnspan = 5, padx = 10, pady = 10)
+        table_frame = Frame(self.frame)
+        table_frame.grid(row = 1, column = 3, padx = 15, pady = 15, columnspan = 5, rowspan = row_counter + 1)
+        self.ioc_table = IOCTableModel()
+        if 'HOSTNAME' in self.text_inputs:
+            self.ioc_table.set_default_hostname(self.text_inputs['HOSTNAME'].get())
+        # File the configuration is saved to, set once it was imported from or saved to a file
+        self.config_path = None
+        self.extra_configuration = {}
+        self.pending_rows = []
+        self.pending_rows_after = None
+        self.iocPanel = ttk.Treeview(table_frame, columns=IOCTableModel.columns, show='headings', height=15)
+        for column in IOCTableModel.columns:
+            self.iocPanel.heading(column, text=column)
+            self.iocPanel.column(column, width=90, stretch=True)
+        self.iocPanel.tag_configure('invalid', background='#f4c7c3')
+        scrollbar = ttk.Scrollbar(table_frame, orient=VERTICAL, command=self.iocPanel.yview)
+        self.iocPanel.configure(yscrollcommand=scrollbar.set)
+        self.iocPanel.pack(side=LEFT, fill=BOTH, expand=True)
+        scrollbar.pack(side=RIGHT, fill=Y)
+        self.iocPanel.bind('<Double-1>', lambda event : self.openEditIOCWindow())
+        self.iocPanel.bind('<Delete>', lambda event : self.removeSelectedIOCs())
+        self.iocPanel.bind('<<TreeviewSelect>>', lambda event : self.showRowErrors())
         self.initIOCPanel()
         for action in self.actions:
-            self.writeToIOCPanel(action.ioc_type, action.ioc_name, action.dev_prefix, action.asyn_port, action.ioc_port, action.connection)
+            self.addIOCRow({'name' : action.ioc_name, 'type' : action.ioc_type, 'device_prefix' : action.ioc_prefix, 'asyn_port' : action.asyn_port,
+                            'telnet_port' : action.ioc_port, 'connection' : action.connection, 'arch' : action.arch})
 
         Label(self.frame, text='Log', font=self.largeFontU).grid(row = row_counter + 1, column = 0, padx = 5, pady = 0)
         self.logPanel = ScrolledText.ScrolledText(self.frame, width='100', height = '15')
@@ -222,19 +561,184 @@ class InitIOCGui:
         runButton.grid( row=row_counter+4, column=5, columnspan=2, padx=5, pady=5)
         addButton.grid( row=row_counter+5, column=5, columnspan=2, padx=5, pady=5)
 
+        if 'HOSTNAME' in self.text_inputs:
+            self.text_inputs['HOSTNAME'].trace_add('write', lambda *args : self.refreshRows(self.ioc_table.set_default_hostname(self.text_inputs['HOSTNAME'].get())))
+        if 'TOP_BINARY_DIR' in self.text_inputs:
+            self.text_inputs['TOP_BINARY_DIR'].trace_add('write', lambda *args : self.scheduleBundleScan())
+            self.startBundleScan()
+
+
+    def scheduleBundleScan(self):
+        """Function that starts a bundle scan once TOP_BINARY_DIR is unchanged for half a second, so that
+        typing a path does not scan each of its prefixes
+        """
+
+        if self.bundle_scan_after is not None:
+            self.master.after_cancel(self.bundle_scan_after)
+        self.bundle_scan_after = self.master.after(500, self.startBundleScan)
+
+
+    def startBundleScan(self):
+        """Function that starts scanning the bundle in TOP_BINARY_DIR in the background, if it is not cached
+        """
+
+        self.bundle_scan_after = None
+        binary_location = self.text_inputs['TOP_BINARY_DIR'].get()
+        future = self.bundle_scanner.scan(binary_location)
+        self.bundle_scan = future
+        if not future.done():
+            self.writeToLog('Scanning bundle {} for drivers...\n'.format(binary_location))
+            self.setDriverChoices([])
+            # IOC types are checked again once the scan completes
+            self.refreshRows(self.ioc_table.set_known_types(None))
+        self.checkBundleScan(binary_location, future)
+
+
+    def isBundleScanPending(self):
+        """Function that checks if the drivers in the bundle are not known yet, as it is scheduled to be or being scanned
+        """
+
+        return self.bundle_scan_after is not None or (self.bundle_scan is not None and not self.bundle_scan.done())
+
+
+    def checkBundleScan(self, binary_location, future):
+        """Function that polls a bundle scan from the Tk main loop, since widgets may only be updated from its thread
+        """
+
+        if future is not self.bundle_scan:
+            # TOP_BINARY_DIR was changed again, and a newer scan replaced this one
+            return
+        if not future.done():
+            self.master.after(100, lambda : self.checkBundleScan(binary_location, future))
+            return
+
+        try:
+            registry = future.result()
+        except OSError as e:
+            self.writeToLog('WARNING - Could not scan bundle: {}\n'.format(e))
+            self.setDriverChoices([])
+            return
+        choices = self.getDriverChoices(registry)
+        self.setDriverChoices(choices)
+        self.refreshRows(self.ioc_table.set_known_types([choice for choice in choices if not choice.endswith(missing_executable_marker)]))
+
+
+    def getDriverChoices(self, registry):
+        """Function that lists the drivers in a registry for the IOC type dropdown, marking drivers without an executable
+        """
+
+        if self.manager.use_template:
+            return registry.template_names()
+        choices = registry.names()
+        for name, driver in registry.drivers.items():
+            if driver.executable_path is None:
+                choices.append(name + missing_executable_marker)
+        return choices
+
+
+    def setDriverChoices(self, choices):
+        """Function that updates the IOC type dropdown of every open add IOC window
+        """
+
+        self.driver_choices = choices
+        for listener in list(self.driver_listeners):
+            listener(choices)
+
 
     def initIOCPanel(self):
         """ Function that resets the IOC panel """
 
-        self.iocPanel.delete('1.0', END)
-        self.iocPanel.insert(INSERT, '# IOC Type        IOC Name    Device Prefix   Asyn Port      IOC Port      Cam Connection\n')
-        self.iocPanel.insert(INSERT, '#-----------------------------------------------------------------------------------------\n')
+        if self.pending_rows_after is not None:
+            self.master.after_cancel(self.pending_rows_after)
+            self.pending_rows_after = None
+        self.pending_rows = []
+        self.ioc_table.clear()
+        self.iocPanel.delete(*self.iocPanel.get_children())
+
+
+    def insertPendingRows(self):
+        """Function that inserts the next batch of loaded rows into the IOC panel.
+
+        ttk.Treeview has no virtual mode, so large tables are inserted in batches from the Tk main loop
+        to keep the window responsive while they load.
+        """
+
+        self.pending_rows_after = None
+        batch = self.pending_rows[:ioc_table_batch_size]
+        del self.pending_rows[:ioc_table_batch_size]
+        for row_id in batch:
+            if row_id in self.ioc_table.rows:
+                self.iocPanel.insert('', END, iid=row_id, values=self.ioc_table.get_row_values(row_id), tags=self.getRowTags(row_id))
+        if len(self.pending_rows) > 0:
+            self.pending_rows_after = self.master.after(1, self.insertPendingRows)
 
 
-    def writeToIOCPanel(self, ioc_type, name, dev_prefix, asyn, port, connect):
-        """ Function that writes to the iocPanel """
+    def getRowTags(self, row_id):
+        if len(self.ioc_table.errors[row_id]) > 0:
+            return ('invalid',)
+        return ()
+
+
+    def refreshRows(self, row_ids):
+        """Function that redraws rows of the IOC panel after their values or errors changed
+        """
+
+        for row_id in row_ids:
+            if self.iocPanel.exists(row_id):
+                self.iocPanel.item(row_id, values=self.ioc_table.get_row_values(row_id), tags=self.getRowTags(row_id))
+
+
+    def addIOCRow(self, values):
+        """ Function that adds an IOC to the ioc panel """
+
+        row_id, affected = self.ioc_table.add_row(values)
+        self.pending_rows.append(row_id)
+        if self.pending_rows_after is None:
+            self.insertPendingRows()
+        self.refreshRows(affected)
+        return row_id
+
+
+    def updateIOCRow(self, row_id, values):
+        self.refreshRows(self.ioc_table.update_row(row_id, values))
+
+
+    def removeSelectedIOCs(self):
+        """Function that removes the selected IOCs from the ioc panel
+        """
+
+        affected = set()
+        for row_id in self.iocPanel.selection():
+            affected.update(self.ioc_table.remove_row(row_id))
+            affected.discard(row_id)
+            self.iocPanel.delete(row_id)
+        self.refreshRows(affected)
+
+
+    def showRowErrors(self):
+        """Function that logs the problems with the selected IOC
+        """
+
+        selection = self.iocPanel.selection()
+        if len(selection) == 1:
+            for error in self.ioc_table.errors.get(selection[0], []):
+                self.writeToLog('WARNING - {}: {}\n'.format(self.ioc_table.rows[selection[0]]['name'], error))
+
+
+    def loadIOCConfig(self, config):
+        """Function that replaces the configuration inputs and ioc panel with a loaded configuration
+        """
 
-        self.iocPanel.insert(INSERT, '{:<18}{:<15}{:<15}{:<15}{:<12}{}\n'.format(ioc_type, name, dev_prefix, asyn, port, connect))
+        for elem, key in gui_config_keys.items():
+            if elem in self.text_inputs and key in config:
+                self.text_inputs[elem].set(config[key])
+        self.extra_configuration = {key : config[key] for key in optional_config_keys if key in config}
+        self.initIOCPanel()
+        self.pending_rows = self.ioc_table.load_config(config)
+        self.insertPendingRows()
+        invalid = self.ioc_table.invalid_rows()
+        if len(invalid) > 0:
+            self.showWarning('{} of the loaded IOCs are invalid, and are highlighted in the table.'.format(len(invalid)))
 
 
     def writeToLog(self, text):
@@ -266,33 +770,46 @@ class InitIOCGui:
         self.writeToLog(text + '\n')
 
 
-    def read_gui_config(self):
-        """Function that reads values entered into gui into actions, configuration, and bin_flat 
+    def get_gui_config(self):
+        """Function that combines the configuration inputs and ioc panel into a configuration
         """
 
         for elem in self.text_inputs.keys():
             if self.text_inputs[elem].get() != self.configuration[elem]:
                 self.configuration[elem] = self.text_inputs[elem].get()
-        
-        self.manager.ioc_top = self.configuration['IOC_DIR']
-        self.manager.binary_location = self.configuration['TOP_BINARY_DIR']
+        config = {gui_config_keys[elem] : value for elem, value in self.configuration.items() if elem in gui_config_keys}
+        config.update(self.extra_configuration)
+        return self.ioc_table.to_config(config)
+
+
+    def read_gui_config(self):
+        """Function that reads values entered into gui into actions and the manager
+
+        Returns
+        -------
+        valid : bool
+            False if the configuration is invalid, after showing the problems with it
+        """
+
+        try:
+            config = validate_ioc_config(self.get_gui_config())
+        except ConfigurationError as e:
+            self.showError('Invalid IOC configuration:\n' + '\n'.join(e.errors))
+            return False
+
+        self.manager.ioc_top = config['ioc_dir']
+        self.manager.binary_location = config['bundle_location']
 
         self.manager.binaries_flat = self.manager.check_binaries_flat()
 
+        # Reuse the background scan of the bundle if it finished
+        registry = self.bundle_scanner.get(self.manager.binary_location)
+        if registry is not None:
+            self.manager.bundle_index = registry.bundle_index
         self.manager.update_mod_paths()
 
-        del self.actions[:]
-        for line in self.iocPanel.get('1.0', END).splitlines():
-            if not line.startswith('#') and len(line) > 1:
-                action = parse_line_into_action(line, self.configuration['PREFIX'])
-                action.epics_environment['HOSTNAME'] = self.configuration['HOSTNAME']
-                action.epics_environment['ENGINEER'] = self.configuration['ENGINEER']
-                action.epics_environment['EPICS_CA_ADDR_LIST'] = self.configuration['CA_ADDRESS']
-                if action is not None:
-                    self.actions.append(action)
-                    self.ioc_num_counter = self.ioc_num_counter + 1
-                else:
-                    self.showWarning('Could not parse one of the IOC lines entered into the table.')
+        self.actions[:] = create_actions(config)
+        return True
 
 
     def execute(self):
@@ -301,27 +818,71 @@ class InitIOCGui:
 
         if self.executionThread.is_alive():
             self.showError('Process thread is already active!')
-        else:
-           self.read_gui_config()
+        elif self.read_gui_config():
            self.executionThread = threading.Thread(target=lambda : init_iocs_cli(self.actions, self.manager))
            self.executionThread.start()
 
 
+    def writeConfig(self, config_path):
+        """Function that writes the configuration inputs and ioc panel into a configuration file, returning True if it was written
+        """
+
+        try:
+            write_ioc_config(self.get_gui_config(), config_path)
+        except (ConfigurationError, OSError) as e:
+            self.showError('Could not write {}: {}'.format(config_path, e))
+            return False
+        invalid = self.ioc_table.invalid_rows()
+        if len(invalid) > 0:
+            self.showWarning('Saved {} invalid IOCs to {}, they must be fixed before generating.'.format(len(invalid), config_path))
+        self.writeToLog('Saved configuration to {}.\n'.format(config_path))
+        return True
+
+
     def save(self):
-        """Saves the current IOC configuration
+        """Saves the current IOC configuration to the file it was imported from or last saved to, asking for a file otherwise
         """
 
-        self.read_gui_config()
-        if os.path.exists('CONFIGURE'):
-            os.remove('CONFIGURE')
-        file = open('CONFIGURE', 'w')
-        file.write('#\n# initIOCs CONFIGURE file autogenerated on {}\n#\n\n'.format(datetime.datetime.now()))
-        for elem in self.configuration.keys():
-            file.write('# {}\n'.format(config_tooltips[elem]))
-            file.write('{}={}\n\n'.format(elem, self.configuration[elem]))
+        config_path = self.config_path
+        if config_path is None:
+            if WITH_YAML:
+                filetypes = [('YAML', '*.yml'), ('JSON', '*.json'), ('CSV', '*.csv')]
+            else:
+                filetypes = [('JSON', '*.json'), ('CSV', '*.csv')]
+            config_path = filedialog.asksaveasfilename(title='Save Configuration', defaultextension=filetypes[0][1][1:], filetypes=filetypes)
+            if not config_path:
+                return
+        if self.writeConfig(config_path):
+            self.config_path = config_path
+
+
+    def importIOCs(self):
+        """Function that replaces the current IOC configuration with one read from a YAML, JSON or CSV file
+        """
 
-        file.write(self.iocPanel.get('1.0', END))
-        initIOC_print('Saved configuration to CONFIGURE file.')
+        config_path = filedialog.askopenfilename(title='Import IOCs', filetypes=[('IOC configuration', '*.yml *.yaml *.json *.csv'), ('All files', '*')])
+        if not config_path:
+            return
+        try:
+            config = read_ioc_config(config_path)
+        except ConfigurationError as e:
+            self.showError('Could not import {}:\n'.format(config_path) + '\n'.join(e.errors))
+            return
+        except OSError as e:
+            self.showError('Could not import {}: {}'.format(config_path, e))
+            return
+        self.loadIOCConfig(config)
+        self.config_path = config_path
+        self.writeToLog('Imported {} IOCs from {}.\n'.format(len(config['iocs']), config_path))
+
+
+    def exportIOCs(self):
+        """Function that writes the current IOC configuration to a YAML, JSON or CSV file
+        """
+
+        config_path = filedialog.asksaveasfilename(title='Export IOCs', defaultextension='.csv', filetypes=[('CSV', '*.csv'), ('YAML', '*.yml'), ('JSON', '*.json')])
+        if config_path:
+            self.writeConfig(config_path)
 
 
     def saveLog(self):
@@ -354,9 +915,19 @@ class InitIOCGui:
         AddIOCWindow(self)
 
 
+    def openEditIOCWindow(self):
+        """Opens an addIOC window for editing the selected IOC
+        """
+
+        selection = self.iocPanel.selection()
+        if len(selection) > 0:
+            AddIOCWindow(self, selection[0])
+
+
     def thread_cleanup(self):
         if self.executionThread.is_alive():
             self.executionThread.join()
+        self.bundle_scanner.close()
         self.master.destroy()
 
 
@@ -364,15 +935,15 @@ class AddIOCWindow:
     """Class representing a window for adding a new IOC into the config
     """
 
-    def __init__(self, root):
+    def __init__(self, root, row_id=None):
 
         self.root = root
+        self.row_id = row_id
         self.master = Toplevel()
-        self.master.title('Add New IOC')
+        self.master.title('Add New IOC' if row_id is None else 'Edit IOC')
 
         # Create the entry fields for all the paramters
         self.ioc_type_var       = StringVar()
-        self.ioc_type_var.set(supported_drivers[0])
 
         self.ioc_name_var       = StringVar()
         self.dev_prefix_var     = StringVar()
@@ -381,45 +952,79 @@ class AddIOCWindow:
         self.cam_connect_var    = StringVar()
 
         Label(self.master, text="IOC Type").grid(row = 0, column = 0, padx = 10, pady = 10)
-        ioc_type_entry      = ttk.Combobox(self.master, textvariable=self.ioc_type_var, values=supported_drivers)
-        ioc_type_entry.grid(row = 0, column = 1, columnspan=2, padx = 10, pady = 10)
-        CreateToolTip(ioc_type_entry, 'The IOC type. Must be from list of supported drivers.')
+        self.ioc_type_entry = ttk.Combobox(self.master, textvariable=self.ioc_type_var, values=[])
+        self.ioc_type_entry.grid(row = 0, column = 1, columnspan=2, padx = 10, pady = 10)
+        CreateToolTip(self.ioc_type_entry, 'The IOC type. Must be one of the drivers found in the bundle.')
+
+        # The dropdown is filled in once the background scan of the bundle finishes
+        self.updateDriverChoices(self.root.driver_choices)
+        self.root.driver_listeners.append(self.updateDriverChoices)
+        self.master.bind('<Destroy>', self.onDestroy)
 
         Label(self.master, text="IOC Name").grid(row = 1, column = 0, padx = 10, pady = 10)
         ioc_name_entry      = Entry(self.master, textvariable=self.ioc_name_var)
         ioc_name_entry.grid(row = 1, column = 1, columnspan=2, padx = 10, pady = 10)
         CreateToolTip(ioc_name_entry, 'The name of the IOC. Usually cam-$NAME')
 
-        Label(self.master, text="Device Prefix").grid(row = 1, column = 0, padx = 10, pady = 10)
+        Label(self.master, text="Device Prefix").grid(row = 2, column = 0, padx = 10, pady = 10)
         dev_prefix_entry      = Entry(self.master, textvariable=self.dev_prefix_var)
-        dev_prefix_entry.grid(row = 1, column = 1, columnspan=2, padx = 10, pady = 10)
+        dev_prefix_entry.grid(row = 2, column = 1, columnspan=2, padx = 10, pady = 10)
         CreateToolTip(dev_prefix_entry, 'The device-specific prefix. ex. {{Sim-Cam:1}}')
 
-        Label(self.master, text="Asyn Port").grid(row = 2, column = 0, padx = 10, pady = 10)
+        Label(self.master, text="Asyn Port").grid(row = 3, column = 0, padx = 10, pady = 10)
         asyn_port_entry     = Entry(self.master, textvariable=self.asyn_port_var)
-        asyn_port_entry.grid(row = 2, column = 1, columnspan=2, padx = 10, pady = 10)
+        asyn_port_entry.grid(row = 3, column = 1, columnspan=2, padx = 10, pady = 10)
         CreateToolTip(asyn_port_entry, 'IOC Asyn port. Usually Shorthand of IOC type and number. ex. SIM1')
 
-        Label(self.master, text="IOC Port").grid(row = 3, column = 0, padx = 10, pady = 10)
+        Label(self.master, text="IOC Port").grid(row = 4, column = 0, padx = 10, pady = 10)
         ioc_port_entry      = Entry(self.master, textvariable=self.ioc_port_var)
-        ioc_port_entry.grid(row = 3, column = 1, columnspan=2, padx = 10, pady = 10)
+        ioc_port_entry.grid(row = 4, column = 1, columnspan=2, padx = 10, pady = 10)
         CreateToolTip(ioc_port_entry, 'Telnet port used by softioc when running the IOC')
 
-        Label(self.master, text="Cam Connection").grid(row = 4, column = 0, padx = 10, pady = 10)
+        Label(self.master, text="Cam Connection").grid(row = 5, column = 0, padx = 10, pady = 10)
         cam_connect_entry   = Entry(self.master, textvariable=self.cam_connect_var)
-        cam_connect_entry.grid(row = 4, column = 1, columnspan=2, padx = 10, pady = 10)
+        cam_connect_entry.grid(row = 5, column = 1, columnspan=2, padx = 10, pady = 10)
         CreateToolTip(cam_connect_entry, 'A general parameter used to connect to camera. Typically IP, Serial #, config path, etc.')
 
-        Button(self.master,text="Submit", command=self.submit).grid(row = 5, column = 0, padx = 10, pady = 10)
-        Button(self.master,text="Cancel", command=self.master.destroy).grid(row = 5, column = 2, padx = 10, pady = 10)
+        Button(self.master,text="Submit", command=self.submit).grid(row = 6, column = 0, padx = 10, pady = 10)
+        Button(self.master,text="Cancel", command=self.master.destroy).grid(row = 6, column = 2, padx = 10, pady = 10)
+
+        if self.row_id is not None:
+            values = self.root.ioc_table.rows[self.row_id]
+            self.ioc_name_var.set(values['name'])
+            self.dev_prefix_var.set(values['device_prefix'])
+            self.asyn_port_var.set(values['asyn_port'])
+            self.ioc_port_var.set(values['telnet_port'])
+            self.cam_connect_var.set(values['connection'])
+            self.ioc_type_var.set(values['type'])
+
+
+    def updateDriverChoices(self, choices):
+        """Function that replaces the drivers listed in the IOC type dropdown
+        """
+
+        self.ioc_type_entry['values'] = choices
+        # An edited IOC keeps its type while the bundle is being scanned
+        if self.ioc_type_var.get() not in choices and (self.row_id is None or len(choices) > 0):
+            self.ioc_type_var.set(choices[0] if len(choices) > 0 else '')
+
+
+    def onDestroy(self, event):
+        # Destroy events are also sent for each child widget
+        if event.widget is self.master and self.updateDriverChoices in self.root.driver_listeners:
+            self.root.driver_listeners.remove(self.updateDriverChoices)
 
 
     def submit(self):
         """Function that enters the filled IOC values into the configuration
         """
 
-        if self.ioc_type_var.get() not in supported_drivers:
-            self.root.showError('The selected IOC type is not supported.')
+        if self.ioc_type_var.get().endswith(missing_executable_marker):
+            self.root.showError('The selected IOC type has no executable in the bundle.')
+            return
+        elif not self.root.isBundleScanPending() and self.ioc_type_var.get() not in self.root.driver_choices:
+            # While the bundle is scanned, the type is accepted and checked with all other IOCs once the scan completes
+            self.root.showError('The selected IOC type was not found in the bundle.')
             self.master.destroy()
             return
 
@@ -433,7 +1038,15 @@ class AddIOCWindow:
             self.root.showError('Please enter a valid value for all of the fields.')
             return
 
-        self.root.writeToIOCPanel(ioc_type, name, dev_prefix, asyn, port, connect)
+        values = {'name' : name, 'type' : ioc_type, 'device_prefix' : dev_prefix, 'asyn_port' : asyn, 'telnet_port' : port, 'connection' : connect}
+        if self.row_id is not None:
+            # Optional values not shown in this window are kept
+            values = dict(self.root.ioc_table.rows[self.row_id], **values)
+            self.root.updateIOCRow(self.row_id, values)
+            self.root.writeToLog('Updated IOC {} in configuration.\n'.format(name))
+            self.master.destroy()
+            return
+        self.root.addIOCRow(values)
         self.root.writeToLog('Added IOC {} to configuration.\n'.format(name))
 
         if self.root.askAnother.get():
@@ -452,13 +1065,26 @@ class AddIOCWindow:
 
 
 def main():
-                    if not WITH_GUI:
-                    initIOC_print('ERROR - TKinter GUI package not installed. Please intall and rerun.')
-                    exit()
-                else:
-                    root = Tk()
-                    USING_GUI = True
-                    app = InitIOCGui(root, configuration, actions, manager)
-                    GUI_TOP_WINDOW = app
-                    print_start_message()
-                    root.mainloop()
\ No newline at end of file
+    if not WITH_GUI:
+        initIOC_print('ERROR - TKinter GUI package not installed. Please intall and rerun.')
+        exit()
+    else:
+        configuration = {
+            'IOC_DIR' :         initIOCs.base_configuration['ioc_dir'],
+            'TOP_BINARY_DIR' :  initIOCs.base_configuration['bundle_location'],
+            'PREFIX' :          initIOCs.base_configuration['beamline_prefix'],
+            'ENGINEER' :        initIOCs.base_configuration['engineer'],
+            'HOSTNAME' :        initIOCs.base_configuration['hostname'],
+            'CA_ADDRESS' :      initIOCs.base_configuration['ca_address_ip'],
+        }
+        manager = IOCActionManager(configuration['IOC_DIR'], configuration['TOP_BINARY_DIR'], False, False, True, False)
+        root = Tk()
+        app = InitIOCGui(root, configuration, [], manager)
+        initIOCs.USING_GUI = True
+        initIOCs.GUI_TOP_WINDOW = app
+        print_start_message()
+        root.mainloop()
+
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,7 @@ Author: Jakub Wlodek
 
 # imports
 import os
+import posixpath
 import re
 import time
 import shutil
@@ -17,11 +18,48 @@ import subprocess
 import argparse
 import datetime
 import sys
+import json
+import csv
+import hashlib
+import io
+import tarfile
+import threading
+import concurrent.futures
+import socket
+import socketserver
+import tempfile
+import getpass
+import signal
+import shlex
+import math
+import stat
+import select
+import struct
+from collections import ChainMap
+from types import MappingProxyType
 WITH_YAML=True
 try:
     import yaml
+    # Prefer the libyaml based loader, it is much faster for large configuration files
+    try:
+        from yaml import CSafeLoader as YAMLSafeLoader
+    except ImportError:
+        from yaml import SafeLoader as YAMLSafeLoader
 except ImportError:
     WITH_YAML=False
+WITH_ZSTD=True
+try:
+    import zstandard
+except ImportError:
+    WITH_ZSTD=False
+WITH_INOTIFY=True
+try:
+    import ctypes
+    import ctypes.util
+    inotify_libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    inotify_libc.inotify_init1
+except (ImportError, OSError, AttributeError, TypeError):
+    WITH_INOTIFY=False
 from sys import platform
 
 # variables used to allow for printing text to GUI or stdout depending on usage
@@ -40,6 +78,12 @@ __version__ = "v0.1.0"
 KERNEL_PATH_LIMIT = 127
 
 
+# Build architecture used when neither the configuration nor the bundle selects one
+default_architecture = 'linux-x86_64'
+if platform == 'win32':
+    default_architecture = 'windows-x64-static'
+
+
 # list of currently supported drivers (for template based generation). Also used for dropdown in GUI
 supported_drivers = [
     'ADProsilica',
@@ -80,6 +124,51 @@ base_configuration = {
 }
 
 
+# Keys required at the top level of an initIOC configuration file
+required_config_keys = [
+    'ioc_dir',
+    'bundle_location',
+    'beamline_prefix',
+    'engineer',
+    'hostname',
+    'ca_address_ip',
+]
+
+
+# Keys required for each IOC entry in the configuration file
+required_ioc_keys = [
+    'name',
+    'type',
+    'device_prefix',
+    'asyn_port',
+    'telnet_port',
+    'connection',
+]
+
+
+# Keys that may be set at the top level of an initIOC configuration file
+optional_config_keys = [
+    'arch',
+]
+
+
+# Keys that may be set for each IOC entry to override the top level value
+optional_ioc_keys = [
+    'hostname',
+    'arch',
+]
+
+
+# Version of the rules validate_ioc_config applies. Bump whenever validation changes, so that configurations
+# cached with --config-cache by an earlier validator are validated again
+config_schema_version = 3
+
+
+# Hostnames are used as directory and archive names with --partition, so only plain host names are accepted
+hostname_pattern = re.compile(r'[A-Za-z0-9][A-Za-z0-9.-]*')
+
+
+# Connection variable of drivers for which it cannot be detected from the bundle, see DriverRegistry
 existing_connection_parameter = {
     "ADEiger"       : "EIGER_IP",
     "ADAravis"      : "CAMERA_NAME",
@@ -88,638 +177,5384 @@ existing_connection_parameter = {
     "ADUVC"         : "UVC_SERIAL"
 }
 
+
+# Patterns of epicsEnvSet variable names in driver startup scripts that hold the device connection parameter
+connection_variable_patterns = [
+    r'\w+_IP$',
+    r'CAMERA_(NAME|ID)$',
+    r'\w*SERIAL(_NUMBER)?$',
+    r'\w+_ADDR(ESS)?$',
+]
+
+# Channel access defaults shared by all IOCs. Lowest priority layer of each IOC environment
+default_ca_environment = MappingProxyType({
+    'EPICS_CA_AUTO_ADDR_LIST' :     'NO',
+    'EPICS_CA_ADDR_LIST' :          'NA',
+    'EPICS_CA_MAX_ARRAY_BYTES' :    '6000000',
+})
+
+
+# These epics environment variables are set by the user for each IOC
+user_entered_env = frozenset([
+    'ENGINEER',
+    'PORT',
+    'IOC',
+    'CAM-CONNECT',
+    'PREFIX',
+    'CTPREFIX',
+    'HOSTNAME',
+    'IOCNAME',
+])
+
 # On windows default to C directory
 if platform == 'win32':
     base_configuration['ioc_dir'] = 'C:' + base_configuration['ioc_dir']
     base_configuration['bundle_location'] = 'C:' + base_configuration['bundle_location']
 
 
+# Directory next to the generated IOCs that they are written into before being moved into place
+staging_dir_name = '.initIOC-staging'
+
+# Generated IOC files that are commonly edited in place, so snapshots keep their own copies instead of links
+editable_ioc_files = ['st.cmd', 'st_base.cmd', 'unique.cmd', 'config', 'envPaths', 'auto_settings.req', 'initIOCs.yml']
+
+# Policies for syncing generated files to disk, see DiskOutput
+fsync_policies = ['none', 'per-ioc', 'per-file']
+
 # External areaDetector plugins
 ad_plugins = ['ADCompVision', 'ADPluginBar', 'ADPluginEdge', 'ADPluginDmtx']
 
+# Phases of generating an IOC that are timed, see IOCResult.durations
+generation_phases = ['locate', 'generate', 'configure', 'write']
+
+# Possible outcomes of generating an IOC, see IOCResult.status
+ioc_statuses = ['created', 'failed', 'skipped', 'locked']
+
+# Upper bounds in seconds of the phase duration histogram buckets written with --metrics-file
+metrics_duration_buckets = [0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30]
+
+# Repository that IOCs are generated from with -t
+template_url = 'https://github.com/epicsNSLS2-deploy/ioc-template'
+
+# Files and directories of ioc-template that are only used while generating, removed from each generated IOC.
+# Equivalent to the cleanup scripts shipped with the template.
+template_cleanup_paths = ['.git', 'startupScripts', 'autosaveFiles', 'dependancyFiles', 'README.md', 'cleanup.sh', 'cleanup.bat']
+
+# Seconds an external command such as git may run before it is killed, and how many may run at once
+default_command_timeout = 120
+max_concurrent_commands = 4
+
+# Suffix of the lock file held while an IOC is generated, and seconds after which an abandoned lock is broken
+lock_file_suffix = '.initIOC-lock'
+stale_lock_age = 3600
+
+# Number of links followed when resolving a path in a MemoryFileSystem
+max_link_depth = 40
+
+# Kinds of filesystem operation delayed by a LatencyFileSystem, and the seconds each takes on a typical NFS mount
+filesystem_operations = ['stat', 'listdir', 'open', 'modify', 'sync']
+nfs_latencies = {'stat' : 0.0005, 'listdir' : 0.0005, 'open' : 0.002, 'modify' : 0.001, 'sync' : 0.005}
+
 #-------------------------------------------------
-#------------ INTERNAL DATA MODEL CLASS ----------
+#-------------- FILESYSTEM BACKENDS --------------
 #-------------------------------------------------
 
 
-def initIOC_path_join(path_A, path_B):
-    """Function that joins two paths.
+class LocalFileSystem:
+    """Filesystem backend that reads and writes the real filesystem.
 
-    All paths use / instead of \\ for simplicity.
+    Bundle indexes, disk outputs and IOC action managers perform all of their filesystem
+    access through a backend, so that they can be run against MemoryFileSystem instead.
     """
 
-    output_path = path_A
-    if not path_A.endswith('/'):
-        output_path = output_path + '/'
-    if path_B.startswith('/'):
-        output_path = output_path + path_B[1:]
-    else:
-        output_path = output_path + path_B
+    on_disk = True
 
-    if output_path.endswith('/'):
-        output_path = output_path[:-1]
 
-    return output_path
+    def exists(self, path):
+        return os.path.exists(path)
 
 
-class IOCActionManager:
+    def lexists(self, path):
+        return os.path.lexists(path)
 
-    def __init__(self, ioc_top, binary_location, set_lib_path, use_template, with_deps, use_links):
 
-        self.ioc_top            = ioc_top
-        self.ioc_top_created    = False
-        self.binary_location    = binary_location
-        self.binaries_flat      = self.check_binaries_flat()
-        self.set_lib_path       = set_lib_path
-        self.use_template       = use_template
-        self.with_deps          = with_deps
-        self.use_links          = use_links
-        self.processed_actions  = []
-        self.update_mod_paths()
+    def isdir(self, path):
+        return os.path.isdir(path)
 
 
-    def check_binaries_flat(self):
-        if os.path.exists(initIOC_path_join(self.binary_location, 'support')):
-            return False
-        return True
+    def islink(self, path):
+        return os.path.islink(path)
 
 
-    def deployment_info(self, action):
-        """Function that generates string of info for current IOCAction
-        """
+    def readlink(self, path):
+        return os.readlink(path)
 
-        info = ''
-        info = info + '#\n# {} IOC deployed using initIOC {}\n'.format(action.ioc_type, __version__)
-        info = info + '# Initial target bundle location: {}\n'.format(self.binary_location)
-        if self.use_template:
-            info = info + '# IOC generated from: https://github.com/epicsNSLS2-deploy/ioc-template\n'
-        else:
-            _, _, iocBoot_path = self.find_paths_for_action(action.ioc_type)
-            if iocBoot_path is not None:
-                info = info + '# IOC generated from: {}\n'.format(iocBoot_path)
 
-        info = info + '#{}\n'.format('-' * 64)
-        return info
+    def get_mtime(self, path):
+        return os.stat(path).st_mtime_ns
 
 
-    def update_mod_paths(self):
-        """Function that sets the paths of core modules based on binary location and format
+    def getsize(self, path):
+        return os.path.getsize(path)
+
+
+    def scandir(self, path):
+        """Lists a directory
+
+        Returns
+        -------
+        entries : list of (str, bool, bool)
+            name of each entry, and whether it is a directory or a regular file, following links
         """
 
-        self.binaries_flat = self.check_binaries_flat()
-        self.base_path = initIOC_path_join(self.binary_location, 'base')
-        if self.binaries_flat:
-            self.support_path = self.binary_location
-        else:
-            self.support_path = initIOC_path_join(self.binary_location, 'support')
+        with os.scandir(path) as it:
+            return [(entry.name, entry.is_dir(), entry.is_file()) for entry in it]
 
-        self.areaDetector_path = initIOC_path_join(self.support_path, 'areaDetector')
 
+    def read_text(self, path):
+        with open(path, 'r') as fp:
+            return fp.read()
 
-    def find_paths_for_action(self, ioc_type):
-        """Finds ioc_top, executable, and iocBoot folder for IOCAction
-        """
 
-        try:
-            driver_path = initIOC_path_join(self.areaDetector_path, ioc_type)
+    def read_lines(self, path):
+        with open(path, 'r') as fp:
+            return fp.readlines()
 
-            # identify the IOCs folder
-            for name in os.listdir(driver_path):
-                if "ioc" == name or "iocs" == name:
-                    driver_path = initIOC_path_join(driver_path, name)
-                    break
 
-            # identify the IOC 
-            for name in os.listdir(driver_path):
-                # Add check to see if NOIOC in name - occasional problems generating ADSimDetector
-                if ("IOC" in name or "ioc" in name) and "NOIOC" not in name.upper():
-                    driver_path = initIOC_path_join(driver_path, name)
-                    break
+    def open_binary(self, path):
+        return open(path, 'rb')
 
-            ioc_top_path = driver_path
 
-            # find the driver executable
-            executable_path = initIOC_path_join(driver_path, "bin")
-            # There should only be one architecture in the bundle
-            for name in os.listdir(executable_path):
-                executable_path = initIOC_path_join(executable_path, name)
-                break
+    def write_text(self, path, text):
+        with open(path, 'w') as fp:
+            fp.write(text)
 
-            # We look for the executable that ends with App
-            for name in os.listdir(executable_path):
-                if 'App' in name:
-                    executable_path = initIOC_path_join(executable_path, name)
-                    break
 
-            iocBoot_path = initIOC_path_join(driver_path, 'iocBoot')
-            for dir in os.listdir(iocBoot_path):
-                if dir.startswith('ioc') and os.path.isdir(initIOC_path_join(iocBoot_path, dir)) and not dir.endswith('Test'):
-                    iocBoot_path = initIOC_path_join(iocBoot_path, dir)
-                    break
-            return ioc_top_path, executable_path, iocBoot_path
-        except:
-            return None, None, None
+    def copyfile(self, source, path):
+        shutil.copyfile(source, path)
 
 
-    def get_lib_path_for_module(self, module_path, architecture, delimeter):
-        """Generates a library path for specific module
-        """
+    def symlink(self, source, path):
+        os.symlink(source, path)
 
-        bin_loc = initIOC_path_join(module_path, 'bin')
-        bin_loc = initIOC_path_join(bin_loc, architecture)
-        lib_loc = initIOC_path_join(module_path, 'lib')
-        lib_loc = initIOC_path_join(lib_loc, architecture)
-        return bin_loc + delimeter + lib_loc + delimeter
 
+    def chmod(self, path, mode):
+        os.chmod(path, mode)
 
-    def get_lib_path_str(self, action):
-        """Function that generates library path for shared built iocs
 
-        Parameters
-        ----------
-        action : IOCAction
-            ioc action for which we are generating lib path.
+    def mkdir(self, path):
+        os.mkdir(path)
 
-        Returns
-        -------
-        lib_path : str
-            Library path set in form of str
-        """
 
-        lib_path_str = ''
-        if platform == "win32":
-            delimeter = ';'
-            closer = '%PATH%"'
-            arch='windows-x64-static'
-            
-        else:
-            arch = 'linux-x86_64'
-            delimeter = ':'
-            closer = '$LD_LIBRARY_PATH'
+    def makedirs(self, path, exist_ok=False):
+        os.makedirs(path, exist_ok=exist_ok)
 
-        if platform == "win32":
-            lib_path_str = lib_path_str + 'SET "PATH='
-        else:
-            lib_path_str = lib_path_str + 'export LD_LIBRARY_PATH='
 
-        lib_path_str = lib_path_str + self.get_lib_path_for_module(self.base_path, arch, delimeter)
+    def rename(self, source, path):
+        os.rename(source, path)
 
-        if os.path.exists(self.support_path) and os.path.isdir(self.support_path):
-            for dir in os.listdir(self.support_path):
-                mod_path = initIOC_path_join(self.support_path, dir)
-                if os.path.isdir(mod_path) and dir != "base" and dir != "areaDetector":
-                    lib_path_str = lib_path_str + self.get_lib_path_for_module(mod_path, arch, delimeter)
 
-        if os.path.exists(self.areaDetector_path) and os.path.isdir(self.areaDetector_path):
-            for dir in os.listdir(self.areaDetector_path):
-                mod_path = initIOC_path_join(self.areaDetector_path, dir)
-                if os.path.isdir(mod_path) and (dir == 'ADCore' or dir == 'ADSupport' or dir in ad_plugins or dir == action.ioc_type):
-                    lib_path_str = lib_path_str + self.get_lib_path_for_module(mod_path, arch, delimeter)
+    def remove(self, path):
+        os.remove(path)
 
-        lib_path_str = lib_path_str + closer
-        return lib_path_str
-    
 
-    def initialize_ioc_directory(self):
-        """Function used to create a new IOC directory if it does not already exist
-        """
+    def rmdir(self, path):
+        os.rmdir(path)
 
-        if not os.path.exists(os.path.dirname(self.ioc_top)):
-            initIOC_print('ERROR - IOC top directory {} could not be created'.format(self.ioc_top))
-        else:
-            if os.path.exists(self.ioc_top):
-                initIOC_print('IOC top directory already exists.\n')
-            else:
-                try:
-                    initIOC_print('Creating IOC directory at {}.\n'.format(self.ioc_top))
-                    os.mkdir(self.ioc_top)
-                except PermissionError:
-                    initIOC_print('ERROR - You do not have permissions to write to specified directory!')
-                    return False
-            self.ioc_top_created = True
 
-        return True
+    def rmtree(self, path, ignore_errors=False):
+        shutil.rmtree(path, ignore_errors=ignore_errors)
 
 
-    def initialize_st_base_file(self, ioc_path, lib_path, executable_path):
-        """Function responsible for handling executable path injection, and base file creation
-        """
+    def sync(self, path):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
-        exec_written    = False
-        if platform == 'win32':
-            # On windows, no shebangs, so st.cmd will always run executable followed by st_base.cmd
-            st_exe = open(initIOC_path_join(ioc_path, 'st.cmd'), 'w+')
-            st_exe.write('@echo OFF\n\n{}\n\n{} st_base.cmd\n'.format(lib_path, executable_path))
-            st_exe.close()
-            st = open(initIOC_path_join(ioc_path, "st_base.cmd"), "w+")
-            exec_written = True
 
-        elif len(executable_path) > KERNEL_PATH_LIMIT or self.set_lib_path:
-            if len(executable_path) > KERNEL_PATH_LIMIT:
-                # The path length limit for shebangs (#!/) on linux is usually kernel based and set to 127
-                initIOC_print('WARNING - Path to executable exceeds legal bash shebang limit, splitting into st.cmd and st_base.cmd')
-            else:
-                # If we want to set LD_LIBRARY_PATH we do that here.
-                initIOC_print('Appending library path to start of st.cmd...')
-            st_exe = open(initIOC_path_join(ioc_path, 'st.cmd'), 'w+')
-            st_exe.write('#!/bin/bash\n\n{}\n\n{} st_base.cmd\n'.format(lib_path, executable_path))
-            st_exe.close()
-            st = open(initIOC_path_join(ioc_path, "st_base.cmd"), "w+")
-            exec_written = True
-        else:
-            st = open(initIOC_path_join(ioc_path, "st.cmd"), "w+")
+class MemoryNode:
+    """Class representing a file, directory or link in a MemoryFileSystem
+    """
 
-        return st, exec_written
+    __slots__ = ('kind', 'data', 'mode', 'mtime')
 
+    def __init__(self, kind, data, mode, mtime):
+        self.kind   = kind
+        self.data   = data
+        self.mode   = mode
+        self.mtime  = mtime
 
-    def genertate_st_cmd(self, action, executable_path, st_base_path):
 
-        initIOC_print('Generating st.cmd using base file:\n{}'.format(st_base_path))
-        ioc_path        = initIOC_path_join(self.ioc_top, action.ioc_name)
+class MemoryFileSystem:
+    """Filesystem backend that keeps all files in memory, with the same interface as LocalFileSystem.
 
-        lib_path        = ''
-        if self.set_lib_path:
-            lib_path  = self.get_lib_path_str(action)
-        
-        # Create base st.cmd, add call to executable
-        st, exec_written = self.initialize_st_base_file(ioc_path, lib_path, executable_path)
+    Used to generate IOCs without touching the disk, ex. to test or benchmark generating thousands
+    of IOCs, separately from the cost of disk access. A bundle is preloaded with load_tree(). Paths are
+    POSIX style, and relative paths are relative to the root directory.
 
-        # If the executable will be in the base file, write the shebang
-        if not exec_written:
-            st.write('#!{}\n\n'.format(executable_path))
+    Attributes
+    ----------
+    nodes : dict of str -> MemoryNode
+        node at each normalized absolute path. Directory nodes hold a dict of their entry names, in
+        creation order, file nodes their contents as bytes, and link nodes their target
+    clock : int
+        modification counter, used as the modification time of changed nodes
+    """
 
-        # Define envPaths
-        st.write('< envPaths\n\n')
+    on_disk = False
 
-        # Open existing st.cmd base file
-        st_base_fp = open(st_base_path, 'r')
 
-        # Read through the lines, add a 'unique.cmd' call after all env sets, and add envSet calls to action environment
-        lines = st_base_fp.readlines()
-        wrote_unique = False
-        for line in lines:
-            if line.startswith('#!') or 'unique.cmd' in line or 'envPaths' in line:
-                pass
-            elif line.startswith('#'):
-                st.write(line)
-            elif 'Config(' in line and not wrote_unique:
-                st.write('\n< unique.cmd\n\n')
-                st.write(line)
-                wrote_unique = True
-            elif line.startswith('epicsEnvSet'):
-                action.add_to_environment(line)
-                st.write(line)
-            else:
-                st.write(line)
+    def __init__(self):
+        self.clock  = 0
+        self.nodes  = {'/' : MemoryNode('dir', {}, 0o755, 0)}
+        self.lock   = threading.RLock()
 
-        st_base_fp.close()
-        st.close()
 
-        # Collect environment variables set in any other files
-        self.grab_additional_env(action, st_base_path)
-        # Make st.cmd executable.
-        os.chmod(initIOC_path_join(ioc_path, "st.cmd"), 0o755)
+    def normalize(self, path):
+        return posixpath.normpath(posixpath.join('/', path.replace('\\', '/')))
 
-    
-    def grab_additional_env(self, action, st_base_path):
-        """Function that collects any additional environment variables for IOC
+
+    def resolve(self, path, follow_last=True):
+        """Returns the normalized path of a node with links followed, and the node, which is None if it does not exist
         """
 
-        iocBoot_dir = os.path.dirname(st_base_path)
-        st_file = os.path.basename(st_base_path)
+        parts = [part for part in self.normalize(path).split('/') if part != '']
+        current = '/'
+        followed = 0
+        i = 0
+        while i < len(parts):
+            candidate = posixpath.join(current, parts[i])
+            node = self.nodes.get(candidate)
+            last = i == len(parts) - 1
+            if node is not None and node.kind == 'link' and (follow_last or not last):
+                followed = followed + 1
+                if followed > max_link_depth:
+                    raise OSError('Too many levels of symbolic links: {}'.format(path))
+                # Continue from the link target with the remaining components
+                target = self.normalize(posixpath.join(current, node.data))
+                parts = [part for part in target.split('/') if part != ''] + parts[i + 1:]
+                current = '/'
+                i = 0
+                continue
+            if node is None or (not last and node.kind != 'dir'):
+                return posixpath.join(candidate, *parts[i + 1:]), None
+            current = candidate
+            i = i + 1
+        return current, self.nodes[current]
+
+
+    def get_node(self, path, kind=None, follow_last=True):
+        path, node = self.resolve(path, follow_last)
+        if node is None:
+            raise FileNotFoundError('No such file or directory: {}'.format(path))
+        if kind == 'dir' and node.kind != 'dir':
+            raise NotADirectoryError('Not a directory: {}'.format(path))
+        if kind == 'file' and node.kind == 'dir':
+            raise IsADirectoryError('Is a directory: {}'.format(path))
+        return path, node
+
+
+    def add_node(self, path, node, replace=False):
+        """Adds a node to its parent directory, replacing an existing file or link if replace is set
+        """
 
-        for file in os.listdir(iocBoot_dir):
-            # For any file that isnt the base file, add environment variables.
-            if file.startswith('st') and file.endswith('.cmd') and file != st_file:
-                fp = open(os.path.join(iocBoot_dir, file), 'r')
-                lines = fp.readlines()
-                for line in lines:
-                    if line.startswith('epicsEnvSet'):
-                        action.add_to_environment(line)
-                fp.close()
+        path, existing = self.resolve(path, follow_last=False)
+        parent, name = posixpath.split(path)
+        _, parent_node = self.get_node(parent, 'dir')
+        if existing is not None and (not replace or existing.kind == 'dir'):
+            raise FileExistsError('File exists: {}'.format(path))
+        self.clock = self.clock + 1
+        node.mtime = self.clock
+        parent_node.data[name] = None
+        parent_node.mtime = self.clock
+        self.nodes[path] = node
+        return path
+
+
+    def drop_node(self, path):
+        parent, name = posixpath.split(path)
+        self.clock = self.clock + 1
+        del self.nodes[path]
+        del self.nodes[parent].data[name]
+        self.nodes[parent].mtime = self.clock
+
+
+    def get_subtree(self, path, node):
+        """Returns the path and node of everything below a node, walking the entries of each directory, so that
+        moving or removing a directory does not depend on the number of nodes outside of it
+        """
 
+        subtree = []
+        pending = [(path, node)]
+        while len(pending) > 0:
+            dir_path, dir_node = pending.pop()
+            if dir_node.kind != 'dir':
+                continue
+            for name in dir_node.data:
+                child_path = posixpath.join(dir_path, name)
+                child = self.nodes[child_path]
+                subtree.append((child_path, child))
+                pending.append((child_path, child))
+        return subtree
 
-    def generate_unique_cmd(self, action):
 
-        initIOC_print('Generating unique.cmd from detected environment...')
-        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
-        unique_fp = open(initIOC_path_join(ioc_path, 'unique.cmd'), 'w')
+    def exists(self, path):
+        with self.lock:
+            return self.resolve(path)[1] is not None
 
-        unique_fp.write('#############################################\n')
-        unique_fp.write('# initIOC Auto-Generated Unique File        #\n')
-        unique_fp.write('# Generated: {:<31}#\n'.format(str(datetime.datetime.now())))
-        if 'ENGINEER' in action.epics_environment.keys():
-            unique_fp.write('# Deploying Engineer: {:<22}#\n'.format(action.epics_environment['ENGINEER']))
-        unique_fp.write('#############################################\n\n\n')
 
-        unique_fp.write(self.deployment_info(action)+'\n\n')
+    def lexists(self, path):
+        with self.lock:
+            return self.resolve(path, follow_last=False)[1] is not None
 
-        for env_var in action.epics_environment.keys():
-            if env_var in existing_connection_parameter.keys():
-                unique_fp.write('epicsEnvSet("{}",{}"{}"'.format(env_var, ' ' * (32 - len(env_var)), action.connection))
-            else:
-                unique_fp.write('epicsEnvSet("{}",{}"{}")\n'.format(env_var, ' ' * (32 - len(env_var)), action.epics_environment[env_var]))
 
-        unique_fp.close()
+    def isdir(self, path):
+        with self.lock:
+            node = self.resolve(path)[1]
+            return node is not None and node.kind == 'dir'
 
 
-    def get_env_paths_name(self, module):
+    def islink(self, path):
+        with self.lock:
+            node = self.resolve(path, follow_last=False)[1]
+            return node is not None and node.kind == 'link'
 
-        if module == 'seq':
-            return 'SNCSEQ'
-        elif module == 'iocStats':
-            return 'DEVIOCSTATS'
-        elif module == 'areaDetector':
-            return 'AREA_DETECTOR'
-        else:
-            return module.upper()
 
+    def readlink(self, path):
+        with self.lock:
+            _, node = self.get_node(path, follow_last=False)
+            if node.kind != 'link':
+                raise OSError('Not a link: {}'.format(path))
+            return node.data
 
-    def generate_env_paths(self, ioc_top_path, ioc_boot_path, target, action):
 
-        if not self.use_links:
+    def get_mtime(self, path):
+        with self.lock:
+            return self.get_node(path)[1].mtime
 
-            initIOC_print('Generating envPaths based on discovered compiled binaries...')
-            ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
-            envPaths_fp = open(initIOC_path_join(ioc_path, 'envPaths'), 'w')
 
-            arch='linux-x86_64'
-            if platform == 'win32':
-                arch = 'windows-x64-static'
+    def getsize(self, path):
+        with self.lock:
+            _, node = self.get_node(path, 'file')
+            return len(node.data)
 
-            envPaths_fp.write('# Path propagated to remaining envPaths (binary bundle location)\nepicsEnvSet("BINARY_TOP", "{}")\n\n'.format(self.binary_location))
-            envPaths_fp.write('epicsEnvSet("ARCH", "{}")\n'.format(arch))
-            envPaths_fp.write('epicsEnvSet("TOP", "{}")\n'.format(ioc_top_path))
 
-            base_path = initIOC_path_join('$(BINARY_TOP)', 'base')
-            envPaths_fp.write('epicsEnvSet("EPICS_BASE",{}"{}")\n'.format((' ' * 14), base_path))
+    def scandir(self, path):
+        with self.lock:
+            path, node = self.get_node(path, 'dir')
+            entries = []
+            for name in node.data:
+                entry = self.resolve(posixpath.join(path, name))[1]
+                entries.append((name, entry is not None and entry.kind == 'dir', entry is not None and entry.kind == 'file'))
+            return entries
 
-            support_path = "$(BINARY_TOP)"
-            if not self.binaries_flat:
-                support_path = initIOC_path_join(support_path, "support")
 
-            envPaths_fp.write('epicsEnvSet("SUPPORT",{}"{}")\n\n'.format((' ' * 17), support_path))
+    def read_bytes(self, path):
+        with self.lock:
+            return self.get_node(path, 'file')[1].data
 
-            for dir in os.listdir(self.support_path):
-                mod_path = initIOC_path_join(self.support_path, dir)
-                if os.path.isdir(mod_path) and dir not in ['base', 'configure', 'utils', 'documentation', '.git', 'lib', 'bin']:
-                    mod_path = initIOC_path_join('$(SUPPORT)', dir)
-                    envPaths_fp.write('epicsEnvSet("{}",{}"{}")\n'.format(self.get_env_paths_name(dir), ' ' * (24 - len(self.get_env_paths_name(dir))), mod_path))
 
-            envPaths_fp.write('\n')
+    def read_text(self, path):
+        return self.read_bytes(path).decode()
 
-            for dir in os.listdir(self.areaDetector_path):
-                mod_path = initIOC_path_join(self.areaDetector_path, dir)
-                if os.path.isdir(mod_path) and dir not in ['configure', 'docs', 'documentation', 'ci', '.git', '']:
-                    mod_path = initIOC_path_join('$(AREA_DETECTOR)', dir)
-                    envPaths_fp.write('epicsEnvSet("{}",{}"{}")\n'.format(self.get_env_paths_name(dir), ' ' * (24 - len(self.get_env_paths_name(dir))), mod_path))
 
-            envPaths_fp.close()
-        
-        else:
-            os.symlink(initIOC_path_join(ioc_boot_path, 'envPaths'), initIOC_path_join(target, 'envPaths'))
+    def read_lines(self, path):
+        return self.read_text(path).splitlines(True)
 
 
-    def process_action(self, action):
+    def open_binary(self, path):
+        return io.BytesIO(self.read_bytes(path))
 
-        if not self.ioc_top_created:
-            ret = self.initialize_ioc_directory()
-            if not ret:
-                return
 
-        initIOC_print("-------------------------------------------")
-        initIOC_print("Setup process for IOC " + action.ioc_name)
-        initIOC_print("-------------------------------------------")
+    def write_bytes(self, path, data, mode=0o644):
+        with self.lock:
+            _, existing = self.resolve(path)
+            if existing is not None and existing.kind == 'file':
+                # Writing through a link, or into an existing file, keeps its mode
+                mode = existing.mode
+            self.add_node(self.resolve(path)[0], MemoryNode('file', data, mode, 0), replace=True)
 
-        from_template = self.use_template
-        ioc_top_path, executable_path, iocBoot_path = self.find_paths_for_action(action.ioc_type)
-        
-        if executable_path is None:
-            initIOC_print('ERROR - Could not find binary for {}, skipping...'.format(action.ioc_type))
-            initIOC_print('Make sure binary for {} exists at binary path:\n{}'.format(action.ioc_type, self.binary_location))
-            return
-        elif ioc_top_path is None or iocBoot_path is None:
-            if not from_template:
-                initIOC_print('WARNING - Could not find ioc top and iocBoot folder, defaulting to use template.')
-            from_template = True
-        
-        if os.path.exists(initIOC_path_join(self.ioc_top, action.ioc_name)):
-            initIOC_print('ERROR - IOC with name {} already exists in {}.'.format(action.ioc_name, self.ioc_top))
-            return
 
-        if not from_template:
-            self.create_ioc_from_bundle(action, ioc_top_path, executable_path, iocBoot_path)
-        else:
-            self.create_ioc_from_template(action, executable_path)
+    def write_text(self, path, text):
+        self.write_bytes(path, text.encode())
 
-        self.create_config_file(action)
-        #self.make_ignore_files(action) TODO
-        initIOC_print('Done.\n')
 
+    def copyfile(self, source, path):
+        self.write_bytes(path, self.read_bytes(source))
 
-    def create_config_file(self, action):
 
-        initIOC_print('Generating config file for use with procServ...')
-        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
-        config_fp = open(initIOC_path_join(ioc_path, 'config'), 'w')
-        config_fp.write('NAME={}\nPORT={}\nUSER=softioc\nHOST={}\n'.format(action.ioc_name, action.ioc_port, action.epics_environment['HOSTNAME']))
-        config_fp.close()
+    def symlink(self, source, path):
+        with self.lock:
+            self.add_node(path, MemoryNode('link', source, 0o777, 0))
 
 
-    def create_ioc_from_bundle(self, action, ioc_top_path, executable_path, iocBoot_path):
+    def chmod(self, path, mode):
+        with self.lock:
+            self.get_node(path)[1].mode = mode
 
-        initIOC_print('Generating IOC from detected bundle located at: {}'.format(self.binary_location))
-        time.sleep(0.3)
-        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
-        os.mkdir(ioc_path)
-        os.mkdir(initIOC_path_join(ioc_path, 'autosave'))
 
-        current_base_len = 0
-        current_base = None
-        for file in os.listdir(iocBoot_path):
-            next = initIOC_path_join(iocBoot_path, file)
-            if os.path.isfile(next) and file.startswith('st'):
-                fp = open(next, 'r')
-                lines = fp.readlines()
-                fp.close()
-                if len(lines) > current_base_len:
-                    current_base = next
-                    current_base_len = len(lines)
+    def mkdir(self, path):
+        with self.lock:
+            self.add_node(path, MemoryNode('dir', {}, 0o755, 0))
 
-        if current_base is None:
-            initIOC_print('ERROR - Could not fine suitable st_base file. Aborting...')
-            return
 
-        self.genertate_st_cmd(action, executable_path, current_base)
-        self.generate_unique_cmd(action)
-        self.generate_env_paths(ioc_top_path, iocBoot_path, ioc_path, action)
-        self.grab_dependencies_from_bundle(ioc_path, iocBoot_path)
+    def makedirs(self, path, exist_ok=False):
+        with self.lock:
+            path = self.normalize(path)
+            if self.isdir(path):
+                if not exist_ok:
+                    raise FileExistsError('File exists: {}'.format(path))
+                return
+            parent = posixpath.dirname(path)
+            if not self.isdir(parent):
+                self.makedirs(parent, exist_ok=True)
+            self.mkdir(path)
+
+
+    def rename(self, source, path):
+        with self.lock:
+            source, node = self.get_node(source, follow_last=False)
+            path, existing = self.resolve(path, follow_last=False)
+            # Like os.rename, renaming a node onto itself leaves it in place
+            if path == source:
+                return
+            if existing is not None:
+                if existing.kind == 'dir' and (node.kind != 'dir' or len(existing.data) > 0):
+                    raise OSError('Cannot replace directory: {}'.format(path))
+                self.drop_node(path)
+            moved = self.get_subtree(source, node)
+            self.drop_node(source)
+            for name, moved_node in moved:
+                del self.nodes[name]
+            self.add_node(path, node)
+            for name, moved_node in moved:
+                self.nodes[path + name[len(source):]] = moved_node
+
+
+    def remove(self, path):
+        with self.lock:
+            path, node = self.get_node(path, follow_last=False)
+            if node.kind == 'dir':
+                raise IsADirectoryError('Is a directory: {}'.format(path))
+            self.drop_node(path)
+
+
+    def rmdir(self, path):
+        with self.lock:
+            path, node = self.get_node(path, 'dir', follow_last=False)
+            if len(node.data) > 0:
+                raise OSError('Directory not empty: {}'.format(path))
+            self.drop_node(path)
+
+
+    def rmtree(self, path, ignore_errors=False):
+        with self.lock:
+            try:
+                path, node = self.get_node(path, 'dir', follow_last=False)
+            except OSError:
+                if ignore_errors:
+                    return
+                raise
+            for name, _ in self.get_subtree(path, node):
+                del self.nodes[name]
+            node.data.clear()
+            self.drop_node(path)
 
-    
-    def grab_dependencies_from_bundle(self, ioc_path, iocBoot_path):
 
-        initIOC_print('Collecting additional iocBoot files from bundle...')
-        for file in os.listdir(iocBoot_path):
-            target = initIOC_path_join(iocBoot_path, file)
-            if os.path.isfile(target):
-                if file == 'auto_settings.req':
-                    if not self.use_links:
-                        shutil.copyfile(target, initIOC_path_join(ioc_path, file))
-                    else:
-                        os.symlink(target, initIOC_path_join(ioc_path, file))
-                elif self.with_deps and not file.startswith(('Makefile', 'st', 'test', 'READ', 'dll', 'envPaths')):
-                    shutil.copyfile(target, initIOC_path_join(ioc_path, file))
+    def sync(self, path):
+        pass
 
 
-    def create_ioc_from_template(self, action, executable_path):
+    def load_tree(self, source, path=None):
+        """Copies a directory tree from the real filesystem into memory, keeping links as links
 
-        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+        Parameters
+        ----------
+        source : str
+            directory to copy, ex. a bundle
+        path : str
+            location of the copy in memory, defaults to the same path as source
+        """
+
+        if path is None:
+            path = source
+        self.makedirs(path, exist_ok=True)
+        with os.scandir(source) as it:
+            entries = sorted(it, key=lambda entry : entry.name)
+        for entry in entries:
+            target = posixpath.join(path, entry.name)
+            if entry.is_symlink():
+                self.symlink(os.readlink(entry.path), target)
+            elif entry.is_dir():
+                self.load_tree(entry.path, target)
+            else:
+                with open(entry.path, 'rb') as fp:
+                    self.write_bytes(target, fp.read(), stat.S_IMODE(entry.stat().st_mode))
+
+
+    def dump_tree(self, path, target):
+        """Copies a directory tree from memory onto the real filesystem, ex. to inspect generated IOCs
+        """
+
+        os.makedirs(target, exist_ok=True)
+        for name, is_dir, _ in self.scandir(path):
+            source = posixpath.join(path, name)
+            if self.islink(source):
+                os.symlink(self.readlink(source), os.path.join(target, name))
+            elif is_dir:
+                self.dump_tree(source, os.path.join(target, name))
+            else:
+                with open(os.path.join(target, name), 'wb') as fp:
+                    fp.write(self.read_bytes(source))
+
+
+class LatencyFileSystem:
+    """Filesystem backend that delays each operation of another backend, to benchmark as if on a network filesystem.
+
+    Every call is one round trip of its kind of operation, one of filesystem_operations. At most
+    max_concurrent round trips are in flight at once, further calls wait for one to complete.
+
+    Attributes
+    ----------
+    filesystem : LocalFileSystem or MemoryFileSystem
+        backend that performs the operations
+    latencies : dict of str -> float
+        seconds each kind of operation is delayed by, kinds that are missing are not delayed
+    max_concurrent : int
+        maximum number of operations delayed at once, None for no limit
+    """
+
+    def __init__(self, filesystem=None, latencies=None, max_concurrent=None):
+        if filesystem is None:
+            filesystem = local_filesystem
+        if latencies is None:
+            latencies = nfs_latencies
+        self.filesystem     = filesystem
+        self.on_disk        = filesystem.on_disk
+        self.latencies      = dict(latencies)
+        self.max_concurrent = max_concurrent
+        self.slots          = None
+        if max_concurrent is not None:
+            self.slots = threading.BoundedSemaphore(max_concurrent)
+        self.lock           = threading.Lock()
+        self.stats          = {operation : {'operations' : 0, 'latency' : 0.0, 'wait' : 0.0} for operation in filesystem_operations}
+
+
+    def delay(self, operation):
+        """Waits for a free slot, then for the latency of operation, and records both
+        """
+
+        latency = self.latencies.get(operation, 0)
+        start = time.monotonic()
+        if self.slots is not None:
+            with self.slots:
+                wait = time.monotonic() - start
+                time.sleep(latency)
+        else:
+            wait = 0.0
+            time.sleep(latency)
+        with self.lock:
+            stats = self.stats[operation]
+            stats['operations'] = stats['operations'] + 1
+            stats['latency'] = stats['latency'] + latency
+            stats['wait'] = stats['wait'] + wait
+
+
+    def get_stats(self):
+        """Gets the operations performed so far
+
+        Returns
+        -------
+        stats : dict of str -> dict
+            number of operations, seconds of latency added, and seconds spent waiting for a free slot,
+            for each kind of operation
+        """
+
+        with self.lock:
+            return {operation : dict(stats) for operation, stats in self.stats.items()}
+
+
+    def exists(self, path):
+        self.delay('stat')
+        return self.filesystem.exists(path)
+
+
+    def lexists(self, path):
+        self.delay('stat')
+        return self.filesystem.lexists(path)
+
+
+    def isdir(self, path):
+        self.delay('stat')
+        return self.filesystem.isdir(path)
+
+
+    def islink(self, path):
+        self.delay('stat')
+        return self.filesystem.islink(path)
+
+
+    def readlink(self, path):
+        self.delay('stat')
+        return self.filesystem.readlink(path)
+
+
+    def get_mtime(self, path):
+        self.delay('stat')
+        return self.filesystem.get_mtime(path)
+
+
+    def getsize(self, path):
+        self.delay('stat')
+        return self.filesystem.getsize(path)
+
+
+    def scandir(self, path):
+        self.delay('listdir')
+        return self.filesystem.scandir(path)
+
+
+    def read_text(self, path):
+        self.delay('open')
+        return self.filesystem.read_text(path)
+
+
+    def read_lines(self, path):
+        self.delay('open')
+        return self.filesystem.read_lines(path)
+
+
+    def open_binary(self, path):
+        self.delay('open')
+        return self.filesystem.open_binary(path)
+
+
+    def write_text(self, path, text):
+        self.delay('open')
+        self.filesystem.write_text(path, text)
+
+
+    def copyfile(self, source, path):
+        # Opens both the source and the copy
+        self.delay('open')
+        self.delay('open')
+        self.filesystem.copyfile(source, path)
+
+
+    def symlink(self, source, path):
+        self.delay('modify')
+        self.filesystem.symlink(source, path)
+
+
+    def chmod(self, path, mode):
+        self.delay('modify')
+        self.filesystem.chmod(path, mode)
+
+
+    def mkdir(self, path):
+        self.delay('modify')
+        self.filesystem.mkdir(path)
+
+
+    def makedirs(self, path, exist_ok=False):
+        self.delay('modify')
+        self.filesystem.makedirs(path, exist_ok=exist_ok)
+
+
+    def rename(self, source, path):
+        self.delay('modify')
+        self.filesystem.rename(source, path)
+
+
+    def remove(self, path):
+        self.delay('modify')
+        self.filesystem.remove(path)
+
+
+    def rmdir(self, path):
+        self.delay('modify')
+        self.filesystem.rmdir(path)
+
+
+    def rmtree(self, path, ignore_errors=False):
+        self.delay('modify')
+        self.filesystem.rmtree(path, ignore_errors=ignore_errors)
+
+
+    def sync(self, path):
+        self.delay('sync')
+        self.filesystem.sync(path)
+
+
+def parse_latency_spec(spec):
+    """Parses the per operation latencies given with --simulate-latency
+
+    Parameters
+    ----------
+    spec : str
+        'nfs' for nfs_latencies, or comma separated operation=milliseconds pairs, ex. stat=0.5,open=2
+
+    Returns
+    -------
+    latencies : dict of str -> float
+        seconds each kind of operation is delayed by
+
+    Raises
+    ------
+    ValueError
+        if an operation is unknown or a latency is not a finite, non-negative number
+    """
+
+    if spec == 'nfs':
+        return dict(nfs_latencies)
+    latencies = {}
+    for pair in spec.split(','):
+        operation, _, milliseconds = pair.partition('=')
+        operation = operation.strip()
+        if operation not in filesystem_operations:
+            raise ValueError('Unknown filesystem operation {}, expected one of {}'.format(operation, ', '.join(filesystem_operations)))
+        latency = float(milliseconds)
+        if not math.isfinite(latency) or latency < 0:
+            raise ValueError('Latency of {} must be a finite, non-negative number'.format(operation))
+        latencies[operation] = latency / 1000
+    return latencies
+
+
+# Backend used when none is given
+local_filesystem = LocalFileSystem()
+
+
+#-------------------------------------------------
+#------------ INTERNAL DATA MODEL CLASS ----------
+#-------------------------------------------------
+
+
+def initIOC_path_join(path_A, path_B):
+    """Function that joins two paths.
+
+    All paths use / instead of \\ for simplicity.
+    """
+
+    output_path = path_A
+    if not path_A.endswith('/'):
+        output_path = output_path + '/'
+    if path_B.startswith('/'):
+        output_path = output_path + path_B[1:]
+    else:
+        output_path = output_path + path_B
+
+    if output_path.endswith('/'):
+        output_path = output_path[:-1]
+
+    return output_path
+
+
+def initIOC_path_is_under(path, parent):
+    """Function that checks if a path is a directory or inside of it.
+
+    Paths built with initIOC_path_join use /, while paths from the OS use its own separator, so both are accepted.
+    """
+
+    parent = parent.rstrip('/' + os.sep)
+    return path == parent or path.startswith(parent + '/') or path.startswith(parent + os.sep)
+
+
+def get_staging_path(ioc_path):
+    """Returns the directory the files of an IOC are written into before it is moved into place
+    """
+
+    return initIOC_path_join(initIOC_path_join(os.path.dirname(ioc_path), staging_dir_name), os.path.basename(ioc_path))
+
+
+class DiskFile(io.StringIO):
+    """In memory text file that is written to disk by a DiskOutput once it is closed
+    """
+
+    def __init__(self, output, path):
+        super().__init__()
+        self.output = output
+        self.path = path
+
+
+    def close(self):
+        if not self.closed:
+            self.output.write_file(self.path, self.getvalue())
+        super().close()
+
+
+class DiskOutput:
+    """Output target that writes generated IOC files into the filesystem.
+
+    Files of an IOC are written into a staging directory after begin() is called, and the complete
+    IOC is moved into place with a single rename by finish(). An interrupted run or a full disk
+    therefore never leaves a partially written IOC, or a truncated st.cmd, at the final location.
+
+    Attributes
+    ----------
+    fsync_policy : str
+        'none' to leave flushing to the OS, 'per-ioc' to sync all files of an IOC before it is moved
+        into place, or 'per-file' to sync each file as soon as it is written
+    staged : tuple of str
+        final and staging path of the IOC currently being written, None if not staging
+    unsynced : list of str
+        files written since the last sync, with the 'per-ioc' policy
+    written_files : list of (str, int)
+        final path and size of each file written since the last call to take_written()
+    filesystem : LocalFileSystem or MemoryFileSystem
+        backend the files are written into
+    """
+
+    on_disk = True
+
+
+    def __init__(self, fsync_policy='none', filesystem=None):
+        if fsync_policy not in fsync_policies:
+            raise ValueError('Unknown fsync policy {}, expected one of {}'.format(fsync_policy, ', '.join(fsync_policies)))
+        if filesystem is None:
+            filesystem = local_filesystem
+        self.filesystem     = filesystem
+        self.fsync_policy   = fsync_policy
+        self.staged         = None
+        self.unsynced       = []
+        self.written_files  = []
+
+
+    def get_path(self, path):
+        """Redirects paths inside the IOC being staged into its staging directory
+        """
+
+        if self.staged is not None:
+            ioc_path, staging_path = self.staged
+            if initIOC_path_is_under(path, ioc_path):
+                return staging_path + path[len(ioc_path):]
+        return path
+
+
+    def get_final_path(self, path):
+        """Maps a path inside the staging directory back to the location it is moved to
+        """
+
+        if self.staged is not None:
+            ioc_path, staging_path = self.staged
+            if initIOC_path_is_under(path, staging_path):
+                return ioc_path + path[len(staging_path):]
+        return path
+
+
+    def begin(self, ioc_path):
+        """Starts staging the files of the IOC at ioc_path, discarding any left over by an earlier run
+        """
+
+        staging_path = get_staging_path(ioc_path)
+        if self.filesystem.lexists(staging_path):
+            self.filesystem.rmtree(staging_path)
+        self.staged = (ioc_path, staging_path)
+
+
+    def make_staging_dir(self, staging_path):
+        """Creates the staging directory of an IOC.
+
+        Other runs generating into the same IOC top directory remove the shared staging directory
+        as soon as it is empty, so it is created again if it disappears in between.
+        """
+
+        attempts = 0
+        while True:
+            try:
+                # makedirs also fails if the directory is removed just after it finds it exists
+                self.filesystem.makedirs(os.path.dirname(staging_path), exist_ok=True)
+                self.filesystem.mkdir(staging_path)
+                return
+            except (FileNotFoundError, FileExistsError):
+                attempts = attempts + 1
+                if attempts == 10:
+                    raise
+
+
+    def sync(self, path):
+        self.filesystem.sync(path)
+
+
+    def sync_dir(self, path):
+        # Directories cannot be opened for syncing on windows
+        if platform != 'win32':
+            self.sync(path)
+
+
+    def record_written(self, path):
+        self.written_files.append((self.get_final_path(path), self.filesystem.getsize(path)))
+        if self.fsync_policy == 'per-file':
+            self.sync(path)
+        elif self.fsync_policy == 'per-ioc':
+            self.unsynced.append(path)
+
+
+    def exists(self, path):
+        return self.filesystem.exists(self.get_path(path))
+
+
+    def mkdir(self, path):
+        path = self.get_path(path)
+        if self.staged is not None and path == self.staged[1]:
+            self.make_staging_dir(path)
+        else:
+            self.filesystem.mkdir(path)
+
+
+    def open(self, path):
+        """Opens a file for writing text. The file is written to disk once it is closed
+        """
+
+        return DiskFile(self, self.get_path(path))
+
+
+    def write_file(self, path, text):
+        self.filesystem.write_text(path, text)
+        self.record_written(path)
+
+
+    def copyfile(self, source, path):
+        path = self.get_path(path)
+        self.filesystem.copyfile(source, path)
+        self.record_written(path)
+
+
+    def symlink(self, source, path):
+        self.filesystem.symlink(source, self.get_path(path))
+        self.written_files.append((path, 0))
+
+
+    def record_tree(self, path):
+        """Records every file under a directory that was written without this output, ex. an IOC cloned from ioc-template
+
+        Earlier records of files under the directory are replaced, so that each file is only counted once.
+        """
+
+        self.written_files = [(file_path, size) for file_path, size in self.written_files if not initIOC_path_is_under(file_path, path)]
+        pending = [path]
+        while len(pending) > 0:
+            dir_path = pending.pop()
+            for name, is_dir, _ in sorted(self.filesystem.scandir(dir_path)):
+                file_path = initIOC_path_join(dir_path, name)
+                if self.filesystem.islink(file_path):
+                    self.written_files.append((file_path, 0))
+                elif is_dir:
+                    pending.append(file_path)
+                else:
+                    self.written_files.append((file_path, self.filesystem.getsize(file_path)))
+
+
+    def take_written(self):
+        """Returns the final path and size of each file written since the last call, links with a size of 0
+        """
+
+        written, self.written_files = self.written_files, []
+        return written
+
+
+    def chmod(self, path, mode):
+        self.filesystem.chmod(self.get_path(path), mode)
+
+
+    def finish(self):
+        """Called once all files for an IOC have been written. Syncs them as required and moves the IOC into place
+        """
+
+        for path in self.unsynced:
+            self.sync(path)
+        self.unsynced = []
+        if self.staged is None:
+            return
+        ioc_path, staging_path = self.staged
+        self.staged = None
+        if self.fsync_policy != 'none':
+            self.sync_dir(staging_path)
+        self.filesystem.rename(staging_path, ioc_path)
+        if self.fsync_policy != 'none':
+            self.sync_dir(os.path.dirname(ioc_path))
+        self.remove_staging_dir(os.path.dirname(staging_path))
+
+
+    def remove_staging_dir(self, path):
+        """Removes the staging directory once no IOC is staged in it
+        """
+
+        try:
+            self.filesystem.rmdir(path)
+        except OSError:
+            pass
+
+
+    def discard(self):
+        """Called if generating an IOC failed, removes its staged files
+        """
+
+        self.unsynced = []
+        self.written_files = []
+        if self.staged is not None:
+            _, staging_path = self.staged
+            self.staged = None
+            self.filesystem.rmtree(staging_path, ignore_errors=True)
+            self.remove_staging_dir(os.path.dirname(staging_path))
+
+
+    def close(self):
+        pass
+
+
+class ArchiveFile(io.StringIO):
+    """In memory text file that is added to a TarArchiveOutput once it is closed
+    """
+
+    def __init__(self, output, arcname):
+        super().__init__()
+        self.output = output
+        self.arcname = arcname
+
+
+    def close(self):
+        if not self.closed:
+            self.output.add_entry(self.arcname, tarfile.REGTYPE, 0o644, data=self.getvalue().encode())
+        super().close()
+
+
+class TarArchiveOutput:
+    """Output target that streams generated IOCs into a tar archive instead of the filesystem.
+
+    Entries for an IOC are held in memory until finish() is called, so that file modes can still be
+    changed after a file is written, and are then appended to the archive stream. Copied bundle files
+    are read only when they are added to the archive. Paths are stored relative to the IOC top directory.
+
+    Attributes
+    ----------
+    archive_path : str
+        path to the output archive. Compression is selected by the .gz, .bz2, .xz or .zst extension
+    root : str
+        IOC top directory, the location the archive will be unpacked into
+    pending : dict of str -> tarfile.TarInfo, bytes or str
+        entries not yet written to the archive, keyed by archive name
+    written : set of str
+        archive names already in the archive
+    written_files : list of (str, int)
+        path and size of each file added to the archive since the last call to take_written()
+    filesystem : LocalFileSystem or MemoryFileSystem
+        backend the copied bundle files are read from. The archive itself is always written to disk
+    """
+
+    on_disk = False
+
+
+    def __init__(self, archive_path, root, filesystem=None):
+        if filesystem is None:
+            filesystem = local_filesystem
+        self.filesystem     = filesystem
+        self.archive_path   = archive_path
+        self.root           = root
+        self.pending        = {}
+        self.written        = set()
+        self.written_files  = []
+        self.compressor     = None
+
+        if archive_path.endswith('.zst'):
+            if not WITH_ZSTD:
+                raise ValueError('Python zstandard library not installed, cannot write {}'.format(archive_path))
+            self.compressor = zstandard.ZstdCompressor().stream_writer(open(archive_path, 'wb'))
+            self.tar = tarfile.open(fileobj=self.compressor, mode='w|')
+        else:
+            mode = 'w|'
+            for extensions, compression in [(('.gz', '.tgz'), 'gz'), (('.bz2',), 'bz2'), (('.xz',), 'xz')]:
+                if archive_path.endswith(extensions):
+                    mode = mode + compression
+            self.tar = tarfile.open(archive_path, mode)
+
+
+    def get_arcname(self, path):
+        return os.path.relpath(path, self.root).replace('\\', '/')
+
+
+    def add_entry(self, arcname, entry_type, mode, data=None, source=None, linkname=''):
+        """Adds an entry that will be written to the archive with the next call to finish()
+        """
+
+        info = tarfile.TarInfo(arcname)
+        info.type = entry_type
+        info.mode = mode
+        info.mtime = time.time()
+        info.linkname = linkname
+        self.pending[arcname] = (info, data, source)
+
+
+    def exists(self, path):
+        arcname = self.get_arcname(path)
+        return arcname in self.pending or arcname in self.written
+
+
+    def mkdir(self, path):
+        arcname = self.get_arcname(path)
+        if arcname != '.':
+            self.add_entry(arcname, tarfile.DIRTYPE, 0o755)
+
+
+    def open(self, path):
+        return ArchiveFile(self, self.get_arcname(path))
+
+
+    def copyfile(self, source, path):
+        self.add_entry(self.get_arcname(path), tarfile.REGTYPE, 0o644, source=source)
+
+
+    def symlink(self, source, path):
+        self.add_entry(self.get_arcname(path), tarfile.SYMTYPE, 0o777, linkname=source)
+
+
+    def chmod(self, path, mode):
+        """Sets the mode of an entry that was written through this output and not yet appended to the archive
+
+        Raises
+        ------
+        ValueError
+            if the entry is not pending, as the mode of a member already in the archive cannot change
+        """
+
+        arcname = self.get_arcname(path)
+        if arcname not in self.pending:
+            raise ValueError('Cannot change the mode of {}, it is not pending in archive {}'.format(path, self.archive_path))
+        self.pending[arcname][0].mode = mode
+
+
+    def begin(self, ioc_path):
+        pass
+
+
+    def finish(self):
+        """Appends all pending entries to the archive stream
+        """
+
+        for arcname, (info, data, source) in self.pending.items():
+            if source is not None:
+                with self.filesystem.open_binary(source) as source_fp:
+                    info.size = self.filesystem.getsize(source)
+                    self.tar.addfile(info, source_fp)
+            elif data is not None:
+                info.size = len(data)
+                self.tar.addfile(info, io.BytesIO(data))
+            else:
+                self.tar.addfile(info)
+            self.written.add(arcname)
+            if info.type != tarfile.DIRTYPE:
+                self.written_files.append((os.path.join(self.root, arcname), info.size))
+        self.pending.clear()
+
+
+    def take_written(self):
+        written, self.written_files = self.written_files, []
+        return written
+
+
+    def discard(self):
+        """Drops the entries of an IOC that could not be generated
+        """
+
+        self.pending.clear()
+
+
+    def close(self):
+        self.finish()
+        self.tar.close()
+        if self.compressor is not None:
+            self.compressor.close()
+
+
+class BundleIndex:
+    """Class that scans a binary bundle once and caches the results.
+
+    Driver paths, directory listings and startup scripts are looked up lazily, and reused for every
+    IOC generated from the bundle. A single index may be shared by several managers, ex. one per
+    IOC server. The modification time of every scanned directory is recorded, so that a long running
+    process can detect when the bundle has changed, see is_stale().
+
+    Attributes
+    ----------
+    binary_location : str
+        path to the binary bundle
+    binaries_flat : bool
+        True if the bundle has no support directory
+    base_path, support_path, areaDetector_path : str
+        paths to core modules in the bundle
+    driver_scans : dict of str -> tuple
+        ioc top path, executable path for each architecture, and iocBoot path found for each driver
+    driver_paths : dict of (str, str) -> tuple of str
+        ioc top, executable, and iocBoot paths for each driver and requested architecture
+    dir_entries : dict of str -> tuple of list of str
+        all entries, subdirectories, and files found in each scanned directory
+    file_lines : dict of str -> (int, list of str)
+        modification time and lines of each startup script read from the bundle
+    mtimes : dict of str -> int
+        modification time of each scanned directory when it was scanned, None if it did not exist
+    driver_registry : DriverRegistry
+        drivers found in the bundle, built on first use, see get_driver_registry()
+    scan_time : float
+        seconds spent listing directories and reading files of the bundle
+    cache_hits, cache_misses : int
+        number of directory listings and file reads answered from the cache, and from the bundle
+    job_counts : threading.local
+        per thread, the scan time and cache counts of the job the thread works for, see count_job()
+    filesystem : LocalFileSystem or MemoryFileSystem
+        backend the bundle is read from
+    """
+
+    def __init__(self, binary_location, filesystem=None):
+        if filesystem is None:
+            filesystem = local_filesystem
+        self.filesystem         = filesystem
+        self.binary_location    = binary_location
+        self.binaries_flat      = not filesystem.exists(initIOC_path_join(binary_location, 'support'))
+        self.base_path          = initIOC_path_join(binary_location, 'base')
+        if self.binaries_flat:
+            self.support_path   = binary_location
+        else:
+            self.support_path   = initIOC_path_join(binary_location, 'support')
+        self.areaDetector_path  = initIOC_path_join(self.support_path, 'areaDetector')
+        self.driver_scans       = {}
+        self.driver_paths       = {}
+        self.driver_registry    = None
+        self.dir_entries        = {}
+        self.file_lines         = {}
+        self.mtimes             = {}
+        self.scan_time          = 0.0
+        self.cache_hits         = 0
+        self.cache_misses       = 0
+        self.job_counts         = threading.local()
+        self.lock               = threading.RLock()
+        for path in [binary_location, self.support_path, self.areaDetector_path]:
+            self.record_mtime(path)
+
+
+    def in_bundle(self, path):
+        """Checks if a path is the bundle directory or inside of it. A sibling such as <bundle>-old is not
+        """
+
+        return initIOC_path_is_under(path, self.binary_location)
+
+
+    def record_mtime(self, path):
+        try:
+            self.mtimes[path] = self.filesystem.get_mtime(path)
+        except OSError:
+            self.mtimes[path] = None
+
+
+    def is_stale(self):
+        """Checks if any directory scanned by this index was modified since it was scanned
+
+        Returns
+        -------
+        stale : bool
+            True if the index no longer reflects the bundle
+        """
+
+        for path, mtime in list(self.mtimes.items()):
+            try:
+                if self.filesystem.get_mtime(path) != mtime:
+                    return True
+            except OSError:
+                if mtime is not None:
+                    return True
+        return False
+
+
+    def scan_dir(self, path):
+        """Lists a directory, scanning it only once if it is inside the bundle
+
+        Returns
+        -------
+        entries, dirs, files : list of str
+            names of all entries, of subdirectories, and of regular files, in listing order
+
+        Raises
+        ------
+        OSError
+            if the directory could not be listed
+        """
+
+        with self.lock:
+            if path in self.dir_entries:
+                self.add_scan_stats(hits=1)
+                return self.dir_entries[path]
+            start = time.monotonic()
+            entries, dirs, files = [], [], []
+            try:
+                mtime = self.filesystem.get_mtime(path)
+                for name, is_dir, is_file in self.filesystem.scandir(path):
+                    entries.append(name)
+                    if is_dir:
+                        dirs.append(name)
+                    elif is_file:
+                        files.append(name)
+            finally:
+                self.add_scan_stats(scan_time=time.monotonic() - start)
+            # Directories outside of the bundle, ex. a cloned ioc-template, are not kept
+            if self.in_bundle(path):
+                self.add_scan_stats(misses=1)
+                self.mtimes[path] = mtime
+                self.dir_entries[path] = (entries, dirs, files)
+            return entries, dirs, files
+
+
+    def find_driver_paths(self, ioc_type, arch=None):
+        """Finds ioc_top, executable, and iocBoot folder for driver, scanning the bundle only once per driver
+
+        Parameters
+        ----------
+        ioc_type : str
+            driver name
+        arch : str
+            build architecture of the executable, see get_default_architecture() if None
+
+        Returns
+        -------
+        ioc_top_path, executable_path, iocBoot_path : str
+            paths for the driver, all None if the driver was not found. The executable path is None
+            if the driver was not built for arch
+        """
+
+        with self.lock:
+            if (ioc_type, arch) not in self.driver_paths:
+                ioc_top_path, executables, iocBoot_path = self.get_driver_scan(ioc_type)
+                executable_path = executables.get(arch if arch is not None else self.get_default_architecture(ioc_type))
+                self.driver_paths[(ioc_type, arch)] = (ioc_top_path, executable_path, iocBoot_path)
+            return self.driver_paths[(ioc_type, arch)]
+
+
+    def get_driver_registry(self):
+        """Returns the registry of drivers in the bundle, which looks drivers up as they are used
+        """
+
+        with self.lock:
+            if self.driver_registry is None:
+                self.driver_registry = DriverRegistry(self)
+            return self.driver_registry
+
+
+    def get_driver_scan(self, ioc_type):
+        with self.lock:
+            if ioc_type not in self.driver_scans:
+                self.driver_scans[ioc_type] = self.scan_driver(ioc_type)
+            return self.driver_scans[ioc_type]
+
+
+    def get_architectures(self, ioc_type):
+        """Returns the sorted names of the architectures the executable of a driver was built for
+        """
+
+        return sorted(self.get_driver_scan(ioc_type)[1].keys())
+
+
+    def get_default_architecture(self, ioc_type):
+        """Selects the architecture used for a driver when none is requested.
+
+        The platform default is preferred, then any build other than a debug build, so that the choice
+        does not depend on the order in which the bin directory is listed.
+
+        Returns
+        -------
+        arch : str
+            architecture name, None if the driver has no executable
+        """
+
+        architectures = self.get_architectures(ioc_type)
+        if default_architecture in architectures:
+            return default_architecture
+        for arch in architectures:
+            if 'debug' not in arch:
+                return arch
+        if len(architectures) > 0:
+            return architectures[0]
+        return None
+
+
+    def scan_driver(self, ioc_type):
+        """Scans the bundle for the ioc_top, executable for each architecture, and iocBoot folder of a driver
+
+        Returns
+        -------
+        ioc_top_path : str
+            path to the IOC top directory of the driver
+        executables : dict of str -> str
+            path to the executable for each architecture directory in bin
+        iocBoot_path : str
+            path to the iocBoot directory of the driver
+        """
+
+        try:
+            driver_path = initIOC_path_join(self.areaDetector_path, ioc_type)
+
+            # identify the IOCs folder
+            for name in self.scan_dir(driver_path)[0]:
+                if "ioc" == name or "iocs" == name:
+                    driver_path = initIOC_path_join(driver_path, name)
+                    break
+
+            # identify the IOC 
+            for name in self.scan_dir(driver_path)[0]:
+                # Add check to see if NOIOC in name - occasional problems generating ADSimDetector
+                if ("IOC" in name or "ioc" in name) and "NOIOC" not in name.upper():
+                    driver_path = initIOC_path_join(driver_path, name)
+                    break
+
+            ioc_top_path = driver_path
+
+            # find the driver executable for every architecture it was built for
+            executables = {}
+            bin_path = initIOC_path_join(driver_path, "bin")
+            for arch in self.scan_dir(bin_path)[1]:
+                executable_path = initIOC_path_join(bin_path, arch)
+                # We look for the executable that ends with App
+                for name in self.scan_dir(executable_path)[0]:
+                    if 'App' in name:
+                        executable_path = initIOC_path_join(executable_path, name)
+                        break
+                executables[arch] = executable_path
+
+            iocBoot_path = initIOC_path_join(driver_path, 'iocBoot')
+            for dir in self.scan_dir(iocBoot_path)[1]:
+                if dir.startswith('ioc') and not dir.endswith('Test'):
+                    iocBoot_path = initIOC_path_join(iocBoot_path, dir)
+                    break
+            return ioc_top_path, executables, iocBoot_path
+        except:
+            return None, {}, None
+
+
+    def list_module_dirs(self, path):
+        """Returns the names of the subdirectories of a bundle directory, empty if it does not exist
+        """
+
+        try:
+            return self.scan_dir(path)[1]
+        except OSError:
+            return []
+
+
+    def list_files(self, path):
+        """Returns the names of the regular files in a bundle directory
+        """
+
+        return self.scan_dir(path)[2]
+
+
+    def read_lines(self, path):
+        """Reads the lines of a startup script, reusing them while the file is unchanged.
+
+        Only files inside the bundle are kept in memory.
+
+        Returns
+        -------
+        lines : list of str
+            lines of the file. Must not be modified, as they are shared between callers
+        """
+
+        if not self.in_bundle(path):
+            return self.filesystem.read_lines(path)
+
+        mtime = self.filesystem.get_mtime(path)
+        with self.lock:
+            cached = self.file_lines.get(path)
+            if cached is not None and cached[0] == mtime:
+                self.add_scan_stats(hits=1)
+                return cached[1]
+        start = time.monotonic()
+        lines = self.filesystem.read_lines(path)
+        with self.lock:
+            self.add_scan_stats(scan_time=time.monotonic() - start, misses=1)
+            self.file_lines[path] = (mtime, lines)
+        return lines
+
+
+    def add_scan_stats(self, scan_time=0.0, hits=0, misses=0):
+        """Adds to the scan time and cache counts of the index, and of the job counted by the calling thread if any
+        """
+
+        with self.lock:
+            self.scan_time = self.scan_time + scan_time
+            self.cache_hits = self.cache_hits + hits
+            self.cache_misses = self.cache_misses + misses
+            counts = self.get_job_counts()
+            if counts is not None:
+                counts['scan_time'] = counts['scan_time'] + scan_time
+                counts['cache_hits'] = counts['cache_hits'] + hits
+                counts['cache_misses'] = counts['cache_misses'] + misses
+
+
+    def count_job(self, counts):
+        """Counts the lookups made by the calling thread in counts as well, until called again with None.
+
+        Jobs of a server share one index, so its totals include every job running at the same time. Each job
+        counts its own lookups instead, passing the same counts to the worker threads it starts.
+
+        Parameters
+        ----------
+        counts : dict of str -> float or int
+            scan_time, cache_hits, and cache_misses of the job, or None to stop counting
+        """
+
+        self.job_counts.counts = counts
+
+
+    def get_job_counts(self):
+        """Returns the counts of the job counted by the calling thread, None if there is none
+        """
+
+        return getattr(self.job_counts, 'counts', None)
+
+
+    def get_scan_stats(self):
+        """Returns the time spent scanning the bundle, and the number of cache hits and misses so far
+        """
+
+        with self.lock:
+            return {'scan_time' : self.scan_time, 'cache_hits' : self.cache_hits, 'cache_misses' : self.cache_misses}
+
+
+    def path_exists(self, path):
+        """Checks if a file or directory exists, using the cached directory listings for paths inside the bundle
+        """
+
+        path = os.path.normpath(path)
+        if not path.startswith(os.path.normpath(self.binary_location) + os.sep):
+            return self.filesystem.exists(path)
+        try:
+            return os.path.basename(path) in self.scan_dir(os.path.dirname(path))[0]
+        except OSError:
+            return False
+
+
+    def get_watch_paths(self, ioc_types):
+        """Returns the bundle directories that IOCs of the given driver types are generated from
+
+        These are the iocBoot and executable directories of each driver, and the library directories
+        of base and of every support module, which are shared by all drivers.
+
+        Parameters
+        ----------
+        ioc_types : iterable of str
+            driver types to collect directories for
+
+        Returns
+        -------
+        watch_paths : list of str
+            existing directories, without duplicates
+        """
+
+        watch_paths = [self.support_path, self.areaDetector_path]
+        architectures = set()
+        for ioc_type in ioc_types:
+            _, executables, iocBoot_path = self.get_driver_scan(ioc_type)
+            for arch, executable_path in executables.items():
+                architectures.add(arch)
+                watch_paths.extend([os.path.dirname(executable_path), iocBoot_path])
+
+        module_paths = [self.base_path]
+        for top in [self.support_path, self.areaDetector_path]:
+            module_paths.extend([initIOC_path_join(top, dir) for dir in self.list_module_dirs(top)])
+        for module_path in module_paths:
+            for arch in architectures:
+                watch_paths.append(initIOC_path_join(initIOC_path_join(module_path, 'lib'), arch))
+
+        existing = []
+        for path in watch_paths:
+            if path not in existing and self.filesystem.isdir(path):
+                existing.append(path)
+        return existing
+
+
+    def get_dependent_ioc_types(self, path):
+        """Maps a changed path in the bundle to the driver types whose IOCs depend on it
+
+        Changes inside a driver module only affect IOCs of that driver. Any other change in the
+        bundle, ex. a rebuilt ADCore library, affects all drivers found so far.
+
+        Returns
+        -------
+        ioc_types : set of str
+            affected driver types, empty if the path is outside of the bundle
+        """
+
+        if not self.in_bundle(path):
+            return set()
+        with self.lock:
+            found = [ioc_type for ioc_type, scan in self.driver_scans.items() if len(scan[1]) > 0]
+        for ioc_type in found:
+            driver_path = initIOC_path_join(self.areaDetector_path, ioc_type)
+            if initIOC_path_is_under(path, driver_path):
+                return set([ioc_type])
+        return set(found)
+
+
+class DriverInfo:
+    """Class that stores what was found in the bundle for a single driver
+
+    Attributes
+    ----------
+    name : str
+        driver name, ex. ADSimDetector
+    executable_path : str
+        path to the driver executable for the default architecture, None if the driver was not built
+    iocBoot_path : str
+        path to the iocBoot directory the driver IOCs are generated from
+    architectures : list of str
+        architectures the driver executable was built for
+    connection_variable : str
+        epicsEnvSet variable set to the connection parameter of each IOC, None if there is none
+    has_template : bool
+        True if the driver can also be generated from ioc-template
+    """
+
+    def __init__(self, name, executable_path, iocBoot_path, architectures, connection_variable):
+        self.name                   = name
+        self.executable_path        = executable_path
+        self.iocBoot_path           = iocBoot_path
+        self.architectures          = architectures
+        self.connection_variable    = connection_variable
+        self.has_template           = name in supported_drivers
+
+
+class DriverRegistry:
+    """Class that lists the drivers of a bundle, looking each driver up in its areaDetector directory only once.
+
+    Drivers are looked up on demand, so generating a few IOCs only scans the drivers they use. The
+    whole areaDetector directory is only scanned when all drivers are listed, ex. for the GUI.
+
+    The hard-coded tables are only used as overrides. supported_drivers marks the drivers that have
+    an ioc-template, and existing_connection_parameter sets the connection variable of a driver. For
+    every other driver, the connection variable is detected once from the epicsEnvSet calls in its
+    iocBoot startup scripts, using connection_variable_patterns.
+
+    Attributes
+    ----------
+    bundle_index : BundleIndex
+        index the registry was built from
+    found : dict of str -> DriverInfo
+        entry for each driver looked up so far
+    complete : bool
+        True once every directory in areaDetector was looked up
+    drivers : dict of str -> DriverInfo
+        entry for each directory in areaDetector, including modules without an executable such as ADCore.
+        Scans all drivers not looked up yet
+    """
+
+    def __init__(self, bundle_index):
+        self.bundle_index   = bundle_index
+        self.found          = {}
+        self.complete       = False
+        self.lock           = threading.Lock()
+
+
+    @property
+    def drivers(self):
+        self.scan()
+        return self.found
+
+
+    def make_driver_info(self, name):
+        """Looks up the executable, iocBoot directory and connection variable of a single driver
+        """
+
+        _, executable_path, iocBoot_path = self.bundle_index.find_driver_paths(name)
+        if iocBoot_path is not None and not self.bundle_index.path_exists(iocBoot_path):
+            iocBoot_path = None
+        connection_variable = existing_connection_parameter.get(name)
+        if connection_variable is None and iocBoot_path is not None:
+            connection_variable = self.detect_connection_variable(iocBoot_path)
+        return DriverInfo(name, executable_path, iocBoot_path, self.bundle_index.get_architectures(name), connection_variable)
+
+
+    def get(self, name):
+        """Returns the entry of a driver, looking it up on first use
+
+        Returns
+        -------
+        driver : DriverInfo
+            entry of the driver, None if there is no directory for it in areaDetector
+        """
+
+        with self.lock:
+            if name not in self.found and not self.complete:
+                if name not in self.bundle_index.list_module_dirs(self.bundle_index.areaDetector_path):
+                    return None
+                self.found[name] = self.make_driver_info(name)
+            return self.found.get(name)
+
+
+    def scan(self):
+        """Looks up every driver in the areaDetector directory that was not looked up yet
+        """
+
+        with self.lock:
+            if self.complete:
+                return
+            for name in self.bundle_index.list_module_dirs(self.bundle_index.areaDetector_path):
+                if name not in self.found:
+                    self.found[name] = self.make_driver_info(name)
+            self.found = {name : self.found[name] for name in sorted(self.found.keys())}
+            self.complete = True
+
+
+    def detect_connection_variable(self, iocBoot_path):
+        """Returns the first variable set in the startup scripts of an iocBoot directory that matches a connection pattern
+        """
+
+        try:
+            files = sorted([file for file in self.bundle_index.list_files(iocBoot_path) if file.startswith('st') and file.endswith('.cmd')])
+        except OSError:
+            return None
+        for file in files:
+            for line in self.bundle_index.read_lines(initIOC_path_join(iocBoot_path, file)):
+                if not line.strip().startswith('epicsEnvSet'):
+                    continue
+                _, args = parse_iocsh_command(line)
+                if len(args) > 0 and any([re.match(pattern, args[0]) for pattern in connection_variable_patterns]):
+                    return args[0]
+        return None
+
+
+    def names(self):
+        """Returns the sorted names of the drivers with an executable in the bundle
+        """
+
+        return [name for name, driver in self.drivers.items() if driver.executable_path is not None]
+
+
+    def template_names(self):
+        """Returns the sorted names of the drivers in the bundle that can be generated from ioc-template
+        """
+
+        return [name for name in self.names() if self.drivers[name].has_template]
+
+
+    def get_connection_variable(self, name):
+        driver = self.get(name)
+        if driver is not None:
+            return driver.connection_variable
+        return existing_connection_parameter.get(name)
+
+
+    def has_template(self, name):
+        """Checks if a driver is in the bundle and can be generated from ioc-template
+        """
+
+        driver = self.get(name)
+        return driver is not None and driver.has_template
+
+
+class BundleScanner:
+    """Class that scans bundles in the background, and caches the driver registry of each bundle path.
+
+    Used by the GUI, so that a slow bundle on NFS never blocks the Tk main loop. Each bundle is scanned
+    at most once at a time, and switching back to a bundle that was scanned before returns its cached
+    registry immediately.
+
+    Attributes
+    ----------
+    registries : dict of str -> DriverRegistry
+        registry of each bundle path that was scanned
+    pending : dict of str -> concurrent.futures.Future
+        scan in progress for each bundle path
+    """
+
+    def __init__(self, max_workers=2):
+        self.registries = {}
+        self.pending    = {}
+        self.lock       = threading.Lock()
+        self.executor   = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+
+
+    def scan_bundle(self, binary_location):
+        if not os.path.isdir(binary_location):
+            raise OSError('Bundle location {} does not exist'.format(binary_location))
+        registry = BundleIndex(binary_location).get_driver_registry()
+        # The GUI lists every driver, so all of them are looked up here rather than in the Tk main loop
+        registry.scan()
+        with self.lock:
+            self.registries[binary_location] = registry
+            del self.pending[binary_location]
+        return registry
+
+
+    def scan(self, binary_location, refresh=False):
+        """Starts scanning a bundle, unless it was scanned before or is being scanned
+
+        Parameters
+        ----------
+        binary_location : str
+            path to the bundle
+        refresh : bool
+            if True, scan the bundle again even if its registry is cached
+
+        Returns
+        -------
+        future : concurrent.futures.Future
+            resolves to the DriverRegistry of the bundle, or raises OSError if it does not exist
+        """
+
+        with self.lock:
+            if binary_location in self.pending:
+                return self.pending[binary_location]
+            if binary_location in self.registries and not refresh:
+                future = concurrent.futures.Future()
+                future.set_result(self.registries[binary_location])
+                return future
+            future = concurrent.futures.Future()
+            self.pending[binary_location] = future
+
+        def run():
+            try:
+                future.set_result(self.scan_bundle(binary_location))
+            except Exception as e:
+                with self.lock:
+                    self.pending.pop(binary_location, None)
+                future.set_exception(e)
+
+        self.executor.submit(run)
+        return future
+
+
+    def get(self, binary_location):
+        """Returns the cached registry of a bundle, None if it was not scanned yet
+        """
+
+        with self.lock:
+            return self.registries.get(binary_location)
+
+
+    def close(self):
+        self.executor.shutdown(wait=False)
+
+
+def is_stale_owner(owner, age):
+    """Checks if the run that recorded owner in a lock file or journal has ended
+
+    Parameters
+    ----------
+    owner : dict
+        host and pid of the run, empty if not known
+    age : float
+        seconds since the file was last modified
+
+    Returns
+    -------
+    stale : bool
+        True if the process is no longer running on this host. If it ran on another host, or its process is
+        not known, True if the file is older than stale_lock_age, ex. because its host crashed
+    """
+
+    # A run on this host is stale only once its process is gone, however long it has been running.
+    # Signal 0 terminates the process on windows, so only the age is checked there
+    if platform == 'win32' or owner.get('host') != socket.gethostname() or not isinstance(owner.get('pid'), int):
+        return age > stale_lock_age
+    try:
+        os.kill(owner['pid'], 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+class GenerationJournal:
+    """Write-ahead journal of a generation run, stored under the IOC top directory.
+
+    Every directory and IOC is recorded before it is created, and each IOC again once it is
+    complete. The journal is removed when a run finishes with every started IOC complete, so an
+    existing journal always describes an incomplete run. A rerun uses it to skip complete IOCs
+    and to replace partially created ones, and rollback() uses it to remove everything the
+    incomplete run created.
+
+    Attributes
+    ----------
+    ioc_top : str
+        IOC top directory, all recorded paths are relative to it
+    path : str
+        path of the journal file
+    created_dirs : list of str
+        directories created by the run, in order of creation
+    started : list of str
+        IOC directories the run started creating, in order
+    completed : set of str
+        IOC directories that were completed
+    interrupted : bool
+        True if the journal of an incomplete run was found
+    owner : dict
+        host and pid of the run that last wrote the journal, None if not recorded
+
+    Each shard of a sharded run keeps its own journal, named file_name followed by the shard.
+    """
+
+    file_name = '.initIOC-journal'
+    # Journals being written by runs of this process
+    active_paths = set()
+
+    def __init__(self, ioc_top, name=None):
+        if name is None:
+            name = self.file_name
+        self.ioc_top        = ioc_top
+        self.path           = initIOC_path_join(ioc_top, name)
+        self.created_dirs   = []
+        self.started        = []
+        self.completed      = set()
+        self.owner          = None
+        self.journal_fp     = None
+        self.lock           = threading.Lock()
+        self.interrupted    = os.path.exists(self.path)
+        if self.interrupted:
+            self.load()
+
+
+    def load(self):
+        with open(self.path, 'r') as journal_fp:
+            for line in journal_fp:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # The last entry may have been cut off by a crash
+                    break
+                if entry['event'] == 'owner':
+                    self.owner = {'host' : entry.get('host'), 'pid' : entry.get('pid')}
+                else:
+                    self.apply(entry['event'], entry['path'])
+
+
+    def apply(self, event, path):
+        if event == 'mkdir' and path not in self.created_dirs:
+            self.created_dirs.append(path)
+        elif event == 'start' and path not in self.started:
+            self.started.append(path)
+        elif event == 'done':
+            self.completed.add(path)
+
+
+    def record(self, event, path):
+        """Durably appends an entry to the journal before the recorded step is performed
+        """
+
+        path = os.path.relpath(path, self.ioc_top)
+        with self.lock:
+            if self.journal_fp is None:
+                self.journal_fp = open(self.path, 'a')
+                self.active_paths.add(os.path.abspath(self.path))
+                # Each run writing the journal, including one resuming it, records itself first
+                self.owner = {'host' : socket.gethostname(), 'pid' : os.getpid()}
+                self.journal_fp.write(json.dumps(dict(self.owner, event='owner', time=time.time())) + '\n')
+            self.journal_fp.write(json.dumps({'event' : event, 'path' : path}) + '\n')
+            self.journal_fp.flush()
+            os.fsync(self.journal_fp.fileno())
+            self.apply(event, path)
+
+
+    def is_started(self, path):
+        return os.path.relpath(path, self.ioc_top) in self.started
+
+
+    def is_completed(self, path):
+        return os.path.relpath(path, self.ioc_top) in self.completed
+
+
+    def close(self):
+        with self.lock:
+            if self.journal_fp is not None:
+                self.journal_fp.close()
+                self.journal_fp = None
+                self.active_paths.discard(os.path.abspath(self.path))
+
+
+    def is_abandoned(self):
+        """Checks if the run that wrote the journal has ended, so that it can be rolled back without removing
+        IOCs another run, ex. a shard, is still writing
+
+        Returns
+        -------
+        abandoned : bool
+            False if the run is still going, or may be, see is_stale_owner()
+        """
+
+        if os.path.abspath(self.path) in self.active_paths:
+            return False
+        owner = self.owner if self.owner is not None else {}
+        if owner.get('host') == socket.gethostname() and owner.get('pid') == os.getpid():
+            return True
+        try:
+            age = time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return False
+        return is_stale_owner(owner, age)
+
+
+    def finish(self):
+        """Closes the journal at the end of a run, removing it if every started IOC was completed
+
+        Returns
+        -------
+        complete : bool
+            True if the run was complete and the journal was removed
+        """
+
+        self.close()
+        with self.lock:
+            complete = all([path in self.completed for path in self.started])
+            if complete and os.path.exists(self.path):
+                os.remove(self.path)
+            return complete
+
+
+    def rollback(self, log):
+        """Removes the IOCs and directories created by the incomplete run, then the journal itself
+        """
+
+        for path in reversed(self.started):
+            ioc_path = initIOC_path_join(self.ioc_top, path)
+            if os.path.lexists(ioc_path):
+                log('Removing IOC {}'.format(ioc_path))
+                shutil.rmtree(ioc_path)
+            staging_path = get_staging_path(ioc_path)
+            if os.path.lexists(staging_path):
+                log('Removing staged files of IOC {}'.format(ioc_path))
+                shutil.rmtree(staging_path)
+                try:
+                    os.rmdir(os.path.dirname(staging_path))
+                except OSError:
+                    pass
+        os.remove(self.path)
+        self.interrupted = False
+        # Directories are only removed if the run created them and nothing else was added since
+        for path in reversed(self.created_dirs):
+            dir_path = os.path.normpath(initIOC_path_join(self.ioc_top, path))
+            try:
+                os.rmdir(dir_path)
+                log('Removing directory {}'.format(dir_path))
+            except OSError:
+                pass
+
+
+class IOCLock:
+    """Advisory lock file that keeps runs sharing an IOC top directory, ex. shards on several hosts, from generating the same IOC at once.
+
+    The lock file is created exclusively next to the IOC directory, and records the host and process
+    holding it. A lock is stale, and is broken, if its process is no longer running on this host, or
+    if it was taken on another host and is older than stale_lock_age, ex. because that host crashed.
+
+    Attributes
+    ----------
+    path : str
+        path of the lock file
+    owner : dict
+        host, pid and time recorded in the lock file once acquired
+    holder : dict
+        owner recorded in the lock file by another run, if acquire() failed
+    held : bool
+        True while the lock is held
+    """
+
+    def __init__(self, ioc_top, ioc_name):
+        self.path   = initIOC_path_join(ioc_top, '.{}{}'.format(ioc_name, lock_file_suffix))
+        self.owner  = {'host' : socket.gethostname(), 'pid' : os.getpid(), 'time' : None}
+        self.holder = None
+        self.held   = False
+
+
+    def read_owner(self, path):
+        """Reads the owner recorded in a lock file, an empty dict if it was not written completely
+        """
+
+        try:
+            with open(path, 'r') as lock_fp:
+                owner = json.loads(lock_fp.read())
+        except ValueError:
+            return {}
+        return owner if isinstance(owner, dict) else {}
+
+
+    def break_stale(self):
+        """Removes the lock file if it is stale
+
+        Returns
+        -------
+        broken : bool
+            True if a stale lock was removed, or the lock file no longer exists
+        """
+
+        try:
+            age = time.time() - os.stat(self.path).st_mtime
+            owner = self.read_owner(self.path)
+        except FileNotFoundError:
+            return True
+        if not is_stale_owner(owner, age):
+            self.holder = owner
+            return False
+
+        # Renaming is atomic, so of several runs breaking the same lock only one removes it
+        stale_path = '{}.stale-{}-{}'.format(self.path, self.owner['host'], self.owner['pid'])
+        try:
+            os.rename(self.path, stale_path)
+        except FileNotFoundError:
+            return True
+        renamed_owner = self.read_owner(stale_path)
+        if renamed_owner != owner:
+            # Another run broke the lock and acquired it in between, so its lock is put back
+            try:
+                os.link(stale_path, self.path)
+            except OSError:
+                pass
+            os.remove(stale_path)
+            self.holder = renamed_owner
+            return False
+        os.remove(stale_path)
+        return True
+
+
+    def acquire(self):
+        """Tries to take the lock without waiting, breaking it if it is stale
+
+        Returns
+        -------
+        acquired : bool
+            True if the lock is now held, False if another run holds it, see holder
+        """
+
+        for _ in range(2):
+            try:
+                fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                if not self.break_stale():
+                    return False
+                continue
+            self.owner['time'] = time.time()
+            with os.fdopen(fd, 'w') as lock_fp:
+                lock_fp.write(json.dumps(self.owner))
+            self.held = True
+            self.holder = None
+            return True
+        return False
+
+
+    def release(self):
+        if self.held:
+            self.held = False
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def link_tree(source, target, copy_files=()):
+    """Recreates the directory tree at source in target, hardlinking files instead of copying them.
+
+    Files named in copy_files, and anything in an autosave directory, get fresh copies instead, as
+    they may be modified in place. Symbolic links are recreated as links. Files are copied if the
+    filesystem does not support hardlinks.
+
+    Parameters
+    ----------
+    source : str
+        existing directory
+    target : str
+        directory to create, must not exist
+    copy_files : iterable of str
+        paths relative to source of files that are copied instead of linked
+    """
+
+    copy_files = set([os.path.normpath(path) for path in copy_files])
+    os.makedirs(target)
+    for dirpath, dirnames, filenames in os.walk(source):
+        rel_dir = os.path.relpath(dirpath, source)
+        target_dir = os.path.normpath(os.path.join(target, rel_dir))
+        for name in dirnames + filenames:
+            source_path = os.path.join(dirpath, name)
+            target_path = os.path.join(target_dir, name)
+            rel_path = os.path.normpath(os.path.join(rel_dir, name))
+            if os.path.islink(source_path):
+                os.symlink(os.readlink(source_path), target_path)
+            elif os.path.isdir(source_path):
+                os.mkdir(target_path)
+            elif rel_path in copy_files or rel_path.split(os.sep)[0] == 'autosave':
+                shutil.copy2(source_path, target_path)
+            else:
+                try:
+                    os.link(source_path, target_path)
+                except OSError:
+                    shutil.copy2(source_path, target_path)
+
+
+class SnapshotStore:
+    """Class that manages hardlink based snapshots of IOC directories, stored under the IOC top directory.
+
+    Creating a snapshot only creates directories and links, so it takes a fraction of the time of a
+    copy. This is safe because initIOC never modifies a generated file in place: regenerated IOCs and
+    retargeted files are written as new files and moved over the old ones, leaving the snapshot with
+    the original contents. The files listed in editable_ioc_files may be edited in place by hand, so
+    they are always copied, both into a snapshot and back out of it when it is restored.
+
+    Attributes
+    ----------
+    ioc_top : str
+        IOC top directory, IOC paths in snapshots are stored relative to it
+    path : str
+        directory containing one directory per snapshot
+    """
+
+    dir_name = '.initIOC-snapshots'
+    manifest_name = 'snapshot.json'
+
+    def __init__(self, ioc_top):
+        self.ioc_top    = ioc_top
+        self.path       = initIOC_path_join(ioc_top, self.dir_name)
+
+
+    def create(self, ioc_paths, label='manual', copy_files=None):
+        """Creates a snapshot of the given IOC directories
+
+        Parameters
+        ----------
+        ioc_paths : list of str
+            IOC directories under the IOC top directory
+        label : str
+            short description of why the snapshot was taken, part of its name
+        copy_files : dict of str -> iterable of str
+            for each IOC path, files relative to it that will be modified in place and must be copied
+
+        Returns
+        -------
+        name : str
+            name of the new snapshot
+        """
+
+        if copy_files is None:
+            copy_files = {}
+        created = datetime.datetime.now()
+        name = '{}-{}'.format(created.strftime('%Y%m%d-%H%M%S-%f'), label)
+        snapshot_path = initIOC_path_join(self.path, name)
+        os.makedirs(snapshot_path)
+        iocs = []
+        for ioc_path in ioc_paths:
+            rel_path = os.path.relpath(ioc_path, self.ioc_top)
+            link_tree(ioc_path, os.path.join(snapshot_path, rel_path), list(copy_files.get(ioc_path, ())) + editable_ioc_files)
+            iocs.append(rel_path)
+        # The manifest is written last, so that an interrupted snapshot is never listed
+        with open(initIOC_path_join(snapshot_path, self.manifest_name), 'w') as manifest_fp:
+            json.dump({'created' : created.isoformat(), 'label' : label, 'iocs' : iocs}, manifest_fp)
+        return name
+
+
+    def list(self):
+        """Lists complete snapshots, oldest first
+
+        Returns
+        -------
+        snapshots : list of (str, dict)
+            name and manifest of each snapshot
+        """
+
+        snapshots = []
+        if not os.path.isdir(self.path):
+            return snapshots
+        for name in sorted(os.listdir(self.path)):
+            try:
+                with open(initIOC_path_join(initIOC_path_join(self.path, name), self.manifest_name), 'r') as manifest_fp:
+                    snapshots.append((name, json.load(manifest_fp)))
+            except (OSError, ValueError):
+                pass
+        return snapshots
+
+
+    def restore(self, name, log):
+        """Replaces the IOCs in a snapshot with their snapshotted state. Other IOCs are left untouched.
+
+        The current state of the IOCs is snapshotted first, so that a restore can be undone as well.
+
+        Returns
+        -------
+        restored : bool
+            False if no snapshot with the given name exists
+        """
+
+        manifest = dict(self.list()).get(name)
+        if manifest is None:
+            log('ERROR - No snapshot named {} in {}.'.format(name, self.path))
+            return False
+        current = [initIOC_path_join(self.ioc_top, ioc) for ioc in manifest['iocs']]
+        current = [ioc_path for ioc_path in current if os.path.exists(ioc_path)]
+        if len(current) > 0:
+            log('Saved current state of IOCs as snapshot {}.'.format(self.create(current, 'before-restore')))
+
+        snapshot_path = initIOC_path_join(self.path, name)
+        for ioc in manifest['iocs']:
+            ioc_path = initIOC_path_join(self.ioc_top, ioc)
+            log('Restoring IOC {}'.format(ioc_path))
+            # IOCs with the same name on different hosts each get their own temporary directory
+            temp_path = tempfile.mkdtemp(prefix='.restore-', dir=self.path)
+            try:
+                restore_path = os.path.join(temp_path, 'restore')
+                link_tree(os.path.join(snapshot_path, ioc), restore_path, editable_ioc_files)
+                if os.path.exists(ioc_path):
+                    os.rename(ioc_path, os.path.join(temp_path, 'old'))
+                os.makedirs(os.path.dirname(ioc_path), exist_ok=True)
+                os.rename(restore_path, ioc_path)
+            finally:
+                shutil.rmtree(temp_path, ignore_errors=True)
+        return True
+
+
+class CommandResult:
+    """Class that stores the outcome of an external command
+
+    Attributes
+    ----------
+    args : list of str
+        the command that was run
+    returncode : int
+        exit status, None if the command could not be started or was killed
+    output : str
+        combined stdout and stderr of the command
+    timed_out : bool
+        True if the command was killed after exceeding its timeout
+    """
+
+    def __init__(self, args, returncode=None, output='', timed_out=False):
+        self.args       = args
+        self.returncode = returncode
+        self.output     = output
+        self.timed_out  = timed_out
+
+
+    def succeeded(self):
+        return self.returncode == 0
+
+
+    def describe(self):
+        """Function that summarizes a failed command for the log
+        """
+
+        if self.timed_out:
+            status = 'timed out'
+        elif self.returncode is None:
+            status = 'could not be started'
+        else:
+            status = 'exited with status {}'.format(self.returncode)
+        description = '{} {}'.format(' '.join(self.args), status)
+        if self.output.strip() != '':
+            description = description + ':\n' + self.output.rstrip()
+        return description
+
+
+class CommandRunner:
+    """Class that runs external commands for IOC generation, shared by all IOCs of a run.
+
+    At most max_concurrent commands run at once, so generating many IOCs in parallel does not start
+    a git clone for each of them together. Each command is killed after its timeout along with any
+    processes it started, and its output is captured rather than printed, so it can be logged with
+    the IOC it belongs to.
+
+    Attributes
+    ----------
+    timeout : float
+        default number of seconds a command may run
+    slots : threading.BoundedSemaphore
+        limits the number of commands running at once
+    """
+
+    def __init__(self, max_concurrent=max_concurrent_commands, timeout=default_command_timeout):
+        self.timeout    = timeout
+        self.slots      = threading.BoundedSemaphore(max_concurrent)
+
+
+    def run(self, args, cwd=None, timeout=None, env=None):
+        """Runs a command, waiting for a free slot first
+
+        Parameters
+        ----------
+        args : list of str
+            command and its arguments
+        cwd : str
+            working directory of the command
+        timeout : float
+            seconds the command may run once started, defaults to the timeout of the runner
+        env : dict of {str, str}
+            variables added to the environment of the command
+
+        Returns
+        -------
+        result : CommandResult
+            exit status and output of the command
+        """
+
+        if timeout is None:
+            timeout = self.timeout
+        if env is not None:
+            env = dict(os.environ, **env)
+
+        with self.slots:
+            try:
+                # A new session lets the whole process group be killed on timeout, not just the direct child
+                process = subprocess.Popen(args, cwd=cwd, env=env, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                                           universal_newlines=True, start_new_session=(platform != 'win32'))
+            except OSError as e:
+                return CommandResult(args, output=str(e))
+            try:
+                output, _ = process.communicate(timeout=timeout)
+                return CommandResult(args, process.returncode, output)
+            except subprocess.TimeoutExpired:
+                self.kill(process)
+                output, _ = process.communicate()
+                return CommandResult(args, None, output, timed_out=True)
+
+
+    def kill(self, process):
+        if platform == 'win32':
+            process.kill()
+            return
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except OSError:
+            process.kill()
+
+
+# Runner shared by every manager in the process, so that the concurrency limit holds across partitions and server jobs
+command_runner = CommandRunner()
+
+
+def remove_readonly(function, path, exc_info):
+    """Error handler for shutil.rmtree that clears the read-only flag set on git objects on windows, then retries
+    """
+
+    os.chmod(path, stat.S_IWRITE)
+    function(path)
+
+
+class IOCActionManager:
+
+    def __init__(self, ioc_top, binary_location, set_lib_path, use_template, with_deps, use_links, output=None, bundle_index=None, log=None, journal=None, autosave=None, command_timeout=None, events=None, filesystem=None):
+
+        # Backend all files are read from and written to, the real filesystem unless one is given
+        if filesystem is None:
+            filesystem = local_filesystem
+        self.filesystem         = filesystem
+        self.ioc_top            = ioc_top
+        self.ioc_top_created    = False
+        self.binary_location    = binary_location
+        self.bundle_index       = bundle_index
+        self.binaries_flat      = self.check_binaries_flat()
+        self.set_lib_path       = set_lib_path
+        self.use_template       = use_template
+        self.with_deps          = with_deps
+        self.use_links          = use_links
+        self.processed_actions  = []
+        # Target that generated files are written into, the filesystem unless an archive is requested
+        if output is None:
+            output = DiskOutput(filesystem=filesystem)
+        self.output             = output
+        # Environment collected from the bundle for each driver type, shared by all IOCs of that type
+        self.driver_environments = {}
+        # Function called with each log message, and result of the IOC currently being processed
+        if log is None:
+            log = initIOC_print
+        self.log_function       = log
+        self.current_result     = None
+        # Write-ahead journal of the run, used to resume or roll back an interrupted run
+        self.journal            = journal
+        # How auto_settings.req includes are resolved at generation time, one of autosave_modes, or None to copy it as is
+        self.autosave           = autosave
+        # External commands such as cloning ioc-template run through the shared runner, None for its default timeout
+        self.command_runner     = command_runner
+        self.command_timeout    = command_timeout
+        # Function called with a dict for each completed generation phase and IOC, None if not reporting events
+        self.events             = events
+        # Configuration saved into each generated IOC as initIOCs.yml, serialized by dump_ioc_config, None to not save it
+        self.config_text        = None
+        self.update_mod_paths()
+
+
+    def log(self, text):
+        """Function that passes a message to the log function, recording errors and warnings in the current IOC result
+        """
+
+        if self.current_result is not None and text.startswith(('ERROR', 'WARNING')):
+            self.current_result.messages.append(text)
+        self.log_function(text)
+
+
+    def emit(self, event):
+        """Function that passes an event to the event function, if one was given
+        """
+
+        if self.events is not None:
+            event['time'] = time.time()
+            self.events(event)
+
+
+    def end_phase(self, action, result, phase, start):
+        """Function that records the duration of a phase of generating an IOC, and emits it as an event
+
+        Returns
+        -------
+        end : float
+            time the phase ended, from time.monotonic
+        """
+
+        end = time.monotonic()
+        result.durations[phase] = end - start
+        self.emit({'event' : 'phase', 'ioc' : action.ioc_name, 'phase' : phase, 'duration' : result.durations[phase]})
+        return end
+
+
+    def check_binaries_flat(self):
+        if self.filesystem.exists(initIOC_path_join(self.binary_location, 'support')):
+            return False
+        return True
+
+
+    def deployment_info(self, action):
+        """Function that generates string of info for current IOCAction
+        """
+
+        info = ''
+        info = info + '#\n# {} IOC deployed using initIOC {}\n'.format(action.ioc_type, __version__)
+        info = info + '# Initial target bundle location: {}\n'.format(self.binary_location)
+        if self.use_template:
+            info = info + '# IOC generated from: https://github.com/epicsNSLS2-deploy/ioc-template\n'
+        else:
+            _, _, iocBoot_path = self.find_paths_for_action(action.ioc_type)
+            if iocBoot_path is not None:
+                info = info + '# IOC generated from: {}\n'.format(iocBoot_path)
+
+        info = info + '#{}\n'.format('-' * 64)
+        return info
+
+
+    def update_mod_paths(self):
+        """Function that sets the paths of core modules based on binary location and format
+        """
+
+        # Only rescan the bundle if it has changed
+        if self.bundle_index is None or self.bundle_index.binary_location != self.binary_location:
+            self.bundle_index = BundleIndex(self.binary_location, self.filesystem)
+
+        self.binaries_flat = self.bundle_index.binaries_flat
+        self.base_path = self.bundle_index.base_path
+        self.support_path = self.bundle_index.support_path
+        self.areaDetector_path = self.bundle_index.areaDetector_path
+
+
+    def find_paths_for_action(self, ioc_type, arch=None):
+        """Finds ioc_top, executable, and iocBoot folder for IOCAction, with the executable built for arch
+        """
+
+        return self.bundle_index.find_driver_paths(ioc_type, arch)
+
+
+    def get_architecture(self, ioc_type, arch=None):
+        """Function that returns the architecture IOCs of a driver are generated for
+
+        Parameters
+        ----------
+        ioc_type : str
+            driver name
+        arch : str
+            architecture requested in the configuration, None to use the default build of the driver in the bundle
+
+        Returns
+        -------
+        arch : str
+            architecture used for the executable, the library path and ARCH in envPaths
+        """
+
+        if arch is None:
+            arch = self.bundle_index.get_default_architecture(ioc_type)
+        if arch is None:
+            arch = default_architecture
+        return arch
+
+
+    def partition(self, ioc_top, output=None):
+        """Function that creates a manager with the same settings writing into a different location.
+
+        The bundle index, collected driver environments and journal are shared with this manager,
+        so the bundle is only scanned once for all partitions.
+
+        Parameters
+        ----------
+        ioc_top : str
+            IOC output directory for the new manager
+        output : DiskOutput or TarArchiveOutput
+            output target for the new manager, defaults to the filesystem with the same fsync policy
+
+        Returns
+        -------
+        manager : IOCActionManager
+            new manager
+        """
+
+        if output is None and self.output.on_disk:
+            output = DiskOutput(self.output.fsync_policy, self.filesystem)
+        manager = IOCActionManager(ioc_top, self.binary_location, self.set_lib_path, self.use_template, self.with_deps, self.use_links, output=output, bundle_index=self.bundle_index, log=self.log_function, journal=self.journal, autosave=self.autosave, command_timeout=self.command_timeout, events=self.events, filesystem=self.filesystem)
+        manager.driver_environments = self.driver_environments
+        manager.config_text = self.config_text
+        return manager
+
+
+    def get_lib_path_for_module(self, module_path, architecture, delimeter):
+        """Generates a library path for specific module
+        """
+
+        bin_loc = initIOC_path_join(module_path, 'bin')
+        bin_loc = initIOC_path_join(bin_loc, architecture)
+        lib_loc = initIOC_path_join(module_path, 'lib')
+        lib_loc = initIOC_path_join(lib_loc, architecture)
+        return bin_loc + delimeter + lib_loc + delimeter
+
+
+    def get_lib_path_str(self, action):
+        """Function that generates library path for shared built iocs
+
+        Parameters
+        ----------
+        action : IOCAction
+            ioc action for which we are generating lib path.
+
+        Returns
+        -------
+        lib_path : str
+            Library path set in form of str
+        """
+
+        return self.get_lib_path_str_for_type(action.ioc_type, action.arch)
+
+
+    def get_lib_path_str_for_type(self, ioc_type, arch=None):
+        """Function that generates library path for shared built iocs of a driver type, see get_lib_path_str()
+        """
+
+        lib_path_str = ''
+        arch = self.get_architecture(ioc_type, arch)
+        if platform == "win32":
+            delimeter = ';'
+            closer = '%PATH%"'
+            
+        else:
+            delimeter = ':'
+            closer = '$LD_LIBRARY_PATH'
+
+        if platform == "win32":
+            lib_path_str = lib_path_str + 'SET "PATH='
+        else:
+            lib_path_str = lib_path_str + 'export LD_LIBRARY_PATH='
+
+        lib_path_str = lib_path_str + self.get_lib_path_for_module(self.base_path, arch, delimeter)
+
+        for dir in self.bundle_index.list_module_dirs(self.support_path):
+            mod_path = initIOC_path_join(self.support_path, dir)
+            if dir != "base" and dir != "areaDetector":
+                lib_path_str = lib_path_str + self.get_lib_path_for_module(mod_path, arch, delimeter)
+
+        for dir in self.bundle_index.list_module_dirs(self.areaDetector_path):
+            mod_path = initIOC_path_join(self.areaDetector_path, dir)
+            if dir == 'ADCore' or dir == 'ADSupport' or dir in ad_plugins or dir == ioc_type:
+                lib_path_str = lib_path_str + self.get_lib_path_for_module(mod_path, arch, delimeter)
+
+        lib_path_str = lib_path_str + closer
+        return lib_path_str
+    
+
+    def initialize_ioc_directory(self):
+        """Function used to create a new IOC directory if it does not already exist
+        """
+
+        if not self.output.on_disk:
+            if self.use_template:
+                self.log('ERROR - IOCs generated from template cannot be written into an archive.')
+                return False
+            self.log('Writing IOCs into archive {}.\n'.format(self.output.archive_path))
+            self.ioc_top_created = True
+        elif not self.filesystem.exists(os.path.dirname(self.ioc_top)):
+            self.log('ERROR - IOC top directory {} could not be created'.format(self.ioc_top))
+        else:
+            if self.filesystem.exists(self.ioc_top):
+                self.log('IOC top directory already exists.\n')
+            else:
+                try:
+                    self.log('Creating IOC directory at {}.\n'.format(self.ioc_top))
+                    # The directory is recorded before it is created, unless the journal itself is kept in it
+                    record_after = self.journal is not None and not self.filesystem.exists(self.journal.ioc_top)
+                    if self.journal is not None and not record_after:
+                        self.journal.record('mkdir', self.ioc_top)
+                    self.filesystem.mkdir(self.ioc_top)
+                    if record_after:
+                        self.journal.record('mkdir', self.ioc_top)
+                except FileExistsError:
+                    # Created by another run sharing the directory
+                    pass
+                except PermissionError:
+                    self.log('ERROR - You do not have permissions to write to specified directory!')
+                    return False
+            self.ioc_top_created = True
+
+        return True
+
+
+    def get_st_wrapper_text(self, lib_path, executable_path):
+        """Function that returns the contents of an st.cmd that runs the executable with st_base.cmd from bash
+        """
+
+        return '#!/bin/bash\n\n{}\n\n{} st_base.cmd\n'.format(lib_path, executable_path)
+
+
+    def initialize_st_base_file(self, ioc_path, lib_path, executable_path):
+        """Function responsible for handling executable path injection, and base file creation
+        """
+
+        exec_written    = False
+        if platform == 'win32':
+            # On windows, no shebangs, so st.cmd will always run executable followed by st_base.cmd
+            with self.output.open(initIOC_path_join(ioc_path, 'st.cmd')) as st_exe:
+                st_exe.write('@echo OFF\n\n{}\n\n{} st_base.cmd\n'.format(lib_path, executable_path))
+            st = self.output.open(initIOC_path_join(ioc_path, "st_base.cmd"))
+            exec_written = True
+
+        elif len(executable_path) > KERNEL_PATH_LIMIT or self.set_lib_path:
+            if len(executable_path) > KERNEL_PATH_LIMIT:
+                # The path length limit for shebangs (#!/) on linux is usually kernel based and set to 127
+                self.log('WARNING - Path to executable exceeds legal bash shebang limit, splitting into st.cmd and st_base.cmd')
+            else:
+                # If we want to set LD_LIBRARY_PATH we do that here.
+                self.log('Appending library path to start of st.cmd...')
+            with self.output.open(initIOC_path_join(ioc_path, 'st.cmd')) as st_exe:
+                st_exe.write(self.get_st_wrapper_text(lib_path, executable_path))
+            st = self.output.open(initIOC_path_join(ioc_path, "st_base.cmd"))
+            exec_written = True
+        else:
+            st = self.output.open(initIOC_path_join(ioc_path, "st.cmd"))
+
+        return st, exec_written
+
+
+    def genertate_st_cmd(self, action, executable_path, st_base_path):
+
+        self.log('Generating st.cmd using base file:\n{}'.format(st_base_path))
+        ioc_path        = initIOC_path_join(self.ioc_top, action.ioc_name)
+
+        lib_path        = ''
+        if self.set_lib_path:
+            lib_path  = self.get_lib_path_str(action)
+        
+        # Create base st.cmd, add call to executable
+        st, exec_written = self.initialize_st_base_file(ioc_path, lib_path, executable_path)
+
+        with st:
+            # If the executable will be in the base file, write the shebang
+            if not exec_written:
+                st.write('#!{}\n\n'.format(executable_path))
+
+            # Define envPaths
+            st.write('< envPaths\n\n')
+
+            # Read existing st.cmd base file
+            lines = self.bundle_index.read_lines(st_base_path)
+
+            # Read through the lines, add a 'unique.cmd' call after all env sets, and add envSet calls to action environment
+            wrote_unique = False
+            for line in lines:
+                if line.startswith('#!') or 'unique.cmd' in line or 'envPaths' in line:
+                    pass
+                elif line.startswith('#'):
+                    st.write(line)
+                elif 'Config(' in line and not wrote_unique:
+                    st.write('\n< unique.cmd\n\n')
+                    st.write(line)
+                    wrote_unique = True
+                elif line.startswith('epicsEnvSet'):
+                    action.add_to_environment(line)
+                    st.write(line)
+                else:
+                    st.write(line)
+
+        # Collect environment variables set in any other files
+        self.grab_additional_env(action, st_base_path)
+        # Make st.cmd executable.
+        self.output.chmod(initIOC_path_join(ioc_path, "st.cmd"), 0o755)
+
+    
+    def grab_additional_env(self, action, st_base_path):
+        """Function that collects any additional environment variables for IOC
+        """
+
+        iocBoot_dir = os.path.dirname(st_base_path)
+        st_file = os.path.basename(st_base_path)
+
+        for file in self.bundle_index.list_files(iocBoot_dir):
+            # For any file that isnt the base file, add environment variables.
+            if file.startswith('st') and file.endswith('.cmd') and file != st_file:
+                for line in self.bundle_index.read_lines(os.path.join(iocBoot_dir, file)):
+                    if line.startswith('epicsEnvSet'):
+                        action.add_to_environment(line)
+
+
+    def generate_unique_cmd(self, action):
+
+        self.log('Generating unique.cmd from detected environment...')
+        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+        with self.output.open(initIOC_path_join(ioc_path, 'unique.cmd')) as unique_fp:
+            unique_fp.write('#############################################\n')
+            unique_fp.write('# initIOC Auto-Generated Unique File        #\n')
+            unique_fp.write('# Generated: {:<31}#\n'.format(str(datetime.datetime.now())))
+            if 'ENGINEER' in action.epics_environment.keys():
+                unique_fp.write('# Deploying Engineer: {:<22}#\n'.format(action.epics_environment['ENGINEER']))
+            unique_fp.write('#############################################\n\n\n')
+
+            unique_fp.write(self.deployment_info(action)+'\n\n')
+
+            for env_var, value in action.environment_items():
+                unique_fp.write('epicsEnvSet("{}",{}"{}")\n'.format(env_var, ' ' * (32 - len(env_var)), value))
+
+
+    def get_env_paths_name(self, module):
+
+        if module == 'seq':
+            return 'SNCSEQ'
+        elif module == 'iocStats':
+            return 'DEVIOCSTATS'
+        elif module == 'areaDetector':
+            return 'AREA_DETECTOR'
+        else:
+            return module.upper()
+
+
+    def read_env_paths_arch(self, env_paths_path):
+        """Function that reads the ARCH set in an envPaths file, None if it is not set or cannot be read
+        """
+
+        try:
+            for line in self.bundle_index.read_lines(env_paths_path):
+                command, args = parse_iocsh_command(line)
+                if command == 'epicsEnvSet' and len(args) > 1 and args[0] == 'ARCH':
+                    return args[1]
+        except OSError:
+            pass
+        return None
+
+
+    def get_env_paths_text(self, ioc_top_path, arch):
+        """Function that returns the contents of a generated envPaths file for the bundle of this manager
+        """
+
+        envPaths_text = '# Path propagated to remaining envPaths (binary bundle location)\nepicsEnvSet("BINARY_TOP", "{}")\n\n'.format(self.binary_location)
+        envPaths_text = envPaths_text + 'epicsEnvSet("ARCH", "{}")\n'.format(arch)
+        envPaths_text = envPaths_text + 'epicsEnvSet("TOP", "{}")\n'.format(ioc_top_path)
+
+        base_path = initIOC_path_join('$(BINARY_TOP)', 'base')
+        envPaths_text = envPaths_text + 'epicsEnvSet("EPICS_BASE",{}"{}")\n'.format((' ' * 14), base_path)
+
+        support_path = "$(BINARY_TOP)"
+        if not self.binaries_flat:
+            support_path = initIOC_path_join(support_path, "support")
+
+        envPaths_text = envPaths_text + 'epicsEnvSet("SUPPORT",{}"{}")\n\n'.format((' ' * 17), support_path)
+
+        for dir in self.bundle_index.list_module_dirs(self.support_path):
+            if dir not in ['base', 'configure', 'utils', 'documentation', '.git', 'lib', 'bin']:
+                mod_path = initIOC_path_join('$(SUPPORT)', dir)
+                envPaths_text = envPaths_text + 'epicsEnvSet("{}",{}"{}")\n'.format(self.get_env_paths_name(dir), ' ' * (24 - len(self.get_env_paths_name(dir))), mod_path)
+
+        envPaths_text = envPaths_text + '\n'
+
+        for dir in self.bundle_index.list_module_dirs(self.areaDetector_path):
+            if dir not in ['configure', 'docs', 'documentation', 'ci', '.git', '']:
+                mod_path = initIOC_path_join('$(AREA_DETECTOR)', dir)
+                envPaths_text = envPaths_text + 'epicsEnvSet("{}",{}"{}")\n'.format(self.get_env_paths_name(dir), ' ' * (24 - len(self.get_env_paths_name(dir))), mod_path)
+        return envPaths_text
+
+
+    def generate_env_paths(self, ioc_top_path, ioc_boot_path, target, action):
+
+        arch = self.get_architecture(action.ioc_type, action.arch)
+        link_env_paths = self.use_links
+        if link_env_paths and self.read_env_paths_arch(initIOC_path_join(ioc_boot_path, 'envPaths')) not in [None, arch]:
+            # The bundle envPaths is for another build, so it cannot be shared
+            self.log('envPaths in bundle does not set ARCH to {}, generating it instead of linking.'.format(arch))
+            link_env_paths = False
+
+        if not link_env_paths:
+
+            self.log('Generating envPaths based on discovered compiled binaries...')
+            ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+            with self.output.open(initIOC_path_join(ioc_path, 'envPaths')) as envPaths_fp:
+                envPaths_fp.write(self.get_env_paths_text(ioc_top_path, arch))
+
+        else:
+            self.output.symlink(initIOC_path_join(ioc_boot_path, 'envPaths'), initIOC_path_join(target, 'envPaths'))
+
+
+    def process_action(self, action):
+        """Function that generates a single IOC
+
+        Parameters
+        ----------
+        action : IOCAction
+            the IOC to generate
+
+        Returns
+        -------
+        result : IOCResult
+            outcome of generating the IOC
+        """
+
+        result = IOCResult(action)
+        self.current_result = result
+        lock = None
+        try:
+            if self.ioc_top_created or self.initialize_ioc_directory():
+                lock = self.lock_action(action)
+                if lock is not None and not lock.held:
+                    result.status = 'locked'
+                else:
+                    self.run_action(action, result)
+        except Exception as e:
+            # A single IOC, ex. in a directory that is not writable, must not end the whole run
+            self.log('ERROR - Generating IOC {} failed: {}'.format(action.ioc_name, e))
+            result.status = 'failed'
+        finally:
+            if lock is not None:
+                lock.release()
+            self.current_result = None
+            ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+            for path, size in self.output.take_written():
+                result.files.append(os.path.relpath(path, ioc_path))
+                result.bytes_written = result.bytes_written + size
+        self.emit(dict(event='ioc', **result.to_dict()))
+        return result
+
+
+    def lock_action(self, action):
+        """Function that takes the lock of an IOC, so that other runs sharing the IOC top directory skip it
+
+        Returns
+        -------
+        lock : IOCLock
+            lock of the IOC, not held if another run is generating it. None if the IOC is not written to disk
+        """
+
+        if not self.output.on_disk or not self.filesystem.on_disk:
+            return None
+        lock = IOCLock(self.ioc_top, action.ioc_name)
+        if not lock.acquire():
+            # Overlapping runs, ex. shards, are expected to meet, so this is not an error
+            holder = lock.holder or {}
+            self.log('IOC {} is being generated by process {} on {}, leaving it to that run.'.format(action.ioc_name, holder.get('pid'), holder.get('host')))
+        return lock
+
+
+    def run_action(self, action, result):
+        """Function that performs the generation steps for an IOC, and records their outcome in result
+        """
+
+        self.log("-------------------------------------------")
+        self.log("Setup process for IOC " + action.ioc_name)
+        self.log("-------------------------------------------")
+
+        phase_start = time.monotonic()
+        from_template = self.use_template
+        if action.ioc_type in self.driver_environments:
+            action.share_driver_environment(self.driver_environments[action.ioc_type])
+        action.connection_variable = self.bundle_index.get_driver_registry().get_connection_variable(action.ioc_type)
+        ioc_top_path, executable_path, iocBoot_path = self.find_paths_for_action(action.ioc_type, action.arch)
+        result.executable_path = executable_path
+        result.iocBoot_path = iocBoot_path
+        
+        if executable_path is None and action.arch is not None and len(self.bundle_index.get_architectures(action.ioc_type)) > 0:
+            self.log('ERROR - {} was not built for architecture {}, only for {}. Skipping...'.format(action.ioc_type, action.arch, ', '.join(self.bundle_index.get_architectures(action.ioc_type))))
+            return
+        elif executable_path is None:
+            self.log('ERROR - Could not find binary for {}, skipping...'.format(action.ioc_type))
+            self.log('Make sure binary for {} exists at binary path:\n{}'.format(action.ioc_type, self.binary_location))
+            return
+        elif ioc_top_path is None or iocBoot_path is None:
+            if not from_template:
+                self.log('WARNING - Could not find ioc top and iocBoot folder, defaulting to use template.')
+            from_template = True
+
+        if from_template and not self.output.on_disk:
+            self.log('ERROR - IOC {} requires ioc-template, which cannot be written into an archive, skipping...'.format(action.ioc_name))
+            return
+        elif from_template and not self.filesystem.on_disk:
+            self.log('ERROR - IOC {} requires ioc-template, which can only be cloned onto the disk, skipping...'.format(action.ioc_name))
+            return
+        
+        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+        if self.output.exists(ioc_path):
+            if self.journal is not None and self.journal.is_completed(ioc_path):
+                self.log('IOC {} was completed by the interrupted run, skipping.\n'.format(action.ioc_name))
+                result.status = 'created'
+                return
+            elif self.journal is not None and self.journal.is_started(ioc_path):
+                self.log('Removing IOC {} left incomplete by the interrupted run...'.format(action.ioc_name))
+                self.filesystem.rmtree(ioc_path)
+            else:
+                self.log('ERROR - IOC with name {} already exists in {}.'.format(action.ioc_name, self.ioc_top))
+                result.status = 'skipped'
+                return
+
+        if self.journal is not None:
+            self.journal.record('start', ioc_path)
+        phase_start = self.end_phase(action, result, 'locate', phase_start)
+        finished = False
+        try:
+            if not from_template:
+                # The template is cloned in place, so only IOCs generated from the bundle are staged
+                self.output.begin(ioc_path)
+                created = self.create_ioc_from_bundle(action, ioc_top_path, executable_path, iocBoot_path)
+            else:
+                created = self.create_ioc_from_template(action, ioc_top_path, executable_path)
+            if not created:
+                return
+            # The first IOC of a type to be generated shares its environment with the others
+            if action.ioc_type not in self.driver_environments:
+                self.driver_environments[action.ioc_type] = action.freeze_driver_environment()
+            phase_start = self.end_phase(action, result, 'generate', phase_start)
+
+            self.create_config_file(action)
+            self.save_ioc_config(action)
+            if self.autosave is not None and self.output.on_disk:
+                self.resolve_autosave_requests(action)
+            #self.make_ignore_files(action) TODO
+            phase_start = self.end_phase(action, result, 'configure', phase_start)
+            self.output.finish()
+            finished = True
+        finally:
+            # Staged files of an IOC that failed, or raised an exception, are not left behind
+            if not finished:
+                self.output.discard()
+        self.end_phase(action, result, 'write', phase_start)
+        if self.journal is not None:
+            self.journal.record('done', ioc_path)
+        result.status = 'created'
+        self.log('Done.\n')
+
+
+    def save_ioc_config(self, action):
+        """Function that saves the configuration used to generate an IOC into it, so that it is moved into place with the IOC
+        """
+
+        if self.config_text is not None:
+            ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+            with self.output.open(initIOC_path_join(ioc_path, 'initIOCs.yml')) as config_fp:
+                config_fp.write(self.config_text)
+
+
+    def create_config_file(self, action):
+
+        self.log('Generating config file for use with procServ...')
+        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+        with self.output.open(initIOC_path_join(ioc_path, 'config')) as config_fp:
+            config_fp.write('NAME={}\nPORT={}\nUSER=softioc\nHOST={}\n'.format(action.ioc_name, action.ioc_port, action.epics_environment['HOSTNAME']))
+
+
+    def resolve_autosave_requests(self, action):
+        """Function that resolves the includes of the IOC auto_settings.req against the request file paths of its startup scripts
+
+        Unresolved includes are reported as warnings. Depending on the autosave mode, the request file is then
+        replaced with a flattened copy, or the set_requestfile_path calls in the generated startup scripts that
+        supply no included file are commented out.
+        """
+
+        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+        staged_path = self.output.get_path(ioc_path)
+        req_path = initIOC_path_join(staged_path, 'auto_settings.req')
+        if not self.filesystem.exists(req_path):
+            return
+
+        self.log('Resolving autosave request file includes...')
+        _, state = StartupVerifier().run_scripts(staged_path, self.bundle_index)
+        # Autosave looks in the IOC directory before the request file paths
+        resolver = RequestFileResolver(self.bundle_index, [staged_path] + state['request_paths'])
+        lines = resolver.flatten(req_path)
+        for name, parent in resolver.unresolved:
+            self.log('WARNING - Request file {} included by {} not found in request file paths.'.format(name, parent))
+
+        if self.autosave == 'flatten':
+            # A linked request file points into the bundle, and must not be written through
+            if self.filesystem.islink(req_path):
+                self.filesystem.remove(req_path)
+            with self.output.open(initIOC_path_join(ioc_path, 'auto_settings.req')) as req_fp:
+                req_fp.write('# auto_settings.req of {} with all includes resolved by initIOC\n'.format(action.ioc_type))
+                for line in lines:
+                    req_fp.write(line + '\n')
+        elif self.autosave == 'prune':
+            self.prune_request_paths(ioc_path, state['request_path_lines'], resolver.used_paths)
+
+
+    def prune_request_paths(self, ioc_path, request_path_lines, used_paths):
+        """Function that comments out set_requestfile_path calls in the generated startup scripts for unused directories
+
+        Calls in scripts included from the bundle, such as commonPlugins.cmd, are left unchanged.
+        """
+
+        staged_path = self.output.get_path(ioc_path)
+        pruned = {}
+        for script_path, line_number, request_path in request_path_lines:
+            if script_path != staged_path and initIOC_path_is_under(script_path, staged_path) and os.path.normpath(request_path) not in used_paths:
+                pruned.setdefault(script_path, []).append(line_number)
+
+        for script_path, line_numbers in pruned.items():
+            lines = self.filesystem.read_lines(script_path)
+            for line_number in line_numbers:
+                lines[line_number - 1] = '#' + lines[line_number - 1]
+            with self.output.open(ioc_path + script_path[len(staged_path):]) as script_fp:
+                script_fp.write(''.join(lines))
+        self.log('Pruned {} unused request file path(s).'.format(sum(len(line_numbers) for line_numbers in pruned.values())))
+
+
+    def create_ioc_from_bundle(self, action, ioc_top_path, executable_path, iocBoot_path):
+
+        self.log('Generating IOC from detected bundle located at: {}'.format(self.binary_location))
+        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+        self.output.mkdir(ioc_path)
+        self.output.mkdir(initIOC_path_join(ioc_path, 'autosave'))
+
+        current_base_len = 0
+        current_base = None
+        for file in self.bundle_index.list_files(iocBoot_path):
+            next = initIOC_path_join(iocBoot_path, file)
+            if file.startswith('st'):
+                lines = self.bundle_index.read_lines(next)
+                if len(lines) > current_base_len:
+                    current_base = next
+                    current_base_len = len(lines)
+
+        if current_base is None:
+            self.log('ERROR - Could not fine suitable st_base file. Aborting...')
+            return False
+
+        self.genertate_st_cmd(action, executable_path, current_base)
+        self.generate_unique_cmd(action)
+        self.generate_env_paths(ioc_top_path, iocBoot_path, ioc_path, action)
+        self.grab_dependencies_from_bundle(ioc_path, iocBoot_path)
+        return True
+
+    
+    def grab_dependencies_from_bundle(self, ioc_path, iocBoot_path):
+
+        self.log('Collecting additional iocBoot files from bundle...')
+        for file in self.bundle_index.list_files(iocBoot_path):
+            target = initIOC_path_join(iocBoot_path, file)
+            if file == 'auto_settings.req':
+                if not self.use_links:
+                    self.output.copyfile(target, initIOC_path_join(ioc_path, file))
+                else:
+                    self.output.symlink(target, initIOC_path_join(ioc_path, file))
+            elif self.with_deps and not file.startswith(('Makefile', 'st', 'test', 'READ', 'dll', 'envPaths')):
+                self.output.copyfile(target, initIOC_path_join(ioc_path, file))
+
+
+    def create_ioc_from_template(self, action, ioc_top_path, executable_path):
+
+        ioc_path = initIOC_path_join(self.ioc_top, action.ioc_name)
+
+        # First, clone the template. Git must never wait for credentials, or the run would hang
+        clone = self.command_runner.run(['git', 'clone', '--quiet', '--depth', '1', template_url, ioc_path], timeout=self.command_timeout, env={'GIT_TERMINAL_PROMPT' : '0'})
+        if not clone.succeeded():
+            self.log('ERROR - Failed to clone IOC template for {}, aborting: {}'.format(action.ioc_name, clone.describe()))
+            # Do not leave a partial clone behind, which would block generating the IOC again
+            if os.path.exists(ioc_path):
+                shutil.rmtree(ioc_path, onerror=remove_readonly)
+            return False
+
+        # The clone is not staged, so the output cannot discard it if generating the IOC fails
+        finished = False
+        try:
+            self.log('Generating IOC from ioc-template ({})'.format(template_url))
+            os.remove(initIOC_path_join(ioc_path, 'st.cmd'))
+            os.remove(initIOC_path_join(ioc_path, 'unique.cmd'))
+            os.remove(initIOC_path_join(ioc_path, 'envPaths'))
+            os.remove(initIOC_path_join(ioc_path, 'config'))
+            startup_scripts = initIOC_path_join(ioc_path, 'startupScripts')
+            self.genertate_st_cmd(action, executable_path, initIOC_path_join(startup_scripts, '{}St.cmd'.format(action.basename)))
+            self.generate_unique_cmd(action)
+            self.generate_env_paths(ioc_top_path, startup_scripts, ioc_path, action)
+
+            autosave_file_path = initIOC_path_join(ioc_path, 'autosaveFiles')
+            dep_file_path = initIOC_path_join(ioc_path, 'dependancyFiles')
+            for file in os.listdir(autosave_file_path):
+                if file.startswith(action.basename):
+                    shutil.copyfile(initIOC_path_join(autosave_file_path, file), initIOC_path_join(ioc_path, 'auto_settings.req'))
+            for file in os.listdir(dep_file_path):
+                if file.startswith('{}_'.format(action.basename)):
+                    target = initIOC_path_join(ioc_path, file[len(action.basename) + 1:])
+                    shutil.copyfile(initIOC_path_join(dep_file_path, file), target)
+                    self.fix_macros(target, action)
+
+            self.cleanup_template(action, ioc_path)
+            # Most files of the IOC were cloned or copied without the output, so the whole directory is counted
+            self.output.record_tree(ioc_path)
+            finished = True
+            return True
+        finally:
+            if not finished and os.path.exists(ioc_path):
+                shutil.rmtree(ioc_path, onerror=remove_readonly)
+
+
+    def fix_macros(self, file_path, action):
+        """
+        Function that replaces certain macros in given filepath (used primarily for substitution files)
+
+        Parameters
+        ----------
+        file_path : str
+            path to the target file
+        """
+
+        os.rename(file_path, file_path + '_OLD')
+        old = open(file_path+'_OLD', 'r')
+        contents = old.read()
+        contents = contents.replace('$(PREFIX)', action.ioc_prefix)
+        contents = contents.replace('$(PORT)', action.asyn_port)
+        new = open(file_path, 'w')
+        new.write(contents)
+        old.close()
+        new.close()
+        os.remove(file_path+'_OLD')
+
+
+    def cleanup_template(self, action, ioc_path):
+        """Function that removes the files of ioc-template that are only needed while generating the IOC
+
+        Parameters
+        ----------
+        action : IOCAction
+            action the IOC was generated for
+        ioc_path : str
+            path to the IOC cloned from the template
+        """
+
+        self.log('Performing cleanup for {}'.format(action.ioc_name))
+        for name in template_cleanup_paths:
+            path = initIOC_path_join(ioc_path, name)
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, onerror=remove_readonly)
+                elif os.path.lexists(path):
+                    os.remove(path)
+            except OSError as e:
+                self.log('WARNING - Could not remove template file {}: {}'.format(path, e))
+
+
+    def get_env_paths_changes(self, lines, new_lines):
+        """Function that lists the epicsEnvSet calls that differ between two envPaths files, by variable name
+
+        Returns
+        -------
+        changes : list of (str, str, str)
+            'envPaths', the old and the new call of each changed variable, an empty string if it is not set in one of them
+        """
+
+        def get_env_sets(env_lines):
+            env_sets = {}
+            for line in env_lines:
+                match = re.match(r'epicsEnvSet\("([^"]+)",', line)
+                if match is not None:
+                    env_sets[match.group(1)] = line.rstrip('\n')
+            return env_sets
+
+        old_sets, new_sets = get_env_sets(lines), get_env_sets(new_lines)
+        names = list(old_sets.keys()) + [name for name in new_sets.keys() if name not in old_sets]
+        return [('envPaths', old_sets.get(name, ''), new_sets.get(name, '')) for name in names if old_sets.get(name) != new_sets.get(name)]
+
+
+    def get_deployed_ioc_type(self, ioc_path):
+        """Function that reads the driver type of a generated IOC from the deployment info in its unique.cmd
+        """
+
+        with open(initIOC_path_join(ioc_path, 'unique.cmd'), 'r') as unique_fp:
+            for line in unique_fp:
+                match = re.match(r'# (\S+) IOC deployed using initIOC', line)
+                if match is not None:
+                    return match.group(1)
+        return None
+
+
+    def retarget_ioc(self, ioc_path, dry_run=False):
+        """Function that points an existing IOC at the bundle of this manager
+
+        Only the lines referencing the bundle are rewritten: the shebang or executable line and
+        library path in st.cmd, and the bundle location in the deployment info of unique.cmd. A
+        generated envPaths is generated again from the new bundle, for the architecture it was
+        generated for. If the new executable path is too long for a shebang, st.cmd is split into a
+        bash wrapper and st_base.cmd, as when generating the IOC. Links into the old iocBoot directory
+        are pointed at the new one. All new files are written before any of them replaces the
+        original, and each replacement is atomic.
+
+        Parameters
+        ----------
+        ioc_path : str
+            path to the IOC directory
+        dry_run : bool
+            if True, only collect the changes that would be made
+
+        Returns
+        -------
+        result : RetargetResult
+            changed lines, or the reason the IOC could not be retargeted
+        """
+
+        result = RetargetResult(ioc_path)
+        try:
+            result.ioc_type = self.get_deployed_ioc_type(ioc_path)
+        except OSError as e:
+            result.error = 'Could not read unique.cmd: {}'.format(e)
+            return result
+        if result.ioc_type is None:
+            result.error = 'Could not identify driver type from unique.cmd'
+            return result
+        # Keep the IOC on the build it was generated for
+        arch = self.read_env_paths_arch(initIOC_path_join(ioc_path, 'envPaths'))
+        ioc_top_path, executable_path, iocBoot_path = self.find_paths_for_action(result.ioc_type, arch)
+        if executable_path is None:
+            result.error = 'Could not find binary for {}{} in {}'.format(result.ioc_type, '' if arch is None else ' ({})'.format(arch), self.binary_location)
+            return result
+
+        if arch is None:
+            arch = self.get_architecture(result.ioc_type)
+        envPaths_lines = self.get_env_paths_text(ioc_top_path, arch).splitlines(True)
+
+        rewrites = []
+        for file in sorted(os.listdir(ioc_path)):
+            path = initIOC_path_join(ioc_path, file)
+            # initIOC only links envPaths and auto_settings.req into the bundle
+            if os.path.islink(path) and file in ['envPaths', 'auto_settings.req']:
+                old_target = os.readlink(path)
+                new_target = initIOC_path_join(iocBoot_path, os.path.basename(old_target))
+                if new_target != old_target and os.path.exists(new_target):
+                    result.changes.append((file, '-> {}'.format(old_target), '-> {}'.format(new_target)))
+                    rewrites.append((path, None, new_target))
+                continue
+            if file not in ['st.cmd', 'envPaths', 'unique.cmd']:
+                continue
+
+            with open(path, 'r') as fp:
+                lines = fp.readlines()
+            if file == 'envPaths':
+                new_lines = envPaths_lines
+                result.changes.extend(self.get_env_paths_changes(lines, new_lines))
+                if new_lines != lines:
+                    rewrites.append((path, new_lines, None))
+                continue
+
+            new_lines = []
+            split_st_cmd = False
+            for line in lines:
+                new_line = line
+                if file == 'unique.cmd':
+                    if line.startswith('# Initial target bundle location: '):
+                        new_line = '# Initial target bundle location: {}\n'.format(self.binary_location)
+                    elif line.startswith('# IOC generated from: ') and iocBoot_path is not None and 'ioc-template' not in line:
+                        new_line = '# IOC generated from: {}\n'.format(iocBoot_path)
+                elif line.startswith('#!') and line.strip() != '#!/bin/bash':
+                    if len(executable_path) > KERNEL_PATH_LIMIT:
+                        # Same as when generating, run the executable from a bash wrapper instead
+                        split_st_cmd = True
+                        new_line = '#!/bin/bash\n'
+                    else:
+                        new_line = '#!{}\n'.format(executable_path)
+                elif line.startswith(('export LD_LIBRARY_PATH=', 'SET "PATH=')):
+                    new_line = self.get_lib_path_str_for_type(result.ioc_type, arch) + '\n'
+                elif line.rstrip().endswith(' st_base.cmd'):
+                    new_line = '{} st_base.cmd\n'.format(executable_path)
+                if new_line != line:
+                    result.changes.append((file, line.rstrip('\n'), new_line.rstrip('\n')))
+                new_lines.append(new_line)
+
+            if split_st_cmd:
+                st_base_path = initIOC_path_join(ioc_path, 'st_base.cmd')
+                if os.path.lexists(st_base_path):
+                    result.error = 'Path to new executable exceeds legal bash shebang limit, and st_base.cmd already exists'
+                    return result
+                st_base_lines = new_lines[1:]
+                if len(st_base_lines) > 0 and st_base_lines[0].strip() == '':
+                    st_base_lines = st_base_lines[1:]
+                new_lines = self.get_st_wrapper_text('', executable_path).splitlines(True)
+                result.changes.append((file, '', '{} st_base.cmd'.format(executable_path)))
+                result.changes.append(('st_base.cmd', '', 'body of st.cmd after the shebang'))
+                if not dry_run:
+                    self.log('WARNING - Path to executable of {} exceeds legal bash shebang limit, splitting into st.cmd and st_base.cmd'.format(result.ioc_name))
+                # st_base.cmd is in place before st.cmd starts calling it
+                rewrites.append((st_base_path, st_base_lines, None))
+            if new_lines != lines:
+                rewrites.append((path, new_lines, None))
+
+        if dry_run or len(rewrites) == 0:
+            return result
+
+        temp_paths = []
+        try:
+            for path, new_lines, new_target in rewrites:
+                temp_path = '{}.{}.tmp'.format(path, os.getpid())
+                temp_paths.append(temp_path)
+                if new_target is not None:
+                    os.symlink(new_target, temp_path)
+                else:
+                    with open(temp_path, 'w') as fp:
+                        fp.writelines(new_lines)
+                    if os.path.exists(path):
+                        shutil.copymode(path, temp_path)
+            for (path, _, _), temp_path in zip(rewrites, temp_paths):
+                os.replace(temp_path, path)
+        except OSError as e:
+            for temp_path in temp_paths:
+                if os.path.lexists(temp_path):
+                    os.remove(temp_path)
+            result.error = 'Could not rewrite IOC files: {}'.format(e)
+        return result
+
+
+
+class IOCAction:
+    """Helper class that stores information and functions for each IOC in the CONFIGURE file
+
+    The epics environment of an IOC is layered, so that data identical for many IOCs is stored once.
+    Lookups go through the per-IOC environment, then the environment shared by all IOCs of the
+    same driver type (epicsEnvSet calls from the bundle st.cmd files), then the default channel
+    access environment. Assignments to epics_environment only ever modify the per-IOC layer.
+
+    A shared driver layer is frozen, as IOCs may be generated in parallel. An IOC whose bundle sets a
+    different value writes it into its own copy of the layer instead.
+
+    Attributes
+    ----------
+    ioc_type : str
+        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
+    ioc_name : str
+        name of the IOC ex. cam-ps1
+    ioc_prefix : str
+        Prefix used by the IOC
+    asyn_port : str
+        asyn port used for outputting NDArrays
+    ioc_port : str
+        telnet port on which procserver will run the IOC
+    connection : str
+        Value used to connect to the device ex. IP, serial num. etc.
+    arch : str
+        build architecture of the executable to use, None for the default of the bundle
+    connection_variable : str
+        environment variable set to connection in the IOC environment, see DriverRegistry
+    ioc_environment : dict
+        environment variables specific to this IOC
+    driver_environment : dict or MappingProxyType
+        environment variables of this driver type, frozen while shared with other IOCs
+    epics_environment : ChainMap
+        layered view of the full IOC environment
+    """
+
+    __slots__ = (
+        'ioc_type',
+        'basename',
+        'asyn_port',
+        'connection',
+        'ioc_prefix',
+        'ioc_port',
+        'ioc_name',
+        'arch',
+        'connection_variable',
+        'ioc_environment',
+        'driver_environment',
+        'epics_environment',
+    )
+
+    # These epics environment variables are set by the user for each IOC
+    user_entered_env = user_entered_env
+
+    # Variables written first to unique.cmd, in the order IOCs have always listed them
+    leading_environment = ('PORT', 'IOC') + tuple(default_ca_environment.keys())
+
+
+    def __init__(self, ioc, bl_prefix, driver_environment=None):
+        """Constructor for the IOCAction class
+        """
+
+        if driver_environment is None:
+            driver_environment = {}
+        self.ioc_environment    = {}
+        self.driver_environment = driver_environment
+        self.epics_environment  = ChainMap(self.ioc_environment, self.driver_environment, default_ca_environment)
+
+        self.ioc_type           = ioc['type']
+        self.basename           = self.ioc_type[2:].lower()
+
+        self.asyn_port          = ioc['asyn_port']
+        self.epics_environment['PORT']      = self.asyn_port
+        self.epics_environment['IOC']       = 'ioc{}'.format(self.ioc_type)
+        
+        self.connection         = ioc['connection']
+        
+        self.ioc_prefix         = ioc['device_prefix']
+        self.epics_environment['PREFIX']    = '{}{}'.format(bl_prefix, self.ioc_prefix)
+        self.epics_environment['CTPREFIX']  = '{}{}'.format(bl_prefix, self.ioc_prefix)
+        
+        self.ioc_port           = ioc['telnet_port']
+        self.ioc_name           = ioc['name']
+        self.epics_environment['IOCNAME'] = self.ioc_name
+        self.arch               = ioc.get('arch')
+        self.connection_variable = existing_connection_parameter.get(self.ioc_type)
+
+
+    def share_driver_environment(self, driver_environment):
+        """Function that replaces the driver environment layer with one shared by all IOCs of the same type
+
+        Parameters
+        ----------
+        driver_environment : MappingProxyType
+            frozen environment shared by IOCs of this driver type. Any variables already collected are merged
+            into a copy of it.
+        """
+
+        if driver_environment is not self.driver_environment:
+            if len(self.driver_environment) > 0:
+                merged = dict(driver_environment)
+                merged.update(self.driver_environment)
+                driver_environment = merged
+            self.set_driver_environment(driver_environment)
+
+
+    def set_driver_environment(self, driver_environment):
+        self.driver_environment = driver_environment
+        self.epics_environment.maps[1] = driver_environment
+
+
+    def freeze_driver_environment(self):
+        """Function that freezes the driver environment layer once collected, so that it can be shared
+
+        Returns
+        -------
+        driver_environment : MappingProxyType
+            read only view of the driver environment of this IOC
+        """
+
+        if not isinstance(self.driver_environment, MappingProxyType):
+            self.set_driver_environment(MappingProxyType(self.driver_environment))
+        return self.driver_environment
+
+
+    def environment_items(self):
+        """Function that returns environment variables in the order they should be written
+
+        The port, IOC and channel access defaults come first, followed by the other per-IOC variables,
+        then the driver environment in the order of the bundle startup scripts.
+
+        Returns
+        -------
+        items : list of (str, str)
+            environment variable names and values
+        """
+
+        env_vars = list(self.leading_environment)
+        env_vars.extend([env_var for env_var in self.ioc_environment if env_var not in env_vars and env_var not in self.driver_environment])
+        env_vars.extend([env_var for env_var in self.driver_environment if env_var not in env_vars])
+        return [(env_var, self.epics_environment[env_var]) for env_var in env_vars if env_var in self.epics_environment]
+
+
+    def add_to_environment(self, line):
+        line_s = line.strip()
+        line_s = re.sub('"', '', line_s)
+        line_s = re.sub('\t', '', line_s)
+        line_s = re.sub(' +', '', line_s)
+        line_s = re.sub('epicsEnvSet', '', line_s)
+        temp = line_s.split(',')
+        env_var = temp[0][1:]
+        if env_var not in self.user_entered_env:
+            # Values from the bundle are identical for all IOCs of this type, so they go in the shared layer
+            value = temp[1][:-1]
+            if self.driver_environment.get(env_var, None) != value:
+                if isinstance(self.driver_environment, MappingProxyType):
+                    self.set_driver_environment(dict(self.driver_environment))
+                self.driver_environment[env_var] = value
+            self.ioc_environment.pop(env_var, None)
+        # NA keeps the value from the bundle
+        if env_var == self.connection_variable and self.connection != 'NA':
+            self.ioc_environment[env_var] = self.connection
+
+
+
+class IOCResult:
+    """Class that stores the outcome of generating a single IOC
+
+    Attributes
+    ----------
+    ioc_name : str
+        name of the IOC
+    ioc_type : str
+        driver type of the IOC
+    hostname : str
+        IOC server the IOC is deployed on
+    status : str
+        one of 'created', 'skipped' (IOC already exists), 'locked' (another run is generating it), or 'failed'
+    executable_path : str
+        driver executable found in the bundle, None if not found
+    iocBoot_path : str
+        iocBoot directory the IOC was generated from, None if not found
+    messages : list of str
+        errors and warnings logged while generating the IOC
+    files : list of str
+        files and links written for the IOC, relative to its directory
+    bytes_written : int
+        total size of the files written for the IOC
+    durations : dict of str -> float
+        seconds spent in each completed phase: locate, generate, configure and write
+    """
+
+    def __init__(self, action):
+        self.ioc_name           = action.ioc_name
+        self.ioc_type           = action.ioc_type
+        self.hostname           = action.epics_environment.get('HOSTNAME')
+        self.status             = 'failed'
+        self.executable_path    = None
+        self.iocBoot_path       = None
+        self.messages           = []
+        self.files              = []
+        self.bytes_written      = 0
+        self.durations          = {}
+
+
+    def to_dict(self):
+        return {
+            'ioc_name' :        self.ioc_name,
+            'ioc_type' :        self.ioc_type,
+            'hostname' :        self.hostname,
+            'status' :          self.status,
+            'executable_path' : self.executable_path,
+            'iocBoot_path' :    self.iocBoot_path,
+            'messages' :        self.messages,
+            'warnings' :        [message for message in self.messages if message.startswith('WARNING')],
+            'files' :           self.files,
+            'bytes_written' :   self.bytes_written,
+            'durations' :       self.durations,
+        }
+
+
+class GenerationOptions:
+    """Class that stores options for a generation run, equivalent to the command line flags
+
+    Attributes
+    ----------
+    set_lib_path : bool
+        set library path before startup script is run (-p)
+    use_template : bool
+        generate IOCs from ioc-template (-t)
+    with_deps : bool
+        copy additional iocBoot files, False for minimal IOCs (-m)
+    use_links : bool
+        link helper files instead of copying them (-l)
+    output_archive : str
+        write IOCs into this tar archive instead of the IOC directory (--output-archive)
+    partition : bool
+        generate IOCs for each hostname separately and in parallel (--partition)
+    max_workers : int
+        maximum number of hostnames generated in parallel
+    config_cache : str
+        directory for cached validated configurations (--config-cache)
+    fsync : str
+        policy for syncing generated files to disk, one of fsync_policies (--fsync)
+    autosave : str
+        how auto_settings.req includes are resolved, one of autosave_modes, None to copy it as is (--autosave)
+    command_timeout : float
+        seconds an external command such as cloning ioc-template may run, None for default_command_timeout (--command-timeout)
+    shard : str
+        only generate the IOCs of this shard of the configuration, as K/N, None for all IOCs (--shard)
+    """
+
+    def __init__(self, set_lib_path=False, use_template=False, with_deps=True, use_links=False, output_archive=None, partition=False, max_workers=None, config_cache=None, fsync='none', autosave=None, command_timeout=None, shard=None):
+        self.set_lib_path   = set_lib_path
+        self.use_template   = use_template
+        self.with_deps      = with_deps
+        self.use_links      = use_links
+        self.output_archive = output_archive
+        self.partition      = partition
+        self.max_workers    = max_workers
+        self.config_cache   = config_cache
+        self.fsync          = fsync
+        self.autosave       = autosave
+        self.command_timeout = command_timeout
+        self.shard          = shard
+
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+class GenerationResult:
+    """Class that stores the outcome of a generation run
+
+    Attributes
+    ----------
+    configuration : dict
+        validated configuration that was generated
+    ioc_results : list of IOCResult
+        result for each IOC in the configuration
+    errors : list of str
+        errors that prevented generation from starting
+    duration : float
+        seconds the run took
+    bundle_scan : dict of str -> float
+        seconds spent scanning the bundle, and bundle cache hits and misses during the run
+    filesystem : dict of str -> dict
+        operations performed during the run, see LatencyFileSystem.get_stats. Empty for other backends
+    """
+
+    def __init__(self, configuration):
+        self.configuration  = configuration
+        self.ioc_results    = []
+        self.errors         = []
+        self.duration       = 0.0
+        self.bundle_scan    = {'scan_time' : 0.0, 'cache_hits' : 0, 'cache_misses' : 0}
+        self.filesystem     = {}
+
+
+    def with_status(self, status):
+        return [result for result in self.ioc_results if result.status == status]
+
+
+    @property
+    def success(self):
+        """True if the run started and no IOC failed. IOCs that already existed and were skipped, or that another
+        run was generating, are not failures
+        """
+
+        return len(self.errors) == 0 and len(self.with_status('failed')) == 0
+
+
+    def to_dict(self):
+        return {
+            'success' :     self.success,
+            'errors' :      self.errors,
+            'duration' :    self.duration,
+            'bundle_scan' : self.bundle_scan,
+            'filesystem' :  self.filesystem,
+            'iocs' :        [result.to_dict() for result in self.ioc_results],
+        }
+
+
+
+class RetargetResult:
+    """Class that stores the changes made when pointing an existing IOC at a new bundle
+
+    Attributes
+    ----------
+    ioc_path : str
+        path to the IOC directory
+    ioc_name : str
+        name of the IOC
+    ioc_type : str
+        driver type read from the IOC unique.cmd, None if it could not be identified
+    changes : list of (str, str, str)
+        file name, old line and new line of each change
+    error : str
+        reason the IOC could not be retargeted, None if it was
+    """
+
+    def __init__(self, ioc_path):
+        self.ioc_path   = ioc_path
+        self.ioc_name   = os.path.basename(ioc_path)
+        self.ioc_type   = None
+        self.changes    = []
+        self.error      = None
+
+
+
+#-------------------------------------------------
+#--------------- GENERATION SERVER ---------------
+#-------------------------------------------------
+
+
+class BundleIndexCache:
+    """Class that keeps a warm BundleIndex for each bundle location.
+
+    An index is rebuilt the next time it is requested after any directory it scanned has changed,
+    ex. when a driver in the bundle was rebuilt.
+
+    Attributes
+    ----------
+    indexes : dict of str -> BundleIndex
+        index for each bundle location
+    """
+
+    def __init__(self):
+        self.indexes    = {}
+        self.lock       = threading.Lock()
+
+
+    def get(self, binary_location):
+        """Returns an up to date index for the bundle at binary_location
+        """
+
+        with self.lock:
+            index = self.indexes.get(binary_location)
+            if index is None or index.is_stale():
+                index = BundleIndex(binary_location)
+                self.indexes[binary_location] = index
+            return index
+
+
+def get_default_socket_path():
+    return os.path.join(tempfile.gettempdir(), 'initIOC-{}.sock'.format(getpass.getuser()))
+
+
+def send_event(wfile, event):
+    """Writes a single newline delimited JSON event to a stream
+    """
+
+    wfile.write((json.dumps(event) + '\n').encode())
+    wfile.flush()
+
+
+class GenerationRequestHandler(socketserver.StreamRequestHandler):
+    """Handles one generation request on the server socket.
+
+    The request is a single line of JSON with 'config' and optional 'options' keys. Log messages are
+    streamed back as {"event": "log"} lines while the job runs on the server worker pool, followed by
+    a final {"event": "result"} line.
+    """
+
+    def handle(self):
+        write_lock = threading.Lock()
+
+        def send(event):
+            with write_lock:
+                try:
+                    send_event(self.wfile, event)
+                except OSError:
+                    # Client disconnected, the job still runs to completion
+                    pass
+
+        try:
+            request = json.loads(self.rfile.readline().decode())
+            config = request['config']
+            options = GenerationOptions(**request.get('options', {}))
+        except (ValueError, TypeError, KeyError) as e:
+            send({'event' : 'result', 'result' : {'success' : False, 'errors' : ['Invalid request: {}'.format(e)], 'iocs' : []}})
+            return
+
+        future = self.server.executor.submit(self.server.run_job, config, options, lambda text : send({'event' : 'log', 'message' : text}))
+        send({'event' : 'result', 'result' : future.result().to_dict()})
+
+
+# Unix domain sockets are not available on all platforms
+if hasattr(socketserver, 'UnixStreamServer'):
+
+    class GenerationServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """Long running server that generates IOCs for requests received over a Unix domain socket
+
+        Attributes
+        ----------
+        executor : concurrent.futures.ThreadPoolExecutor
+            worker pool that runs generation jobs
+        bundle_cache : BundleIndexCache
+            warm indexes of all bundles used by requests
+        """
+
+        daemon_threads = True
+
+
+        def __init__(self, socket_path, max_workers=None, log=None):
+            super().__init__(socket_path, GenerationRequestHandler)
+            os.chmod(socket_path, 0o600)
+            self.executor       = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+            self.bundle_cache   = BundleIndexCache()
+            if log is None:
+                log = initIOC_print
+            self.log            = log
+
+
+        def run_job(self, config, options, log):
+            """Runs a single generation job on a worker thread
+            """
+
+            bundle_index = None
+            if isinstance(config, dict) and 'bundle_location' in config:
+                bundle_index = self.bundle_cache.get(str(config['bundle_location']))
+            try:
+                result = generate(config, options, log=log, bundle_index=bundle_index)
+            except Exception as e:
+                result = GenerationResult(None)
+                result.errors.append('Generation failed: {}'.format(e))
+            self.log('Processed request: {} of {} IOCs created'.format(len(result.with_status('created')), len(result.ioc_results)))
+            return result
+
+
+        def server_close(self):
+            super().server_close()
+            self.executor.shutdown(wait=True)
+
+
+def run_server(socket_path, max_workers=None):
+    """Runs the generation server until interrupted
+
+    Parameters
+    ----------
+    socket_path : str
+        path of the Unix domain socket to listen on
+    max_workers : int
+        maximum number of generation jobs run at once
+    """
+
+    if not hasattr(socketserver, 'UnixStreamServer'):
+        initIOC_print('ERROR - Unix domain sockets are not supported on this platform.')
+        return False
+
+    if os.path.lexists(socket_path):
+        # Remove the socket left behind by a server that is no longer running, but never any other file
+        if not stat.S_ISSOCK(os.lstat(socket_path).st_mode):
+            initIOC_print('ERROR - {} exists and is not a socket.'.format(socket_path))
+            return False
+        try:
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+                client.connect(socket_path)
+            initIOC_print('ERROR - An initIOC server is already listening on {}'.format(socket_path))
+            return False
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+
+    def handle_sigterm(signum, frame):
+        raise KeyboardInterrupt
+
+    # Stop cleanly when stopped by a service manager
+    signal.signal(signal.SIGTERM, handle_sigterm)
+
+    # Only the user running the server may submit jobs, the socket is created without group or other permissions
+    old_umask = os.umask(0o077)
+    try:
+        server = GenerationServer(socket_path, max_workers=max_workers)
+    finally:
+        os.umask(old_umask)
+    initIOC_print('initIOC server listening on {}'.format(socket_path))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+    return True
+
+
+def submit_job(config, options, socket_path, log=None):
+    """Submits a generation job to a running server, and streams back its log
+
+    Parameters
+    ----------
+    config : dict
+        validated configuration. Relative paths should already be made absolute
+    options : GenerationOptions
+        generation options
+    socket_path : str
+        path of the server socket
+    log : callable
+        function called with each log message from the server
+
+    Returns
+    -------
+    result : dict
+        result of the job, see GenerationResult.to_dict
+    """
+
+    if log is None:
+        log = initIOC_print
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        with client.makefile('rwb') as stream:
+            send_event(stream, {'config' : config, 'options' : options.to_dict()})
+            for line in stream:
+                event = json.loads(line.decode())
+                if event['event'] == 'log':
+                    log(event['message'])
+                elif event['event'] == 'result':
+                    return event['result']
+    return {'success' : False, 'errors' : ['Server closed the connection before the job finished'], 'iocs' : []}
+
+
+#-------------------------------------------------
+#----------------- BUNDLE WATCHER ----------------
+#-------------------------------------------------
+
+# inotify events reported for watched directories: IN_MODIFY, IN_ATTRIB, IN_CLOSE_WRITE, IN_MOVED_FROM,
+# IN_MOVED_TO, IN_CREATE, IN_DELETE, IN_DELETE_SELF and IN_MOVE_SELF
+inotify_watch_mask = 0x2 | 0x4 | 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+inotify_queue_overflow = 0x4000
+# wd, mask, cookie and name length of struct inotify_event, followed by the name
+inotify_event_header = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """Class that waits for changes in a set of directories using inotify.
+
+    The process sleeps in the kernel until a change is reported, so no CPU is used while idle.
+
+    Attributes
+    ----------
+    fd : int
+        inotify file descriptor
+    watches : dict of int -> str
+        watched directory for each watch descriptor
+    """
+
+    def __init__(self, paths):
+        self.fd = inotify_libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.watches = {}
+        for path in paths:
+            wd = inotify_libc.inotify_add_watch(self.fd, os.fsencode(path), inotify_watch_mask)
+            if wd >= 0:
+                self.watches[wd] = path
+
+
+    def wait(self, timeout=None):
+        """Waits for changes in the watched directories
+
+        Parameters
+        ----------
+        timeout : float
+            maximum time to wait in seconds, wait indefinitely if None
+
+        Returns
+        -------
+        changed : set of str
+            changed files and directories, empty if none changed before the timeout
+        """
+
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if len(readable) == 0:
+            return set()
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset + inotify_event_header.size <= len(data):
+            wd, mask, _, length = inotify_event_header.unpack_from(data, offset)
+            offset = offset + inotify_event_header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset = offset + length
+            if mask & inotify_queue_overflow:
+                # Events were dropped, so assume everything changed
+                changed.update(self.watches.values())
+            elif wd in self.watches:
+                if len(name) > 0:
+                    changed.add(os.path.join(self.watches[wd], os.fsdecode(name)))
+                else:
+                    changed.add(self.watches[wd])
+        return changed
+
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """Class that waits for changes in a set of directories by periodically comparing their contents.
+
+    Used where inotify is not available, ex. on Windows and macOS.
+
+    Attributes
+    ----------
+    paths : list of str
+        watched directories
+    interval : float
+        time between polls in seconds
+    snapshot : dict of str -> tuple
+        modification time and size of each watched directory and of its entries at the last poll
+    """
+
+    def __init__(self, paths, interval=2.0):
+        self.paths      = list(paths)
+        self.interval   = interval
+        self.snapshot   = self.take_snapshot()
+
+
+    def take_snapshot(self):
+        snapshot = {}
+        for path in self.paths:
+            try:
+                snapshot[path] = (os.stat(path).st_mtime_ns, None)
+                with os.scandir(path) as it:
+                    for entry in it:
+                        try:
+                            stat = entry.stat(follow_symlinks=False)
+                            snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+                        except OSError:
+                            pass
+            except OSError:
+                snapshot[path] = None
+        return snapshot
+
+
+    def wait(self, timeout=None):
+        """Waits for changes in the watched directories, see InotifyWatcher.wait()
+        """
+
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while True:
+            snapshot = self.take_snapshot()
+            changed = set([path for path in set(snapshot) | set(self.snapshot) if snapshot.get(path) != self.snapshot.get(path)])
+            self.snapshot = snapshot
+            if len(changed) > 0:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+            else:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return changed
+                time.sleep(min(self.interval, remaining))
+
+
+    def close(self):
+        pass
+
+
+def create_directory_watcher(paths, poll_interval=2.0, use_polling=False):
+    """Creates an inotify based watcher for the given directories if possible, and a polling one otherwise
+    """
 
-        # First, clone the template:
-        out = subprocess.call(["git", "clone", "--quiet", "https://github.com/epicsNSLS2-deploy/ioc-template", ioc_path])
-        if out != 0:
-            initIOC_print('ERROR - Failed to clone IOC template, aborting...')
-        else:
-            initIOC_print('Generating IOC from ioc-template (https://github.com/epicsNSLS2-deploy/ioc-temlpate)')
-            os.remove(initIOC_path_join(ioc_path, 'st.cmd'))
-            os.remove(initIOC_path_join(ioc_path, 'unique.cmd'))
-            os.remove(initIOC_path_join(ioc_path, 'envPaths'))
-            os.remove(initIOC_path_join(ioc_path, 'config'))
-            startup_scripts = initIOC_path_join(ioc_path, 'startupScripts')
-            self.genertate_st_cmd(action, executable_path, initIOC_path_join(startup_scripts, '{}St.cmd'.format(action.basename)))
-            self.generate_unique_cmd(action)
-            self.generate_env_paths(ioc_path, action)
-            
-            autosave_file_path = initIOC_path_join(ioc_path, 'autosaveFiles')
-            dep_file_path = initIOC_path_join(ioc_path, 'dependancyFiles')
-            for file in os.listdir(autosave_file_path):
-                if file.startswith(action.basename):
-                    shutil.copyfile(initIOC_path_join(autosave_file_path, file), initIOC_path_join(ioc_path, 'auto_settings.req'))
-            for file in os.listdir(dep_file_path):
-                if file.startswith(action.basename):
-                    shutil.copyfile(initIOC_path_join(dep_file_path, file), initIOC_path_join(ioc_path, file.split('{}_'.format(action.basename))))
-                    self.fix_macros(initIOC_path_join(ioc_path, file.split('{}_'.format(action.basename))), action)
+    if WITH_INOTIFY and platform.startswith('linux') and not use_polling:
+        try:
+            return InotifyWatcher(paths)
+        except OSError:
+            pass
+    return PollingWatcher(paths, poll_interval)
 
-            self.cleanup_template(action, ioc_path)
 
+class BundleWatcher:
+    """Class that regenerates the IOCs of a configuration when the bundle they depend on changes.
 
-    def fix_macros(self, file_path, action):
+    Changed paths are mapped to driver types through the bundle index, and only IOCs of those
+    types are regenerated. Each IOC is generated into a staging directory first, and swapped
+    in place of the existing IOC once complete, keeping its autosave directory.
+
+    Attributes
+    ----------
+    configuration : dict
+        validated configuration of the watched IOCs
+    options : GenerationOptions
+        options used to regenerate IOCs
+    debounce : float
+        seconds without further changes to wait for before regenerating, so that a rebuild is handled once
+    bundle_index : BundleIndex
+        index of the bundle, rebuilt after every change
+    watcher : InotifyWatcher or PollingWatcher
+        watcher for the bundle directories the IOCs are generated from
+    """
+
+    def __init__(self, configuration, options=None, log=None, debounce=2.0, poll_interval=2.0, use_polling=False):
+        if options is None:
+            options = GenerationOptions()
+        if log is None:
+            log = discard_log
+        self.configuration  = configuration
+        self.options        = options
+        self.log            = log
+        self.debounce       = debounce
+        self.poll_interval  = poll_interval
+        self.use_polling    = use_polling
+        self.ioc_types      = set([ioc['type'] for ioc in configuration['iocs']])
+        self.bundle_index   = BundleIndex(configuration['bundle_location'])
+        self.watcher        = None
+        self.watch()
+
+
+    def watch(self):
+        """Starts watching the directories of the current bundle index
         """
-        Function that replaces certain macros in given filepath (used primarily for substitution files)
+
+        if self.watcher is not None:
+            self.watcher.close()
+        watch_paths = self.bundle_index.get_watch_paths(self.ioc_types)
+        self.watcher = create_directory_watcher(watch_paths, self.poll_interval, self.use_polling)
+
+
+    def wait_for_changes(self, timeout=None):
+        """Waits for a change in the bundle, and collects further changes until the bundle is quiet
+
+        Returns
+        -------
+        changed : set of str
+            changed paths, empty if nothing changed before the timeout
+        """
+
+        changed = self.watcher.wait(timeout)
+        if len(changed) == 0:
+            return changed
+        # Do not wait forever for a bundle that keeps changing
+        deadline = time.monotonic() + 10 * self.debounce
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            more = self.watcher.wait(min(self.debounce, remaining))
+            if len(more) == 0:
+                break
+            changed.update(more)
+        return changed
+
+
+    def get_affected_iocs(self, changed):
+        """Returns the IOC entries of the configuration that depend on any of the changed paths
+        """
+
+        ioc_types = set()
+        for path in changed:
+            ioc_types.update(self.bundle_index.get_dependent_ioc_types(path))
+        return [ioc for ioc in self.configuration['iocs'] if ioc['type'] in ioc_types]
+
+
+    def regenerate(self, iocs):
+        """Regenerates IOCs from a fresh scan of the bundle
 
         Parameters
         ----------
-        file_path : str
-            path to the target file
+        iocs : list of dict
+            IOC entries of the configuration to regenerate
+
+        Returns
+        -------
+        results : list of IOCResult
+            result of regenerating each IOC of this shard, 'locked' if another run is generating it
         """
 
-        os.rename(file_path, file_path + '_OLD')
-        old = open(file_path+'_OLD', 'r')
-        contents = old.read()
-        contents = contents.replace('$(PREFIX)', action.ioc_prefix)
-        contents = contents.replace('$(PORT)', action.asyn_port)
-        new = open(file_path, 'w')
-        new.write(contents)
-        old.close()
-        new.close()
-        os.remove(file_path+'_OLD')
+        self.bundle_index = BundleIndex(self.configuration['bundle_location'])
+        configuration = dict(self.configuration)
+        configuration['iocs'] = iocs
+        actions = create_actions(configuration)
+        if self.options.shard is not None:
+            # The watchers of the other shards regenerate their own IOCs
+            actions = select_shard(actions, *parse_shard(self.options.shard))
+        ioc_tops = []
+        for action in actions:
+            ioc_top = self.configuration['ioc_dir']
+            if self.options.partition:
+                ioc_top = initIOC_path_join(ioc_top, action.epics_environment['HOSTNAME'])
+            ioc_tops.append(ioc_top)
+
+        existing = [initIOC_path_join(ioc_top, action.ioc_name) for action, ioc_top in zip(actions, ioc_tops)]
+        existing = [ioc_path for ioc_path in existing if os.path.isdir(ioc_path)]
+        if len(existing) > 0:
+            name = SnapshotStore(self.configuration['ioc_dir']).create(existing, 'watch')
+            self.log('Saved snapshot {} of IOCs to be regenerated.'.format(name))
+
+        managers = {}
+        results = []
+        config_text = dump_ioc_config(self.configuration)
+        for action, ioc_top in zip(actions, ioc_tops):
+            # The lock is taken next to the IOC itself, where other runs generating it, ex. shards, look for it
+            os.makedirs(ioc_top, exist_ok=True)
+            lock = IOCLock(ioc_top, action.ioc_name)
+            if not lock.acquire():
+                holder = lock.holder or {}
+                self.log('IOC {} is being generated by process {} on {}, leaving it to that run.'.format(action.ioc_name, holder.get('pid'), holder.get('host')))
+                result = IOCResult(action)
+                result.status = 'locked'
+                results.append(result)
+                continue
+            try:
+                staging_top = initIOC_path_join(ioc_top, '.initIOC-regenerate')
+                if staging_top not in managers:
+                    shutil.rmtree(staging_top, ignore_errors=True)
+                    managers[staging_top] = IOCActionManager(staging_top, self.configuration['bundle_location'], self.options.set_lib_path, self.options.use_template, self.options.with_deps, self.options.use_links, output=DiskOutput(self.options.fsync), bundle_index=self.bundle_index, log=self.log, autosave=self.options.autosave, command_timeout=self.options.command_timeout)
+                    managers[staging_top].config_text = config_text
+                manager = managers[staging_top]
+                result = manager.process_action(action)
+                if result.status == 'created':
+                    self.replace_ioc(initIOC_path_join(staging_top, action.ioc_name), initIOC_path_join(ioc_top, action.ioc_name))
+                    self.log('Regenerated IOC {}.'.format(action.ioc_name))
+            finally:
+                lock.release()
+            results.append(result)
+        for staging_top in managers.keys():
+            shutil.rmtree(staging_top, ignore_errors=True)
+
+        # Directories may have been replaced by the rebuild, so watch them again
+        self.watch()
+        return results
+
+
+    def replace_ioc(self, staged_path, ioc_path):
+        """Moves a regenerated IOC in place of the existing one, keeping its autosave directory.
+
+        The autosave files are copied before the swap, so the IOC is only missing between renaming the old
+        one aside and renaming the new one in. The old IOC is removed afterwards.
+        """
 
+        autosave_path = initIOC_path_join(ioc_path, 'autosave')
+        if os.path.isdir(autosave_path):
+            staged_autosave_path = initIOC_path_join(staged_path, 'autosave')
+            shutil.rmtree(staged_autosave_path, ignore_errors=True)
+            shutil.copytree(autosave_path, staged_autosave_path, symlinks=True)
+        old_path = staged_path + '.old'
+        if os.path.lexists(ioc_path):
+            os.rename(ioc_path, old_path)
+        os.rename(staged_path, ioc_path)
+        shutil.rmtree(old_path, ignore_errors=True)
 
-    def cleanup_template(self, action, ioc_path):
 
-        initIOC_print('Performing cleanup for {}'.format(action.ioc_name))
+    def run(self, stop_event=None):
+        """Regenerates affected IOCs after every change to the bundle, until interrupted or stop_event is set
+        """
+
+        self.log('Watching bundle {} for changes, press Ctrl+C to stop...'.format(self.configuration['bundle_location']))
+        # Without a stop event, block until a change is reported
+        timeout = None
+        if stop_event is not None:
+            timeout = 1.0
         try:
-            if platform == "win32":
-                cleanup_script = initIOC_path_join(ioc_path, 'cleanup.bat')
-                _ = subprocess.call([cleanup_script])
-            else:
-                cleanup_script = initIOC_path_join(ioc_path, 'cleanup.sh')
-                _ = subprocess.call(['bash', cleanup_script])
+            while stop_event is None or not stop_event.is_set():
+                changed = self.wait_for_changes(timeout)
+                if len(changed) == 0:
+                    continue
+                iocs = self.get_affected_iocs(changed)
+                if len(iocs) == 0:
+                    continue
+                self.log('Bundle changed, regenerating IOCs: {}'.format(', '.join([ioc['name'] for ioc in iocs])))
+                self.regenerate(iocs)
+        finally:
+            self.watcher.close()
 
-            os.remove(cleanup_script)
-        except:
+
+#-------------------------------------------------
+#------------ STARTUP SCRIPT VERIFIER ------------
+#-------------------------------------------------
+
+# iocsh commands that load a file given as their first argument
+verified_file_commands = ['dbLoadDatabase', 'dbLoadRecords', 'dbLoadTemplate']
+# autosave commands that load a request file given as their first argument
+verified_request_commands = ['create_monitor_set', 'create_triggered_set', 'create_periodic_set', 'create_manual_set']
+# Maximum depth of nested '< file' includes, to stop include loops
+max_include_depth = 16
+
+
+def expand_macros(text, environment):
+    """Expands $(VAR), ${VAR} and $(VAR=default) macros as the IOC shell would
+
+    Returns
+    -------
+    expanded : str
+        text with all defined macros expanded
+    undefined : list of str
+        names of macros that are not defined
+    """
+
+    undefined = []
+    def replace(match):
+        name, default = match.group(1) or match.group(3), match.group(2) or match.group(4)
+        if name in environment:
+            return environment[name]
+        elif default is not None:
+            return default[1:]
+        undefined.append(name)
+        return match.group(0)
+
+    # Values may contain macros themselves, so expand until nothing changes
+    for _ in range(max_include_depth):
+        undefined.clear()
+        expanded = re.sub(r'\$\((\w+)(=[^)]*)?\)|\$\{(\w+)(=[^}]*)?\}', replace, text)
+        if expanded == text:
+            break
+        text = expanded
+    return text, undefined
+
+
+def parse_iocsh_command(line):
+    """Splits an IOC shell line into the command name and its arguments, with quotes removed
+
+    Returns
+    -------
+    command : str
+        name of the command, None if the line is blank or only holds empty quotes
+    args : list of str
+        arguments of the command
+    """
+
+    line = line.strip()
+    match = re.match(r'(\w+)\s*\((.*)\)\s*$', line)
+    if match is not None:
+        command, args = match.group(1), match.group(2)
+        args = [arg.strip() for arg in next(csv.reader([args], skipinitialspace=True))] if len(args.strip()) > 0 else []
+    else:
+        try:
+            parts = shlex.split(line)
+        except ValueError:
+            parts = line.split()
+        if len(parts) == 0 or len(parts[0]) == 0:
+            return None, []
+        command, args = parts[0], parts[1:]
+    return command, args
+
+
+class StartupVerifier:
+    """Class that statically checks the startup scripts of generated IOCs for references to missing files.
+
+    The scripts are read as the IOC shell would run them. Macros are expanded using every
+    epicsEnvSet seen so far, including those in the included envPaths and unique.cmd, and each
+    '< file', dbLoadDatabase, dbLoadRecords, dbLoadTemplate, set_requestfile_path and autosave
+    request file is resolved. Lookups inside a bundle go through a bundle index, shared by all
+    IOCs generated from that bundle, so each bundle directory is listed only once per run.
+
+    Attributes
+    ----------
+    indexes : dict of str -> BundleIndex
+        index of each bundle referenced by BINARY_TOP in the verified IOCs
+    """
+
+    def __init__(self):
+        self.indexes    = {}
+        self.lock       = threading.Lock()
+
+
+    def get_index(self, binary_location):
+        with self.lock:
+            if binary_location not in self.indexes:
+                self.indexes[binary_location] = BundleIndex(binary_location)
+            return self.indexes[binary_location]
+
+
+    def get_bundle_location(self, ioc_path):
+        """Reads BINARY_TOP from the envPaths of an IOC, None if it cannot be found
+        """
+
+        try:
+            with open(initIOC_path_join(ioc_path, 'envPaths'), 'r') as envPaths_fp:
+                for line in envPaths_fp:
+                    command, args = parse_iocsh_command(line)
+                    if command == 'epicsEnvSet' and len(args) > 1 and args[0] == 'BINARY_TOP':
+                        return args[1]
+        except OSError:
             pass
+        return None
 
 
-class IOCAction:
-    """Helper class that stores information and functions for each IOC in the CONFIGURE file
+    def verify_ioc(self, ioc_path):
+        """Checks all files referenced by the startup scripts of an IOC
+
+        Returns
+        -------
+        problems : list of str
+            description of each missing file or undefined macro, with the script and line it is referenced on
+        """
+
+        problems, _ = self.run_scripts(ioc_path)
+        return problems
+
+
+    def run_scripts(self, ioc_path, index=None):
+        """Reads the startup scripts of an IOC as the IOC shell would run them
+
+        Parameters
+        ----------
+        ioc_path : str
+            path to the IOC, containing st.cmd
+        index : BundleIndex
+            index of the bundle the IOC uses, found from BINARY_TOP in envPaths if None
+
+        Returns
+        -------
+        problems : list of str
+            description of each missing file or undefined macro
+        state : dict
+            environment, request file paths and set_requestfile_path locations collected from the scripts, None if
+            the bundle could not be found
+        """
+
+        problems = []
+        if index is None:
+            bundle_location = self.get_bundle_location(ioc_path)
+            if bundle_location is None:
+                return ['envPaths: could not find BINARY_TOP'], None
+            index = self.get_index(bundle_location)
+        state = {
+            'index' :               index,
+            'ioc_path' :            ioc_path,
+            'environment' :         {},
+            'cwd' :                 ioc_path,
+            'request_paths' :       [],
+            'request_path_lines' :  [],
+        }
+        self.verify_script(initIOC_path_join(ioc_path, 'st.cmd'), state, problems, 0)
+        return problems, state
+
+
+    def resolve(self, file, state, search_paths):
+        """Returns the path file refers to, searching the current directory and search_paths for relative paths
+        """
+
+        if os.path.isabs(file):
+            return file
+        for directory in [state['cwd']] + search_paths:
+            path = os.path.join(directory, file)
+            if state['index'].path_exists(path):
+                return path
+        return os.path.join(state['cwd'], file)
+
+
+    def verify_script(self, script_path, state, problems, depth):
+        index = state['index']
+        script = os.path.relpath(script_path, state['ioc_path'])
+        try:
+            lines = index.read_lines(script_path)
+        except OSError:
+            problems.append('{}: could not be read'.format(script))
+            return
+
+        for line_number, line in enumerate(lines, 1):
+            location = '{}:{}'.format(script, line_number)
+            stripped = line.strip()
+            if stripped.startswith('#!'):
+                # Either the IOC executable or the shell running it
+                if not stripped.startswith('#!/bin/') and not index.path_exists(stripped[2:]):
+                    problems.append('{}: executable not found: {}'.format(location, stripped[2:]))
+                continue
+            if len(stripped) == 0 or stripped.startswith('#'):
+                continue
+
+            expanded, undefined = expand_macros(stripped, state['environment'])
+            if expanded.startswith('<'):
+                include = expanded[1:].strip()
+                if len(undefined) > 0:
+                    problems.append('{}: undefined macro $({}) in {}'.format(location, undefined[0], include))
+                    continue
+                include_path = self.resolve(include, state, [])
+                if not index.path_exists(include_path):
+                    problems.append('{}: included file not found: {}'.format(location, include_path))
+                elif depth < max_include_depth:
+                    self.verify_script(include_path, state, problems, depth + 1)
+                continue
+
+            command, args = parse_iocsh_command(expanded)
+            if command is None:
+                # ex. a line that only held a macro expanding to nothing
+                continue
+            if command == 'epicsEnvSet' and len(args) > 1:
+                state['environment'][args[0]] = args[1]
+            elif command == 'cd' and len(args) > 0:
+                state['cwd'] = os.path.join(state['cwd'], args[0])
+            elif expanded.endswith(' st_base.cmd'):
+                # st.cmd that sets the library path first, then runs the executable with st_base.cmd
+                executable_path = expanded[:-len(' st_base.cmd')].strip()
+                if not index.path_exists(executable_path):
+                    problems.append('{}: executable not found: {}'.format(location, executable_path))
+                if depth < max_include_depth:
+                    self.verify_script(initIOC_path_join(os.path.dirname(script_path), 'st_base.cmd'), state, problems, depth + 1)
+            elif command in verified_file_commands + verified_request_commands + ['set_requestfile_path'] and len(args) > 0:
+                if len(undefined) > 0:
+                    problems.append('{}: undefined macro $({}) in {}'.format(location, undefined[0], command))
+                elif command == 'set_requestfile_path':
+                    request_path = os.path.join(args[0], *args[1:2])
+                    if not index.path_exists(os.path.join(state['cwd'], request_path)):
+                        problems.append('{}: request file directory not found: {}'.format(location, request_path))
+                    state['request_paths'].append(os.path.join(state['cwd'], request_path))
+                    state['request_path_lines'].append((script_path, line_number, state['request_paths'][-1]))
+                elif command in verified_request_commands:
+                    path = self.resolve(args[0], state, state['request_paths'])
+                    if not index.path_exists(path):
+                        problems.append('{}: request file not found: {}'.format(location, args[0]))
+                else:
+                    include_paths = [path for path in state['environment'].get('EPICS_DB_INCLUDE_PATH', '').split(os.pathsep) if len(path) > 0]
+                    path = self.resolve(args[0], state, include_paths)
+                    if not index.path_exists(path):
+                        problems.append('{}: {} file not found: {}'.format(location, command, args[0]))
+
+
+def verify_iocs(ioc_top, max_workers=None, log=None):
+    """Verifies the startup scripts of all IOCs under ioc_top in parallel
+
+    Parameters
+    ----------
+    ioc_top : str
+        IOC top directory, IOCs in per-hostname directories are included
+    max_workers : int
+        maximum number of IOCs verified in parallel
+    log : callable
+        function called with each log message, defaults to initIOC_print
+
+    Returns
+    -------
+    problems : dict of str -> list of str
+        problems found for each IOC path, empty for IOCs that passed
+    """
+
+    if log is None:
+        log = initIOC_print
+    ioc_paths = find_existing_iocs(ioc_top)
+    if len(ioc_paths) == 0:
+        log('No IOCs found in {}.'.format(ioc_top))
+        return {}
+
+    verifier = StartupVerifier()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        problems = dict(zip(ioc_paths, executor.map(verifier.verify_ioc, ioc_paths)))
+
+    log('Startup script verification for {}:\n+{}'.format(ioc_top, '-' * 50))
+    for ioc_path, ioc_problems in problems.items():
+        if len(ioc_problems) == 0:
+            log('+ {:<24} - OK'.format(os.path.relpath(ioc_path, ioc_top)))
+        else:
+            log('+ {:<24} - {} problem(s)'.format(os.path.relpath(ioc_path, ioc_top), len(ioc_problems)))
+            for problem in ioc_problems:
+                log('|   {}'.format(problem))
+    log('')
+    return problems
+
+
+#-------------------------------------------------
+#------- AUTOSAVE REQUEST FILE RESOLUTION --------
+#-------------------------------------------------
+
+
+# Ways of handling the includes of auto_settings.req at generation time
+autosave_modes = ['check', 'flatten', 'prune']
+
+
+def substitute_request_macros(text, macros):
+    """Substitutes the macros defined by autosave 'file' includes once.
+
+    Undefined macros, such as those passed to create_monitor_set, are kept for autosave to expand at runtime.
+    """
+
+    def replace(match):
+        return macros.get(match.group(1) or match.group(3), match.group(0))
+
+    return re.sub(r'\$\((\w+)(=[^)]*)?\)|\$\{(\w+)(=[^}]*)?\}', replace, text)
+
+
+def parse_request_include(line):
+    """Splits an autosave 'file name macros' include into the file name and its macros
+
+    Returns
+    -------
+    include : tuple of str, dict
+        included file name and macro definitions, None if the line is not an include
+    """
+
+    match = re.match(r'file\s+(?:"([^"]*)"|(\S+))\s*(.*)$', line)
+    if match is None:
+        return None
+    macros = {}
+    for definition in match.group(3).split(','):
+        if '=' in definition:
+            name, value = definition.split('=', 1)
+            macros[name.strip()] = value.strip().strip('"')
+    return match.group(1) if match.group(1) is not None else match.group(2), macros
+
+
+class RequestFileResolver:
+    """Class that resolves the include tree of an autosave request file once, at generation time.
+
+    Autosave searches every set_requestfile_path directory for each included file when the IOC boots.
+    The same search is done here against the bundle index, so that missing files are reported before
+    deployment, and the request file can be flattened into a single file.
 
     Attributes
     ----------
-    ioc_type : str
-        name of areaDetector driver instance the IOC is linked to ex. ADProsilica
-    ioc_name : str
-        name of the IOC ex. cam-ps1
-    ioc_prefix : str
-        Prefix used by the IOC
-    asyn_port : str
-        asyn port used for outputting NDArrays
-    ioc_port : str
-        telnet port on which procserver will run the IOC
-    connection : str
-        Value used to connect to the device ex. IP, serial num. etc.
+    index : BundleIndex
+        index used to look up and read request files inside the bundle
+    search_paths : list of str
+        directories searched for included files, in order
+    used_paths : set of str
+        search paths that supplied at least one included file
+    unresolved : list of tuple of str
+        name of each include that could not be found, and the file including it
     """
 
+    def __init__(self, index, search_paths):
+        self.index          = index
+        self.search_paths   = [os.path.normpath(path) for path in search_paths]
+        self.used_paths     = set()
+        self.unresolved     = []
 
-    def __init__(self, ioc, bl_prefix):
-        """Constructor for the IOCAction class
+
+    def find(self, name):
+        """Returns the first search path containing name and the path of the file, or None, None
         """
 
-        self.epics_environment  = {}
-        self.ioc_type           = ioc['type']
-        self.basename           = self.ioc_type[2:].lower()
+        for directory in self.search_paths:
+            path = os.path.join(directory, name)
+            if self.index.path_exists(path):
+                return directory, path
+        return None, None
 
-        # These epics environment variables are set by the user for each IOC
-        self.user_entered_env = ['ENGINEER', 'PORT', 'IOC', 'CAM-CONNECT', 'PREFIX', 'CTPREFIX', 'HOSTNAME', 'IOCNAME']
-        
-        self.asyn_port          = ioc['asyn_port']
-        self.epics_environment['PORT']      = self.asyn_port
-        self.epics_environment['IOC']       = 'ioc{}'.format(self.ioc_type)
-        self.epics_environment['EPICS_CA_AUTO_ADDR_LIST']   = 'NO'
-        self.epics_environment['EPICS_CA_ADDR_LIST']        = "NA"
-        self.epics_environment['EPICS_CA_MAX_ARRAY_BYTES']  = "6000000" 
-        
-        self.connection         = ioc['connection']
-        
-        self.ioc_prefix         = ioc['device_prefix']
-        self.epics_environment['PREFIX']    = '{}{}'.format(bl_prefix, self.ioc_prefix)
-        self.epics_environment['CTPREFIX']  = '{}{}'.format(bl_prefix, self.ioc_prefix)
-        
-        self.ioc_port           = ioc['telnet_port']
-        self.ioc_name           = ioc['name']
-        self.epics_environment['IOCNAME'] = self.ioc_name
 
+    def flatten(self, path, macros=None, depth=0):
+        """Reads a request file, replacing each resolved include with the lines of the included file
+
+        Parameters
+        ----------
+        path : str
+            path to the request file
+        macros : dict of str -> str
+            macros defined by the includes leading to this file
+        depth : int
+            include nesting depth, includes deeper than max_include_depth are left unresolved
+
+        Returns
+        -------
+        lines : list of str
+            PV names, and the includes that could not be resolved
+        """
+
+        if macros is None:
+            macros = {}
+        lines = []
+        for line in self.index.read_lines(path):
+            stripped = line.strip()
+            if len(stripped) == 0 or stripped.startswith('#'):
+                continue
+            stripped = substitute_request_macros(stripped, macros)
+            include = parse_request_include(stripped)
+            if include is None:
+                lines.append(stripped)
+                continue
+
+            name, include_macros = include
+            directory, include_path = self.find(name)
+            if include_path is None or depth >= max_include_depth:
+                self.unresolved.append((name, os.path.basename(path)))
+                # Kept, so that autosave can still search for it at runtime
+                lines.append(stripped)
+                continue
+            self.used_paths.add(directory)
+            child_macros = dict(macros)
+            child_macros.update(include_macros)
+            lines.extend(self.flatten(include_path, child_macros, depth + 1))
+        return lines
+
+
+#-------------------------------------------------
+#-------------- BOOT TIME BENCHMARK --------------
+#-------------------------------------------------
+
+
+# Generation options compared by the boot time benchmark, see GenerationOptions
+boot_benchmark_modes = {
+    'shebang' :     {},
+    'lib-path' :    {'set_lib_path' : True},
+    'minimal' :     {'with_deps' : False},
+    'links' :       {'use_links' : True},
+}
+
+# Percentiles of the time to iocInit reported for each mode
+boot_benchmark_percentiles = [50, 90, 99]
+
+# File marking a boot benchmark directory, which may be replaced by the next benchmark
+boot_benchmark_marker = '.initIOC-benchmark'
+
+# Stub IOC executable written into the synthetic bundle, after a shebang line running this python interpreter.
+# It interprets the iocsh script it is given, following < includes and epicsEnvSet, and prints when it reached iocInit
+stub_ioc_source = r'''# Stub IOC executable generated by initIOC for boot time benchmarks
+import json
+import os
+import re
+import sys
+import time
+
+start = time.time()
+counts = {'commands' : 0, 'includes' : 0}
+missing = []
+
+
+def expand(text):
+    return re.sub(r'\$\(([^)=]+)\)', lambda match : os.environ.get(match.group(1), match.group(0)), text)
+
+
+def run(path):
+    with open(path, 'r') as script_fp:
+        lines = script_fp.readlines()
+    for line in lines:
+        line = line.strip()
+        if len(line) == 0 or line.startswith('#'):
+            continue
+        counts['commands'] = counts['commands'] + 1
+        if line.startswith('<'):
+            include = expand(line[1:].strip())
+            if not os.path.isfile(include):
+                missing.append(include)
+                continue
+            counts['includes'] = counts['includes'] + 1
+            if run(include):
+                return True
+        elif line.startswith('epicsEnvSet'):
+            args = re.findall(r'"([^"]*)"', line)
+            if len(args) == 2:
+                os.environ[args[0]] = expand(args[1])
+        elif line.startswith('iocInit'):
+            return True
+    return False
+
+
+initialized = run(sys.argv[1])
+print(json.dumps({'start' : start, 'ioc_init' : time.time() if initialized else None, 'commands' : counts['commands'], 'includes' : counts['includes'], 'missing' : missing}))
+sys.exit(0 if initialized else 1)
+'''
+
+
+def get_stub_executable_path(bundle_path, arch=default_architecture):
+    """Returns the path of the stub executable in a synthetic bundle created by make_stub_bundle
+    """
+
+    return os.path.join(bundle_path, 'support', 'areaDetector', 'ADSimDetector', 'iocs', 'simDetectorIOC', 'bin', arch, 'simDetectorApp')
+
+
+def make_stub_bundle(bundle_path, modules=10, includes=5, arch=default_architecture):
+    """Creates a synthetic bundle with an ADSimDetector IOC whose executable is a stub, see stub_ioc_source
+
+    Parameters
+    ----------
+    bundle_path : str
+        directory the bundle is created in, must not exist
+    modules : int
+        number of support modules with library directories, which lengthen LD_LIBRARY_PATH
+    includes : int
+        number of plugin scripts commonPlugins.cmd includes with <
+    arch : str
+        architecture the executable and libraries are built for
+
+    Raises
+    ------
+    ValueError
+        if the path of this python interpreter is too long for the shebang line of the stub
+    """
+
+    if len(sys.executable) > KERNEL_PATH_LIMIT:
+        raise ValueError('Path to python interpreter {} exceeds legal bash shebang limit, the stub IOC executable cannot run'.format(sys.executable))
+    area_detector = os.path.join(bundle_path, 'support', 'areaDetector')
+    ioc_top = os.path.join(area_detector, 'ADSimDetector', 'iocs', 'simDetectorIOC')
+    iocBoot = os.path.join(ioc_top, 'iocBoot', 'iocSimDetector')
+    lib_dirs = [os.path.join(bundle_path, 'base')]
+    lib_dirs.extend([os.path.join(bundle_path, 'support', 'module{}'.format(i)) for i in range(1, modules + 1)])
+    lib_dirs.extend([os.path.join(area_detector, name) for name in ['ADCore', 'ADSupport', 'ADSimDetector']])
+    for lib_dir in lib_dirs:
+        os.makedirs(os.path.join(lib_dir, 'lib', arch))
+    os.makedirs(os.path.join(ioc_top, 'bin', arch))
+    os.makedirs(iocBoot)
+    os.makedirs(os.path.join(area_detector, 'ADCore', 'iocBoot'))
+
+    executable_path = get_stub_executable_path(bundle_path, arch)
+    with open(executable_path, 'w') as stub_fp:
+        stub_fp.write('#!{}\n'.format(sys.executable))
+        stub_fp.write(stub_ioc_source)
+    os.chmod(executable_path, 0o755)
+
+    with open(os.path.join(area_detector, 'ADCore', 'iocBoot', 'commonPlugins.cmd'), 'w') as plugins_fp:
+        for i in range(1, includes + 1):
+            plugin_name = 'plugin{}.cmd'.format(i)
+            plugins_fp.write('< $(ADCORE)/iocBoot/{}\n'.format(plugin_name))
+            with open(os.path.join(area_detector, 'ADCore', 'iocBoot', plugin_name), 'w') as plugin_fp:
+                plugin_fp.write('NDStatsConfigure("STATS{0}", $(QSIZE), 0, "$(PORT)", 0, 0, 0, 0, 0, $(MAX_THREADS))\n'.format(i))
+                plugin_fp.write('dbLoadRecords("NDStats.template", "P=$(PREFIX),R=Stats{0}:,PORT=STATS{0},ADDR=0,TIMEOUT=1")\n'.format(i))
+
+    with open(os.path.join(iocBoot, 'st_base.cmd'), 'w') as st_fp:
+        st_fp.write('< envPaths\n\n'
+                    'errlogInit(20000)\n\n'
+                    'dbLoadDatabase("$(TOP)/dbd/simDetectorApp.dbd")\n'
+                    'simDetectorApp_registerRecordDeviceDriver(pdbbase)\n\n'
+                    'epicsEnvSet("PREFIX", "13SIM1:")\n'
+                    'epicsEnvSet("PORT",   "SIM1")\n'
+                    'epicsEnvSet("QSIZE",  "20")\n'
+                    'epicsEnvSet("MAX_THREADS", "8")\n\n'
+                    'simDetectorConfig("$(PORT)", 1024, 1024, 1, 0, 0)\n'
+                    'dbLoadRecords("$(ADSIMDETECTOR)/db/simDetector.template","P=$(PREFIX),R=cam1:,PORT=$(PORT),ADDR=0,TIMEOUT=1")\n\n'
+                    '< $(ADCORE)/iocBoot/commonPlugins.cmd\n\n'
+                    'iocInit()\n\n'
+                    'create_monitor_set("auto_settings.req", 30, "P=$(PREFIX)")\n')
+    with open(os.path.join(iocBoot, 'envPaths'), 'w') as env_fp:
+        env_fp.write('epicsEnvSet("ARCH", "{}")\n'.format(arch))
+    with open(os.path.join(iocBoot, 'auto_settings.req'), 'w') as req_fp:
+        req_fp.write('file "simDetector_settings.req", P=$(P), R=cam1:\n')
+    with open(os.path.join(iocBoot, 'simDetectorAttributes.xml'), 'w') as xml_fp:
+        xml_fp.write('<Attributes>\n</Attributes>\n')
+
+
+def get_percentile(values, percent):
+    """Returns the nearest-rank percentile of a list of values, None if it is empty
+    """
+
+    if len(values) == 0:
+        return None
+    ordered = sorted(values)
+    rank = max(int(math.ceil(percent / 100.0 * len(ordered))), 1)
+    return ordered[rank - 1]
+
+
+def boot_iocs(ioc_paths, timeout=60):
+    """Launches the st.cmd of several IOCs at once, and collects when each reached iocInit
+
+    Parameters
+    ----------
+    ioc_paths : list of str
+        directories of IOCs generated from a stub bundle
+    timeout : float
+        seconds to wait for all IOCs to reach iocInit
+
+    Returns
+    -------
+    boots : list of dict
+        report printed by the stub of each IOC, with 'launch', the time the IOC was started, and
+        'time_to_init', the seconds until it reached iocInit or None if it failed. An IOC that could
+        not be started has its 'error' instead
+    """
+
+    processes = []
+    boots = []
+    try:
+        for ioc_path in ioc_paths:
+            launch = time.time()
+            try:
+                process = subprocess.Popen([initIOC_path_join(ioc_path, 'st.cmd')], cwd=ioc_path, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, universal_newlines=True)
+            except OSError as e:
+                process = e
+            processes.append((launch, process))
+
+        deadline = time.monotonic() + timeout
+        for launch, process in processes:
+            boot = {'ioc_init' : None}
+            if isinstance(process, OSError):
+                boot['error'] = 'Could not start IOC: {}'.format(process)
+            else:
+                try:
+                    output, _ = process.communicate(timeout=max(deadline - time.monotonic(), 0))
+                    boot.update(json.loads(output.strip().splitlines()[-1]))
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                    process.communicate()
+                except (ValueError, IndexError):
+                    pass
+            boot['launch'] = launch
+            boot['time_to_init'] = None if boot['ioc_init'] is None else boot['ioc_init'] - launch
+            boots.append(boot)
+    finally:
+        # However the benchmark ends, no IOC it started is left running
+        for _, process in processes:
+            if isinstance(process, subprocess.Popen) and process.poll() is None:
+                process.kill()
+                process.communicate()
+    return boots
+
+
+def benchmark_boot_times(work_dir, modes=None, num_iocs=10, modules=10, includes=5, timeout=60, log=None):
+    """Measures how long IOCs generated with each mode take to reach iocInit, without EPICS base or any detector.
+
+    A synthetic bundle with a stub executable is created in work_dir. For each mode, num_iocs IOCs are
+    generated from it into work_dir/<mode>, then all of them are launched at once.
+
+    Parameters
+    ----------
+    work_dir : str
+        directory the bundle and IOCs are created in. If it exists, it must be empty or have been
+        created by an earlier benchmark, and is then replaced
+    modes : list of str
+        keys of boot_benchmark_modes to compare, all if None
+    num_iocs : int
+        number of IOCs generated and booted concurrently for each mode
+    modules : int
+        number of support modules in the bundle, which lengthen LD_LIBRARY_PATH
+    includes : int
+        number of plugin scripts included by the startup script
+    timeout : float
+        seconds to wait for the IOCs of a mode to boot
+    log : callable
+        function called with each log message, messages are discarded if None
+
+    Returns
+    -------
+    report : dict
+        'benchmark', 'success', 'errors' and 'duration' like a run report, the 'parameters' of the benchmark, and
+        'results' for each mode: the launcher ('shebang' or 'bash'), the length of the LD_LIBRARY_PATH set, the number
+        of IOCs booted and failed, included scripts that were not found, and the mean and percentiles of the time to
+        iocInit in seconds
+
+    Raises
+    ------
+    ValueError
+        if work_dir holds anything not created by a boot benchmark, or is too deep for the 'shebang' mode
+        to start the stub executable directly
+    """
+
+    if log is None:
+        log = discard_log
+    if modes is None:
+        modes = list(boot_benchmark_modes.keys())
+    start = time.monotonic()
+    bundle_path = os.path.join(os.path.abspath(work_dir), 'bundle')
+    # IOCs would be generated with a bash wrapper instead, and the mode would measure the same as the others
+    if 'shebang' in modes and len(get_stub_executable_path(bundle_path)) > KERNEL_PATH_LIMIT:
+        raise ValueError('Path to stub executable in {} exceeds legal bash shebang limit, use a shorter directory for the shebang mode'.format(work_dir))
+    marker_path = os.path.join(work_dir, boot_benchmark_marker)
+    if os.path.lexists(work_dir):
+        if not os.path.isdir(work_dir) or os.path.islink(work_dir) or (len(os.listdir(work_dir)) > 0 and not os.path.isfile(marker_path)):
+            raise ValueError('{} is not empty, and was not created by the boot benchmark'.format(work_dir))
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir)
+    with open(marker_path, 'w') as marker_fp:
+        marker_fp.write('Created by the initIOC boot time benchmark, replaced by the next one.\n')
+    make_stub_bundle(bundle_path, modules=modules, includes=includes)
+
+    report = {
+        'benchmark' :   'boot',
+        'success' :     True,
+        'errors' :      [],
+        'duration' :    0.0,
+        'parameters' :  {'iocs' : num_iocs, 'modules' : modules, 'includes' : includes, 'modes' : modes, 'timeout' : timeout},
+        'results' :     {},
+    }
+    for mode in modes:
+        config = dict(base_configuration)
+        config.update({'ioc_dir' : os.path.join(os.path.abspath(work_dir), mode), 'bundle_location' : bundle_path,
+                       'beamline_prefix' : 'BENCH:', 'engineer' : 'initIOC', 'hostname' : 'localhost', 'ca_address_ip' : '127.0.0.255'})
+        config['iocs'] = [{'name' : 'cam-sim{}'.format(i), 'type' : 'ADSimDetector', 'device_prefix' : '{{Sim-Cam:{}}}'.format(i), 'asyn_port' : 'SIM{}'.format(i), 'telnet_port' : 4000 + i, 'connection' : 'NA'}
+                          for i in range(1, num_iocs + 1)]
+        log('Generating {} IOCs with mode {}...'.format(num_iocs, mode))
+        result = generate(config, GenerationOptions(**boot_benchmark_modes[mode]))
+        mode_report = {'options' : boot_benchmark_modes[mode], 'errors' : result.errors, 'launcher' : None, 'lib_path_length' : 0, 'booted' : 0, 'failed' : num_iocs, 'missing' : [], 'time_to_init' : {}}
+        report['results'][mode] = mode_report
+        ioc_paths = [initIOC_path_join(config['ioc_dir'], ioc_result.ioc_name) for ioc_result in result.with_status('created')]
+        if len(ioc_paths) == 0:
+            continue
+
+        with open(initIOC_path_join(ioc_paths[0], 'st.cmd'), 'r') as st_fp:
+            st_lines = st_fp.readlines()
+        mode_report['launcher'] = 'bash' if st_lines[0].startswith('#!/bin/bash') else 'shebang'
+        mode_report['lib_path_length'] = sum([len(line.strip()) - len('export LD_LIBRARY_PATH=') for line in st_lines if line.startswith('export LD_LIBRARY_PATH=')])
+
+        log('Booting {} IOCs at once...'.format(len(ioc_paths)))
+        boots = boot_iocs(ioc_paths, timeout)
+        times = [boot['time_to_init'] for boot in boots if boot['time_to_init'] is not None]
+        mode_report['errors'] = mode_report['errors'] + [boot['error'] for boot in boots if 'error' in boot]
+        mode_report['missing'] = sorted(set([path for boot in boots for path in boot.get('missing', [])]))
+        mode_report['booted'] = len(times)
+        mode_report['failed'] = num_iocs - len(times)
+        if len(times) > 0:
+            mode_report['time_to_init']['mean'] = sum(times) / len(times)
+            for percent in boot_benchmark_percentiles:
+                mode_report['time_to_init']['p{}'.format(percent)] = get_percentile(times, percent)
+            mode_report['time_to_init']['max'] = max(times)
+
+    for mode, mode_report in report['results'].items():
+        report['errors'].extend(['{}: {}'.format(mode, error) for error in mode_report['errors']])
+    report['success'] = all([mode_report['failed'] == 0 for mode_report in report['results'].values()])
+    report['duration'] = time.monotonic() - start
+    return report
+
+
+def print_boot_benchmark(report):
+    """Prints the report of benchmark_boot_times as a table, in milliseconds
+    """
+
+    columns = ['mean'] + ['p{}'.format(percent) for percent in boot_benchmark_percentiles] + ['max']
+    initIOC_print('{:<10} {:<9} {:>8} {:>7}'.format('Mode', 'Launcher', 'Lib path', 'Booted') + ''.join(['{:>9}'.format(column) for column in columns]))
+    for mode, mode_report in report['results'].items():
+        row = '{:<10} {:<9} {:>8} {:>7}'.format(mode, str(mode_report['launcher']), mode_report['lib_path_length'], '{}/{}'.format(mode_report['booted'], report['parameters']['iocs']))
+        for column in columns:
+            value = mode_report['time_to_init'].get(column)
+            row = row + ('{:>9}'.format('-') if value is None else '{:>9.1f}'.format(value * 1000))
+        initIOC_print(row)
+        for error in mode_report['errors']:
+            initIOC_print('    ERROR - {}'.format(error))
+        for path in mode_report['missing']:
+            initIOC_print('    WARNING - Included script not found: {}'.format(path))
+
+
+#-------------------------------------------------
+#----------------MAIN SCRIPT FUNCTIONS------------
+#-------------------------------------------------
+
+
+class ConfigurationError(Exception):
+    """Exception raised when an initIOC configuration file cannot be loaded or is invalid
+
+    Attributes
+    ----------
+    errors : list of str
+        one message per problem found in the configuration
+    """
+
+    def __init__(self, errors):
+        if isinstance(errors, str):
+            errors = [errors]
+        self.errors = errors
+        super().__init__('\n'.join(errors))
+
+
+def validate_ioc_config(config):
+    """Function that validates a loaded configuration in a single pass.
+
+    All problems are collected before raising, so that every invalid entry can be
+    reported at once.
+
+    Parameters
+    ----------
+    config : dict
+        configuration as loaded from YAML, JSON or CSV
+
+    Returns
+    -------
+    validated : dict
+        configuration with all values normalized to str, and telnet ports to int
+
+    Raises
+    ------
+    ConfigurationError
+        if any required key is missing or has an invalid value
+    """
+
+    if not isinstance(config, dict):
+        raise ConfigurationError('Configuration must be a mapping of keys to values')
+
+    errors = []
+    validated = {}
+    for key in required_config_keys:
+        if key not in config:
+            errors.append('Missing required key "{}"'.format(key))
+        elif config[key] is None or isinstance(config[key], (list, dict)):
+            errors.append('Key "{}" must be a single value'.format(key))
+        else:
+            validated[key] = str(config[key])
+
+    for key in optional_config_keys:
+        if key in config and config[key] is not None and str(config[key]) != '':
+            if isinstance(config[key], (list, dict)):
+                errors.append('Key "{}" must be a single value'.format(key))
+            else:
+                validated[key] = str(config[key])
+
+    if 'hostname' in validated and hostname_pattern.fullmatch(validated['hostname']) is None:
+        errors.append('Key "hostname" must be a host name of letters, digits, "." and "-", not "{}"'.format(validated['hostname']))
+
+    for key in config.keys():
+        if key not in required_config_keys and key not in optional_config_keys and key != 'iocs':
+            errors.append('Unknown key "{}"'.format(key))
+
+    iocs = config.get('iocs')
+    validated['iocs'] = []
+    if not isinstance(iocs, list):
+        errors.append('Key "iocs" must be a list of IOC entries')
+        iocs = []
+
+    names = {}
+    telnet_ports = {}
+    for i, ioc in enumerate(iocs):
+        if not isinstance(ioc, dict):
+            errors.append('iocs[{}]: entry must be a mapping of keys to values'.format(i))
+            continue
+        entry_id = 'iocs[{}] ({})'.format(i, ioc.get('name', 'unnamed'))
+        entry = {}
+        for key in required_ioc_keys:
+            if key not in ioc:
+                errors.append('{}: missing required key "{}"'.format(entry_id, key))
+            elif ioc[key] is None or isinstance(ioc[key], (list, dict)) or str(ioc[key]) == '':
+                errors.append('{}: key "{}" must be a non-empty value'.format(entry_id, key))
+            else:
+                entry[key] = str(ioc[key])
+        for key in optional_ioc_keys:
+            if key in ioc and ioc[key] is not None and str(ioc[key]) != '':
+                entry[key] = str(ioc[key])
+        if 'hostname' in entry and hostname_pattern.fullmatch(entry['hostname']) is None:
+            errors.append('{}: key "hostname" must be a host name of letters, digits, "." and "-", not "{}"'.format(entry_id, entry['hostname']))
+        for key in ioc.keys():
+            if key not in required_ioc_keys and key not in optional_ioc_keys:
+                errors.append('{}: unknown key "{}"'.format(entry_id, key))
+
+        if 'telnet_port' in entry:
+            try:
+                entry['telnet_port'] = int(entry['telnet_port'])
+                if not 0 < entry['telnet_port'] < 65536:
+                    raise ValueError
+                # Telnet ports only need to be unique per IOC server
+                host_port = (entry.get('hostname', validated.get('hostname')), entry['telnet_port'])
+                if host_port in telnet_ports:
+                    errors.append('{}: telnet port {} already used by iocs[{}]'.format(entry_id, entry['telnet_port'], telnet_ports[host_port]))
+                telnet_ports[host_port] = i
+            except ValueError:
+                errors.append('{}: telnet port "{}" is not a valid port number'.format(entry_id, entry['telnet_port']))
+        if 'name' in entry:
+            if entry['name'] in names:
+                errors.append('{}: IOC name already used by iocs[{}]'.format(entry_id, names[entry['name']]))
+            names[entry['name']] = i
+        validated['iocs'].append(entry)
+
+    if len(errors) > 0:
+        raise ConfigurationError(errors)
+
+    return validated
+
+
+def load_csv_config(config_fp):
+    """Function that loads a spreadsheet exported CSV configuration.
+
+    Rows whose first cell is a top level configuration key set that key, ex. `hostname,xf17bm-ioc1`.
+    The first row whose first cell is an IOC key is the header for the IOC table, and all
+    following rows are IOC entries. Empty rows and rows starting with # are ignored.
+
+    Parameters
+    ----------
+    config_fp : file object
+        open CSV file
+
+    Returns
+    -------
+    config : dict
+        unvalidated configuration
+    """
+
+    config = {'iocs' : []}
+    header = None
+    for row in csv.reader(config_fp):
+        cells = [cell.strip() for cell in row]
+        while len(cells) > 0 and cells[-1] == '':
+            cells.pop()
+        if len(cells) == 0 or cells[0].startswith('#'):
+            continue
+        if header is not None:
+            ioc = dict(zip(header, cells + [''] * (len(header) - len(cells))))
+            for key in optional_ioc_keys:
+                if ioc.get(key) == '':
+                    del ioc[key]
+            config['iocs'].append(ioc)
+        elif cells[0] in required_ioc_keys:
+            header = cells
+        elif len(cells) == 2:
+            config[cells[0]] = cells[1]
+        else:
+            raise ConfigurationError('CSV row "{}" is neither a configuration key and value, nor an IOC table header'.format(','.join(row)))
+    return config
 
-    def add_to_environment(self, line):
-        line_s = line.strip()
-        line_s = re.sub('"', '', line_s)
-        line_s = re.sub('\t', '', line_s)
-        line_s = re.sub(' +', '', line_s)
-        line_s = re.sub('epicsEnvSet', '', line_s)
-        temp = line_s.split(',')
-        if temp[0][1:] not in self.user_entered_env:
-            self.epics_environment[temp[0][1:]] = temp[1][:-1]
-        if self.ioc_type in existing_connection_parameter.keys():
-            if existing_connection_parameter[self.ioc_type] == temp[1][:-1]:
-                self.epics_environment[temp[0][1:]] = self.connection
 
+def get_config_format(config_path):
+    """Function that determines configuration format from file extension, defaults to yaml
+    """
 
+    extension = os.path.splitext(config_path)[1].lower()
+    if extension == '.json':
+        return 'json'
+    elif extension == '.csv':
+        return 'csv'
+    return 'yaml'
 
-#-------------------------------------------------
-#----------------MAIN SCRIPT FUNCTIONS------------
-#-------------------------------------------------
 
+def write_ioc_config(config, config_path):
+    """Function that writes a configuration into a YAML, JSON or CSV file, in the format read by read_ioc_config
+
+    Parameters
+    ----------
+    config : dict
+        configuration, with top level keys and a list of IOC entries
+    config_path : str
+        path of the file to write, the format is selected by file extension
+
+    Raises
+    ------
+    ConfigurationError
+        if YAML is requested but the yaml library is not installed
+    """
+
+    config_format = get_config_format(config_path)
+    if config_format == 'yaml' and not WITH_YAML:
+        raise ConfigurationError('Python yaml library not installed! Use a JSON or CSV configuration instead.')
+
+    with open(config_path, 'w', newline='') as config_fp:
+        if config_format == 'json':
+            json.dump(config, config_fp, indent=4)
+        elif config_format == 'csv':
+            writer = csv.writer(config_fp)
+            for key in required_config_keys + optional_config_keys:
+                if key in config:
+                    writer.writerow([key, config[key]])
+            writer.writerow([])
+            columns = required_ioc_keys + [key for key in optional_ioc_keys if any([key in ioc for ioc in config.get('iocs', [])])]
+            writer.writerow(columns)
+            for ioc in config.get('iocs', []):
+                writer.writerow([ioc.get(key, '') for key in columns])
+        else:
+            yaml.safe_dump(config, config_fp)
+
+
+def read_ioc_config(config_path, cache_dir=None, log=None):
+    """Function that loads and validates an initIOC configuration file.
+
+    Parameters
+    ----------
+    config_path : str
+        path to YAML, JSON or CSV configuration file
+    cache_dir : str
+        optional directory in which validated configurations are cached, keyed by file hash
+    log : callable
+        function called with warnings, defaults to initIOC_print
+
+    Returns
+    -------
+    config : dict
+        validated configuration
+
+    Raises
+    ------
+    ConfigurationError
+        if the file could not be read, parsed or validated
+    """
+
+    config_format = get_config_format(config_path)
+    try:
+        with open(config_path, 'rb') as config_fp:
+            contents = config_fp.read()
+    except OSError as e:
+        raise ConfigurationError('Could not read configuration file {}: {}'.format(config_path, e.strerror))
+
+    cache_path = None
+    if cache_dir is not None:
+        config_hash = hashlib.sha256(contents)
+        config_hash.update('{}:{}:{}'.format(__version__, config_schema_version, config_format).encode())
+        # Adding or removing accepted keys changes the validated configuration as well
+        config_hash.update(json.dumps([required_config_keys, required_ioc_keys, optional_config_keys, optional_ioc_keys]).encode())
+        cache_path = os.path.join(cache_dir, '{}.json'.format(config_hash.hexdigest()))
+        if os.path.isfile(cache_path):
+            try:
+                with open(cache_path, 'r') as cache_fp:
+                    return json.load(cache_fp)
+            except (OSError, ValueError):
+                pass
+
+    if config_format == 'yaml' and not WITH_YAML:
+        raise ConfigurationError('Python yaml library not installed! Use a JSON or CSV configuration instead.')
 
-def read_ioc_config(config_path):
-    global WITH_YAML
+    parse_errors = (ValueError, csv.Error)
     if WITH_YAML:
-        with open(config_path, 'r') as configure:
-            config = yaml.full_load(configure)
+        parse_errors = parse_errors + (yaml.YAMLError,)
 
-        return config
-    else:
-        initIOC_print('Error Python yaml library not installed!')
-        exit(-1)
+    try:
+        text = contents.decode('utf-8')
+        if config_format == 'json':
+            config = json.loads(text)
+        elif config_format == 'csv':
+            config = load_csv_config(text.splitlines())
+        else:
+            config = yaml.load(text, Loader=YAMLSafeLoader)
+    except parse_errors as e:
+        raise ConfigurationError('Could not parse {}: {}'.format(config_path, e))
+
+    config = validate_ioc_config(config)
+
+    if cache_path is not None:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+            with open(temp_path, 'w') as cache_fp:
+                json.dump(config, cache_fp)
+            os.replace(temp_path, cache_path)
+        except OSError:
+            if log is None:
+                log = initIOC_print
+            log('WARNING - Could not write configuration cache to {}'.format(cache_dir))
+
+    return config
 
 
 def print_start_message():
@@ -735,15 +5570,31 @@ def print_start_message():
     initIOC_print('')
 
 
-def print_supported_drivers():
+def print_supported_drivers(log=None, registry=None):
     """Function that prints list of supported drivers
+
+    Parameters
+    ----------
+    log : callable
+        function called with each line, defaults to initIOC_print
+    registry : DriverRegistry
+        if given, list the drivers found in its bundle instead of the drivers with a template
     """
 
-    initIOC_print('Supported Drivers:')
-    initIOC_print("+-----------------------------+")
-    for driver in supported_drivers:
-        initIOC_print('+ {}'.format(driver))
-    initIOC_print('')
+    if log is None:
+        log = initIOC_print
+    if registry is None:
+        log('Supported Drivers:')
+        log("+-----------------------------+")
+        for driver in supported_drivers:
+            log('+ {}'.format(driver))
+    else:
+        log('Drivers in {}:'.format(registry.bundle_index.binary_location))
+        log("+-----------------------------+")
+        for driver in registry.names():
+            info = registry.drivers[driver]
+            log('+ {:<16} {:<20} {}'.format(driver, info.connection_variable or '-', 'template' if info.has_template else ''))
+    log('')
 
 
 def prompt_for_top_dirs(with_welcome=True):
@@ -810,13 +5661,15 @@ def guided_init_iocs(manager):
         driver_type = None
         while driver_type is None:
             driver_type = input('\nWhat driver type would you like to generate?\n> ')
-            if driver_type not in supported_drivers and manager.use_template:
+            registry = manager.bundle_index.get_driver_registry()
+            if manager.use_template and not registry.has_template(driver_type):
                 driver_type = None
                 initIOC_print('\nThe selected driver does not have a template. See list of supported drivers below.\n')
                 print_supported_drivers()
                 initIOC_print('You may alternatively try to generate from sources (without the -t flag).\n')
-            if driver_type is not None and not os.path.exists(os.path.join(manager.areaDetector_path, driver_type)):
-                initIOC_print('Could not find driver {} in {}.'.format(driver_type, os.path.join(manager.areaDetector_path, driver_type)))
+            if driver_type is not None and driver_type not in registry.names():
+                initIOC_print('Could not find driver {} in {}. See list of drivers in the bundle below.\n'.format(driver_type, manager.areaDetector_path))
+                print_supported_drivers(registry=registry)
                 driver_type = None
 
         current_ioc['type'] = driver_type
@@ -844,20 +5697,10 @@ def guided_init_iocs(manager):
         ioc_action.epics_environment['ENGINEER']            = initIOCs_config['engineer']
         ioc_action.epics_environment['EPICS_CA_ADDR_LIST']  = initIOCs_config['ca_address_ip']
 
-        # Execute the action
-        manager.process_action(ioc_action)
+        # Execute the action, saving the configuration into the IOC with the rest of its files
         initIOCs_config['iocs'].append(current_ioc)
-
-        try:
-            ioc_gen_config_path = os.path.join(manager.ioc_top, ioc_action.ioc_name, 'initIOCs.yml')
-            if os.path.exists(ioc_gen_config_path):
-                os.remove(ioc_gen_config_path)
-            global WITH_YAML
-            if WITH_YAML:
-                with open(ioc_gen_config_path, 'w') as config:
-                    yaml.safe_dump(initIOCs_config, config)
-        except PermissionError:
-            initIOC_print('Could not save config, insufficient permissions.')
+        manager.config_text = dump_ioc_config(initIOCs_config)
+        manager.process_action(ioc_action)
 
         del initIOCs_config['iocs'][:]
 
@@ -877,19 +5720,660 @@ def init_iocs_cli(actions, manager):
         list of IOC actions to perform
     manager : IOCActionManger
         Manager object for executing IOC actions
+
+    Returns
+    -------
+    results : list of IOCResult
+        result for each action
     """
 
+    results = []
     if len(actions) == 0:
-        initIOC_print('No IOCs detected in table.')
+        manager.log('No IOCs detected in table.')
+    registry = manager.bundle_index.get_driver_registry()
+    for action in actions:
+        if manager.use_template and not registry.has_template(action.ioc_type):
+            result = IOCResult(action)
+            result.messages.append('ERROR - {} does not currently have a template!'.format(action.ioc_type))
+            manager.log(result.messages[-1])
+            print_supported_drivers(log=manager.log)
+            manager.log('To request support for {} to be added to initIOC, please create an issue on:'.format(action.ioc_type))
+            manager.log('https://github.com/epicsNSLS2-deploy/initIOC/issues\n')
+            manager.log('Alternatively, you may try using the non-templated version. (Run without "-t" flag)')
+            manager.emit(dict(event='ioc', **result.to_dict()))
+            results.append(result)
+        else:
+            results.append(manager.process_action(action))
+    return results
+
+
+def partition_actions_by_host(actions):
+    """Groups IOC actions by the hostname of the IOC server they will be deployed on
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        list of IOC actions
+
+    Returns
+    -------
+    partitions : dict of str -> list of IOCAction
+        actions for each hostname, in order of first appearance
+    """
+
+    partitions = {}
     for action in actions:
-        if action.ioc_type not in supported_drivers and manager.use_template:
-            initIOC_print('ERROR - {} does not currently have a template!'.format(action.ioc_type))
-            print_supported_drivers()
-            initIOC_print('To request support for {} to be added to initIOC, please create an issue on:'.format(action.ioc_type))
-            initIOC_print('https://github.com/epicsNSLS2-deploy/initIOC/issues\n')
-            initIOC_print('Alternatively, you may try using the non-templated version. (Run without "-t" flag)')
+        partitions.setdefault(action.epics_environment['HOSTNAME'], []).append(action)
+    return partitions
+
+
+def parse_shard(spec):
+    """Parses a shard given as K/N, the K-th of N shards counting from 1
+
+    Returns
+    -------
+    shard : tuple of int
+        shard number K and number of shards N
+
+    Raises
+    ------
+    ValueError
+        if spec is not of the form K/N with 1 <= K <= N
+    """
+
+    index, _, count = spec.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        raise ValueError('Shard {} is not of the form K/N'.format(spec))
+    if count < 1 or index < 1 or index > count:
+        raise ValueError('Shard {} must satisfy 1 <= K <= N'.format(spec))
+    return index, count
+
+
+def select_shard(actions, index, count):
+    """Selects the actions of one shard of a configuration.
+
+    IOCs are assigned to shards by a hash of their name, so every host running the same configuration
+    agrees on the assignment without coordinating, and adding an IOC does not move the others.
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        all actions of the configuration
+    index : int
+        shard to select, counting from 1
+    count : int
+        number of shards
+
+    Returns
+    -------
+    shard_actions : list of IOCAction
+        actions assigned to the shard, in configuration order
+    """
+
+    return [action for action in actions if int(hashlib.sha256(action.ioc_name.encode()).hexdigest(), 16) % count == index - 1]
+
+
+def get_partition_archive_path(archive_path, hostname):
+    """Inserts hostname into archive file name, ex. iocs.tar.gz -> iocs-xf17bm-ioc1.tar.gz
+    """
+
+    archive_dir, archive_name = os.path.split(archive_path)
+    if '.tar' in archive_name:
+        split_at = archive_name.index('.tar')
+    else:
+        split_at = len(os.path.splitext(archive_name)[0])
+    return os.path.join(archive_dir, '{}-{}{}'.format(archive_name[:split_at], hostname, archive_name[split_at:]))
+
+
+def dump_ioc_config(configuration):
+    """Serializes the configuration saved into generated IOCs, once per run
+
+    Returns
+    -------
+    config_text : str
+        YAML text of the configuration, or None if PyYAML is not available
+    """
+
+    if not WITH_YAML or configuration is None:
+        return None
+    return yaml.safe_dump(configuration)
+
+
+def init_iocs_partitioned(actions, manager, archive_path=None, max_workers=None, configuration=None):
+    """Drives IOC generation for several IOC servers in parallel.
+
+    Actions are grouped by hostname, and each group is generated into its own directory under
+    the IOC top directory, or into its own archive. All groups share the bundle index of manager.
+
+    Parameters
+    ----------
+    actions : list of IOCAction
+        list of IOC actions to perform
+    manager : IOCActionManger
+        Manager object configured with the IOC top directory and bundle
+    archive_path : str
+        If not None, write one archive per hostname based on this path instead of directories
+    max_workers : int
+        maximum number of hostnames to generate in parallel
+    configuration : dict
+        If not None, configuration saved into each generated IOC
+
+    Returns
+    -------
+    results : dict of str -> list of IOCResult
+        results of the actions for each hostname
+    """
+
+    partitions = partition_actions_by_host(actions)
+    if len(partitions) == 0:
+        manager.log('No IOCs detected in table.')
+        return {}
+    if archive_path is None and not manager.initialize_ioc_directory():
+        return {}
+
+    # Scan every driver used once before splitting into parallel partitions
+    for ioc_type in set([action.ioc_type for action in actions]):
+        manager.find_paths_for_action(ioc_type)
+    if configuration is not None:
+        manager.config_text = dump_ioc_config(configuration)
+
+    # Lookups of the partition threads are counted for the run that started them
+    scan_counts = manager.bundle_index.get_job_counts()
+
+    def generate_partition(hostname):
+        manager.bundle_index.count_job(scan_counts)
+        try:
+            return generate_host(hostname)
+        finally:
+            manager.bundle_index.count_job(None)
+
+    def generate_host(hostname):
+        ioc_top = initIOC_path_join(manager.ioc_top, hostname)
+        output = None
+        if archive_path is not None:
+            host_archive_path = get_partition_archive_path(archive_path, hostname)
+            try:
+                output = TarArchiveOutput(host_archive_path, ioc_top, manager.filesystem)
+            except (ValueError, OSError) as e:
+                # Only the IOCs of this host fail, the other hosts are still generated
+                message = 'ERROR - Could not create archive {}: {}'.format(host_archive_path, e)
+                manager.log(message)
+                results = [IOCResult(action) for action in partitions[hostname]]
+                for result in results:
+                    result.messages.append(message)
+                return results
+        partition_manager = manager.partition(ioc_top, output=output)
+        try:
+            results = init_iocs_cli(partitions[hostname], partition_manager)
+        finally:
+            partition_manager.output.close()
+        return results
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {hostname : executor.submit(generate_partition, hostname) for hostname in partitions.keys()}
+        for hostname, future in futures.items():
+            results[hostname] = future.result()
+
+    manager.log('IOCs generated per host:\n+{}'.format('-' * 50))
+    for hostname, host_results in results.items():
+        created = len([result for result in host_results if result.status == 'created'])
+        manager.log('+ {:<24} - {} created, {} skipped or failed'.format(hostname, created, len(host_results) - created))
+    manager.log('')
+    return results
+
+
+def find_existing_iocs(ioc_top):
+    """Finds IOCs previously generated by initIOC under the IOC top directory
+
+    IOCs generated into per-hostname directories with --partition are found as well.
+
+    Returns
+    -------
+    ioc_paths : list of str
+        paths of directories containing a unique.cmd, sorted by name
+    """
+
+    ioc_paths = []
+    if not os.path.isdir(ioc_top):
+        return ioc_paths
+    for name in sorted(os.listdir(ioc_top)):
+        path = initIOC_path_join(ioc_top, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        if os.path.exists(initIOC_path_join(path, 'unique.cmd')):
+            ioc_paths.append(path)
+        else:
+            for host_ioc in sorted(os.listdir(path)):
+                host_ioc_path = initIOC_path_join(path, host_ioc)
+                if not host_ioc.startswith('.') and os.path.exists(initIOC_path_join(host_ioc_path, 'unique.cmd')):
+                    ioc_paths.append(host_ioc_path)
+    return ioc_paths
+
+
+def retarget_iocs(ioc_top, binary_location, dry_run=False, max_workers=None, log=None, snapshot=True):
+    """Points all IOCs previously generated under ioc_top at a new bundle, in parallel.
+
+    Changes are collected for all IOCs first, and the IOCs that will change are snapshotted before
+    any file is rewritten.
+
+    Parameters
+    ----------
+    ioc_top : str
+        IOC top directory, IOCs in per-hostname directories are included
+    binary_location : str
+        path to the new bundle
+    dry_run : bool
+        if True, only report the changes that would be made
+    max_workers : int
+        maximum number of IOCs retargeted in parallel
+    log : callable
+        function called with each log message, defaults to initIOC_print
+    snapshot : bool
+        if True, snapshot the IOCs that will change before rewriting them
+
+    Returns
+    -------
+    results : list of RetargetResult
+        result for each IOC found, empty if the bundle does not exist
+    """
+
+    if log is None:
+        log = initIOC_print
+    if not os.path.isdir(binary_location):
+        log('ERROR - Bundle location {} does not exist.'.format(binary_location))
+        return []
+    manager = IOCActionManager(ioc_top, binary_location, False, False, True, False, log=log)
+    ioc_paths = find_existing_iocs(ioc_top)
+    if len(ioc_paths) == 0:
+        log('No IOCs found in {}.'.format(ioc_top))
+        return []
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda ioc_path : manager.retarget_ioc(ioc_path, dry_run=True), ioc_paths))
+        changed = [result.ioc_path for result in results if result.error is None and len(result.changes) > 0]
+        if not dry_run and len(changed) > 0:
+            if snapshot:
+                copy_files = {result.ioc_path : [change[0] for change in result.changes] for result in results}
+                name = SnapshotStore(ioc_top).create(changed, 'retarget', copy_files)
+                log('Saved snapshot {} of IOCs to be retargeted.'.format(name))
+            results = list(executor.map(lambda ioc_path : manager.retarget_ioc(ioc_path), ioc_paths))
+
+    if dry_run:
+        log('Changes required to retarget IOCs to {} (dry run):\n+{}'.format(binary_location, '-' * 50))
+    else:
+        log('IOCs retargeted to {}:\n+{}'.format(binary_location, '-' * 50))
+    for result in results:
+        if result.error is not None:
+            log('+ {:<24} - ERROR - {}'.format(os.path.relpath(result.ioc_path, ioc_top), result.error))
+            continue
+        log('+ {:<24} - {} line(s) changed'.format(os.path.relpath(result.ioc_path, ioc_top), len(result.changes)))
+        for file, old_line, new_line in result.changes:
+            log('|   {}\n|     - {}\n|     + {}'.format(file, old_line, new_line))
+    log('')
+    return results
+
+
+def manage_snapshots(ioc_top, create=False, list_snapshots=False, restore=None, log=None):
+    """Creates, lists and restores snapshots of the IOCs in ioc_top
+
+    Parameters
+    ----------
+    ioc_top : str
+        IOC top directory
+    create : bool
+        snapshot all IOCs in ioc_top
+    list_snapshots : bool
+        print all snapshots of ioc_top
+    restore : str
+        name of a snapshot to restore, None to not restore one
+    log : callable
+        function called with each log message, defaults to initIOC_print
+
+    Returns
+    -------
+    success : bool
+        False if there were no IOCs to snapshot or the snapshot to restore was not found
+    """
+
+    if log is None:
+        log = initIOC_print
+    store = SnapshotStore(ioc_top)
+    if create:
+        ioc_paths = find_existing_iocs(ioc_top)
+        if len(ioc_paths) == 0:
+            log('ERROR - No IOCs found in {}.'.format(ioc_top))
+            return False
+        log('Saved snapshot {} of {} IOCs.'.format(store.create(ioc_paths), len(ioc_paths)))
+    if list_snapshots:
+        log('Snapshots of {}:\n+{}'.format(ioc_top, '-' * 50))
+        for name, manifest in store.list():
+            log('+ {:<40} - {} IOCs'.format(name, len(manifest['iocs'])))
+        log('')
+    if restore is not None:
+        if not store.restore(restore, log):
+            return False
+        log('Restored snapshot {}.'.format(restore))
+    return True
+
+
+def create_actions(configuration):
+    """Function that creates IOC actions for each IOC in a validated configuration
+
+    Parameters
+    ----------
+    configuration : dict
+        validated configuration
+
+    Returns
+    -------
+    actions : list of IOCAction
+        action for each IOC with its user entered environment set
+    """
+
+    actions = []
+    for ioc in configuration['iocs']:
+        action = IOCAction(ioc, configuration['beamline_prefix'])
+        # Add parameters to environment variables
+        action.epics_environment['ENGINEER'] = configuration['engineer']
+        action.epics_environment['HOSTNAME'] = ioc.get('hostname', configuration['hostname'])
+        action.arch = ioc.get('arch', configuration.get('arch'))
+        action.epics_environment['EPICS_CA_ADDR_LIST'] = configuration['ca_address_ip']
+        actions.append(action)
+    return actions
+
+
+def generate(config, options=None, log=None, bundle_index=None, events=None, filesystem=None):
+    """Library entry point that generates all IOCs in a configuration.
+
+    Does not print or exit, and keeps no state between calls, so it may be called repeatedly
+    and from several threads at once.
+
+    Parameters
+    ----------
+    config : dict or str
+        configuration, or path to a YAML, JSON or CSV configuration file
+    options : GenerationOptions
+        generation options, defaults are the same as running without flags
+    log : callable
+        function called with each log message, ex. logger.info. Messages are discarded if None
+    bundle_index : BundleIndex
+        optional index of the configured bundle to reuse between calls
+    events : callable
+        function called with a dict as the run starts, as each phase of an IOC completes, and as each IOC
+        completes, ex. to stream progress as JSON. Called from several threads at once with --partition
+    filesystem : MemoryFileSystem or LatencyFileSystem
+        backend the bundle is read from and IOCs are written to, the real filesystem if None. Runs in
+        memory are not journaled
+
+    Returns
+    -------
+    result : GenerationResult
+        result of the run, including one IOCResult per IOC in the configuration
+    """
+
+    start = time.monotonic()
+    if options is None:
+        options = GenerationOptions()
+    if log is None:
+        log = discard_log
+
+    try:
+        if isinstance(config, str):
+            configuration = read_ioc_config(config, options.config_cache, log=log)
+        else:
+            configuration = validate_ioc_config(config)
+    except ConfigurationError as e:
+        result = GenerationResult(None)
+        result.errors.extend(e.errors)
+        return result
+
+    result = GenerationResult(configuration)
+    if options.output_archive is not None and options.use_template:
+        result.errors.append('IOCs generated from template cannot be written into an archive.')
+        return result
+    if bundle_index is not None and bundle_index.binary_location != configuration['bundle_location']:
+        bundle_index = None
+
+    if options.fsync not in fsync_policies:
+        result.errors.append('Unknown fsync policy {}, expected one of {}'.format(options.fsync, ', '.join(fsync_policies)))
+        return result
+    if options.autosave is not None and options.autosave not in autosave_modes:
+        result.errors.append('Unknown autosave mode {}, expected one of {}'.format(options.autosave, ', '.join(autosave_modes)))
+        return result
+    if options.command_timeout is not None and options.command_timeout <= 0:
+        result.errors.append('Command timeout must be a positive number of seconds, not {}'.format(options.command_timeout))
+        return result
+    shard = None
+    if options.shard is not None:
+        try:
+            shard = parse_shard(options.shard)
+        except ValueError as e:
+            result.errors.append(str(e))
+            return result
+
+    if filesystem is None:
+        filesystem = local_filesystem
+    if bundle_index is not None and bundle_index.filesystem is not filesystem:
+        bundle_index = None
+
+    output = DiskOutput(options.fsync, filesystem)
+    if options.output_archive is not None and not options.partition:
+        try:
+            output = TarArchiveOutput(options.output_archive, configuration['ioc_dir'], filesystem)
+        except (ValueError, OSError) as e:
+            result.errors.append('Could not create archive {}: {}'.format(options.output_archive, e))
+            return result
+
+    journal = None
+    if options.output_archive is None and filesystem.on_disk:
+        # Shards running at the same time each keep their own journal
+        journal_name = None
+        if shard is not None:
+            journal_name = '{}-{}of{}'.format(GenerationJournal.file_name, *shard)
+        journal = GenerationJournal(configuration['ioc_dir'], journal_name)
+        if journal.interrupted:
+            log('Resuming interrupted run recorded in {}.\n'.format(journal.path))
+
+    actions = create_actions(configuration)
+    if shard is not None:
+        all_actions, actions = actions, select_shard(actions, *shard)
+        log('Generating {} of {} IOCs as shard {}.\n'.format(len(actions), len(all_actions), options.shard))
+    manager = IOCActionManager(configuration['ioc_dir'], configuration['bundle_location'], options.set_lib_path, options.use_template, options.with_deps, options.use_links, output=output, bundle_index=bundle_index, log=log, journal=journal, autosave=options.autosave, command_timeout=options.command_timeout, events=events, filesystem=filesystem)
+    manager.emit({'event' : 'start', 'iocs' : [action.ioc_name for action in actions]})
+    # A reused index keeps its counts from earlier runs, and a server shares it with the jobs running at the
+    # same time, so only the lookups made for this run are counted
+    scan_counts = {'scan_time' : 0.0, 'cache_hits' : 0, 'cache_misses' : 0}
+    manager.bundle_index.count_job(scan_counts)
+    filesystem_stats = None
+    if isinstance(filesystem, LatencyFileSystem):
+        filesystem_stats = filesystem.get_stats()
+    try:
+        if options.partition:
+            for host_results in init_iocs_partitioned(actions, manager, archive_path=options.output_archive, max_workers=options.max_workers, configuration=configuration).values():
+                result.ioc_results.extend(host_results)
         else:
-            manager.process_action(action)
+            try:
+                manager.config_text = dump_ioc_config(configuration)
+                result.ioc_results.extend(init_iocs_cli(actions, manager))
+            finally:
+                manager.output.close()
+        if journal is not None and not journal.finish():
+            log('WARNING - Some IOCs were left incomplete. Run again to resume, or use --rollback to remove them.')
+    finally:
+        # An interrupted run keeps its journal, so that it can be resumed or rolled back
+        if journal is not None:
+            journal.close()
+        manager.bundle_index.count_job(None)
+        result.bundle_scan.update(scan_counts)
+        if filesystem_stats is not None:
+            for operation, stats in filesystem.get_stats().items():
+                result.filesystem[operation] = {key : value - filesystem_stats[operation][key] for key, value in stats.items()}
+        result.duration = time.monotonic() - start
+    return result
+
+
+def write_run_report(result, report_path):
+    """Function that writes the result of a generation run as a JSON report, with one record per IOC
+
+    Parameters
+    ----------
+    result : GenerationResult
+        result of the run
+    report_path : str
+        path of the report file
+    """
+
+    with open(report_path, 'w') as report_fp:
+        json.dump(result.to_dict(), report_fp, indent=4)
+
+
+def make_event_writer(stream):
+    """Function that creates an event function writing each event as a line of JSON, see generate
+
+    Parameters
+    ----------
+    stream : file
+        text stream the events are written to, ex. sys.stdout
+
+    Returns
+    -------
+    write_event : callable
+        thread safe function that writes and flushes a single event
+    """
+
+    lock = threading.Lock()
+
+    def write_event(event):
+        line = json.dumps(event) + '\n'
+        with lock:
+            stream.write(line)
+            stream.flush()
+
+    return write_event
+
+
+def format_run_metrics(result):
+    """Function that formats the result of a generation run as metrics for the node_exporter textfile collector
+
+    Parameters
+    ----------
+    result : GenerationResult
+        result of the run
+
+    Returns
+    -------
+    metrics : str
+        metrics in the Prometheus text exposition format
+    """
+
+    lines = []
+    def add_metric(name, metric_type, help_text, samples):
+        lines.append('# HELP initioc_{} {}'.format(name, help_text))
+        lines.append('# TYPE initioc_{} {}'.format(name, metric_type))
+        for suffix, labels, value in samples:
+            label_str = ','.join(['{}="{}"'.format(label, label_value) for label, label_value in labels])
+            lines.append('initioc_{}{}{} {}'.format(name, suffix, '{' + label_str + '}' if label_str != '' else '', repr(float(value)) if isinstance(value, float) else value))
+
+    add_metric('run_success', 'gauge', 'Whether the last run generated every IOC without errors.', [('', [], int(result.success))])
+    add_metric('run_timestamp_seconds', 'gauge', 'Time the last run finished.', [('', [], time.time())])
+    add_metric('run_duration_seconds', 'gauge', 'Duration of the last run.', [('', [], result.duration)])
+    add_metric('iocs', 'gauge', 'IOCs in the last run by outcome.', [('', [('status', status)], len(result.with_status(status))) for status in ioc_statuses])
+    add_metric('bytes_written', 'gauge', 'Total size of the files written by the last run.', [('', [], sum([ioc_result.bytes_written for ioc_result in result.ioc_results]))])
+
+    samples = []
+    for phase in generation_phases:
+        durations = [ioc_result.durations[phase] for ioc_result in result.ioc_results if phase in ioc_result.durations]
+        for bucket in metrics_duration_buckets:
+            samples.append(('_bucket', [('phase', phase), ('le', repr(float(bucket)))], len([duration for duration in durations if duration <= bucket])))
+        samples.append(('_bucket', [('phase', phase), ('le', '+Inf')], len(durations)))
+        samples.append(('_sum', [('phase', phase)], float(sum(durations))))
+        samples.append(('_count', [('phase', phase)], len(durations)))
+    add_metric('phase_duration_seconds', 'histogram', 'Duration of each phase of generating an IOC in the last run.', samples)
+
+    scan = result.bundle_scan
+    lookups = scan['cache_hits'] + scan['cache_misses']
+    add_metric('bundle_scan_seconds', 'gauge', 'Time spent listing directories and reading files of the bundle in the last run.', [('', [], float(scan['scan_time']))])
+    add_metric('bundle_cache_lookups', 'gauge', 'Bundle directory listings and file reads in the last run, by whether they were cached.', [('', [('result', 'hit')], scan['cache_hits']), ('', [('result', 'miss')], scan['cache_misses'])])
+    add_metric('bundle_cache_hit_ratio', 'gauge', 'Share of bundle lookups in the last run answered from the cache.', [('', [], scan['cache_hits'] / lookups if lookups > 0 else 0.0)])
+    return '\n'.join(lines) + '\n'
+
+
+def write_metrics_file(result, metrics_path):
+    """Function that writes the metrics of a generation run to a file, atomically so that a scraper never reads a partial file
+
+    Parameters
+    ----------
+    result : GenerationResult
+        result of the run
+    metrics_path : str
+        path of the metrics file, ex. in the node_exporter textfile collector directory. Must end with .prom to be collected
+    """
+
+    metrics_dir = os.path.dirname(os.path.abspath(metrics_path))
+    # The temporary file is created next to the target, as a rename is only atomic within a filesystem
+    fd, temp_path = tempfile.mkstemp(dir=metrics_dir, prefix='.initIOC-metrics-', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as metrics_fp:
+            metrics_fp.write(format_run_metrics(result))
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, metrics_path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+
+def rollback_run(ioc_top, log=None):
+    """Removes everything created by an incomplete generation run in ioc_top, as recorded in its journal
+
+    The incomplete runs of all shards of a sharded run are rolled back. Journals of runs that are still going,
+    or whose host may still be running them, are skipped, see GenerationJournal.is_abandoned().
+
+    Parameters
+    ----------
+    ioc_top : str
+        IOC top directory of the run
+    log : callable
+        function called with each log message, defaults to initIOC_print
+
+    Returns
+    -------
+    rolled_back : bool
+        True if an incomplete run was found and rolled back
+    """
+
+    if log is None:
+        log = initIOC_print
+    journal_names = []
+    if os.path.isdir(ioc_top):
+        journal_names = [name for name in sorted(os.listdir(ioc_top)) if name.startswith(GenerationJournal.file_name)]
+    if len(journal_names) == 0:
+        log('No incomplete run found in {}.'.format(ioc_top))
+        return False
+    rolled_back = False
+    for journal_name in journal_names:
+        journal = GenerationJournal(ioc_top, journal_name)
+        if not journal.is_abandoned():
+            owner = journal.owner if journal.owner is not None else {}
+            log('Skipping {}, its run may still be going (pid {} on {}).'.format(journal.path, owner.get('pid'), owner.get('host')))
+            continue
+        log('Rolling back incomplete run recorded in {}...'.format(journal.path))
+        journal.rollback(log)
+        rolled_back = True
+    log('Done.')
+    return rolled_back
+
+
+def discard_log(text):
+    """Log function for library calls that should not print anything
+    """
+
+    pass
 
 
 def initIOC_print(text):
@@ -913,71 +6397,355 @@ def parse_args():
 
     parser = argparse.ArgumentParser(description='A script for auto-initializing areaDetector IOCs. Edit the CONFIGURE file and run without arguments for default operation.')
 
-    parser.add_argument('-c', '--configure',        help='Add this flag and path to install script to use a run initIOCs given a configure file.')
+    parser.add_argument('-c', '--configure',        help='Add this flag and path to install script to use a run initIOCs given a configure file. YAML, JSON and CSV files are supported.')
+    parser.add_argument('--config-cache',           help='Directory in which to cache validated configuration files, keyed by file hash.')
     parser.add_argument('-p', '--setlibrarypath',   action='store_true', help='This flag should be added to set library path before startup script is run.')
     parser.add_argument('-t', '--template',         action='store_true', help='This flag will tell initIOC to use an st.cmd template. These are more likely to process without error, but may be somewhat out of date.')
     parser.add_argument('-l', '--links',            action='store_true', help='Add this flag if you would like initIOC to create copies of required helper files instead of links.')
     parser.add_argument('-m', '--minimal',          action='store_true', help='This flag specifies if initIOC should attempt to generate a minimal IOC. May result in some missing files that will need manual tweaks.')
-    parser.add_argument('-s', '--searchbundle',     help='Add this flag, followed by a path to a binary bundle to get a list of driver executables that are included.')
+    parser.add_argument('--output-archive',         help='Write generated IOCs into a tar archive (.tar, .tar.gz, .tar.bz2, .tar.xz or .tar.zst) instead of the IOC directory.')
+    parser.add_argument('--fsync',                  choices=fsync_policies, default='none', help='When to sync generated files to disk: none, once per IOC before it is moved into place, or after every file.')
+    parser.add_argument('--autosave',               choices=autosave_modes, default=None, help='Resolve auto_settings.req includes against the request file paths and report missing files. flatten also writes a single request file, prune also comments out unused set_requestfile_path calls.')
+    parser.add_argument('--command-timeout',        type=float, default=None, help='Seconds an external command, such as cloning ioc-template with -t, may run before it is killed. Defaults to {}.'.format(default_command_timeout))
+    parser.add_argument('--report',                 help='Write a JSON report of the run to the given file, with the status, executable, iocBoot source, files written and phase durations of each IOC. With --benchmark-boot, write the benchmark results instead.')
+    parser.add_argument('--events',                 action='store_true', help='Print a line of JSON to stdout as the run starts and as each IOC and each of its phases completes. Log messages are printed to stderr instead.')
+    parser.add_argument('--metrics-file',           help='At the end of the run, write metrics for the node_exporter textfile collector to the given .prom file.')
+    parser.add_argument('--simulate-latency',       help='Benchmark as if on a network filesystem, delaying each filesystem operation by nfs for typical NFS latencies, or by milliseconds per kind of operation, ex. stat=0.5,listdir=0.5,open=2,modify=1,sync=5. Operation counts are added to --report.')
+    parser.add_argument('--simulate-concurrency',   type=int, default=None, help='With --simulate-latency, maximum number of filesystem operations in flight at once.')
+    parser.add_argument('--shard',                  help='Only generate the IOCs of shard K/N of the configuration, ex. 2/4, so that N hosts can split it. IOCs are assigned by a hash of their name, and locked while generated.')
+    parser.add_argument('--partition',              action='store_true', help='Generate IOCs for each IOC server hostname into a separate directory or archive, in parallel.')
+    parser.add_argument('--serve',                  action='store_true', help='Run as a server that keeps bundle indexes in memory and generates IOCs for requests received on a Unix socket.')
+    parser.add_argument('--submit',                 help='Submit the given configuration file to a running initIOC server, and print its log.')
+    parser.add_argument('--socket',                 default=get_default_socket_path(), help='Unix socket path used by --serve and --submit.')
+    parser.add_argument('--workers',                type=int, help='Maximum number of generation jobs or hosts processed in parallel.')
+    parser.add_argument('--retarget',               help='Point all IOCs in the IOC directory of the configure file given with -c at the given new bundle location.')
+    parser.add_argument('--dry-run',                action='store_true', help='With --retarget, only print the changes that would be made.')
+    parser.add_argument('--rollback',               action='store_true', help='Remove the IOCs created by an interrupted run in the IOC directory of the configure file given with -c.')
+    parser.add_argument('--snapshot',               action='store_true', help='Take a hardlink snapshot of all IOCs in the IOC directory of the configure file given with -c.')
+    parser.add_argument('--list-snapshots',         action='store_true', help='List the snapshots of the IOC directory of the configure file given with -c.')
+    parser.add_argument('--restore-snapshot',       help='Restore the IOCs in the given snapshot of the IOC directory of the configure file given with -c.')
+    parser.add_argument('--verify',                 action='store_true', help='Check that every file referenced by the startup scripts of the IOCs in the IOC directory of the configure file given with -c exists.')
+    parser.add_argument('--watch',                  action='store_true', help='After generating IOCs from a configure file, keep watching the bundle and regenerate IOCs whose driver or dependencies were rebuilt.')
+    parser.add_argument('-s', '--searchbundle',     nargs='+', help='Add this flag, followed by paths to one or more binary bundles to get a table of the driver executables included in each. Bundles are scanned in parallel.')
+    parser.add_argument('--json',                   action='store_true', help='With --searchbundle or --benchmark-boot, print the results as JSON.')
+    parser.add_argument('--benchmark-boot',         help='Measure how long generated IOCs take to reach iocInit with each generation mode, using a synthetic bundle with a stub executable created in the given directory. Needs no EPICS base or detectors.')
+    parser.add_argument('--boot-iocs',              type=int, default=10, help='With --benchmark-boot, number of IOCs booted at once for each mode.')
+    parser.add_argument('--boot-modes',             nargs='+', choices=list(boot_benchmark_modes.keys()), default=None, help='With --benchmark-boot, generation modes to compare. Defaults to all.')
+    parser.add_argument('--boot-modules',           type=int, default=10, help='With --benchmark-boot, number of support modules in the synthetic bundle, which lengthen LD_LIBRARY_PATH.')
+    parser.add_argument('--boot-includes',          type=int, default=5, help='With --benchmark-boot, number of plugin scripts included by the startup script.')
     arguments = vars(parser.parse_args())
     return arguments
 
 
-def search_bundle_for_drivers(bin_top):
-    initIOC_print('\nBundle selected: {}'.format(bin_top))
-    manager = IOCActionManager('.', bin_top, False, False, False, False)
-    initIOC_print('List of detected driver executables:\n+{}'.format('-' * 50))
-    if not os.path.exists(manager.areaDetector_path):
-        initIOC_print('ERROR - No binaries found in location {}\n'.format(bin_top))
+def read_cli_config(config_path, cache_dir=None, log=None):
+    """Reads a configuration file given on the command line, logging every error and exiting if it is not valid
+    """
+
+    if log is None:
+        log = initIOC_print
+    try:
+        return read_ioc_config(config_path, cache_dir, log=log)
+    except ConfigurationError as e:
+        log('ERROR - Configure file {} is not valid:'.format(config_path))
+        for error in e.errors:
+            log('    {}'.format(error))
+        exit(-1)
+
+
+def write_cli_metrics_file(result, metrics_path, log):
+    """Writes the metrics file given on the command line, as a failed run if it ended before a result was returned
+
+    Parameters
+    ----------
+    result : GenerationResult
+        outcome of the run, None if it ended before generating IOCs
+    metrics_path : str
+    log : callable
+
+    Returns
+    -------
+    written : bool
+        False if the file could not be written
+    """
+
+    if result is None:
+        result = GenerationResult(None)
+        result.errors.append('Run ended before generating IOCs')
+    try:
+        write_metrics_file(result, metrics_path)
+    except OSError as e:
+        log('ERROR - Could not write metrics file {}: {}'.format(metrics_path, e))
         return False
-    for dir in os.listdir(manager.areaDetector_path):
-        if os.path.isdir(os.path.join(manager.areaDetector_path, dir)):
-            _, bin_path, _ = manager.find_paths_for_action(dir)
-            if bin_path is not None:
-                initIOC_print('+ {:<16} -   {}'.format(dir, bin_path))
     return True
 
 
+def read_ioc_dir_config(arguments, flags):
+    """Reads the configure file given with -c for commands that operate on its IOC directory, exiting if there is none
+    """
+
+    if arguments['configure'] is None:
+        initIOC_print('ERROR - {} requires a configure file given with -c to locate the IOC directory.'.format(flags))
+        exit(-1)
+    return read_cli_config(arguments['configure'], arguments['config_cache'])
+
+
+def scan_bundle_drivers(bin_top):
+    """Finds the executable, architecture and iocBoot directory of every driver in a bundle
+
+    Parameters
+    ----------
+    bin_top : str
+        path to the bundle
+
+    Returns
+    -------
+    drivers : dict of str -> dict
+        entry for each areaDetector driver directory with 'executable', 'arch' and 'iocBoot' keys, each None if
+        not found, for the default architecture, 'architectures', listing all architectures the executable
+        was found for, and 'connection', the connection variable from the driver registry. None if the bundle
+        has no areaDetector directory
+    """
+
+    index = BundleIndex(bin_top)
+    if not os.path.exists(index.areaDetector_path):
+        return None
+
+    drivers = {}
+    for ioc_type, info in index.get_driver_registry().drivers.items():
+        entry = {'executable' : None, 'arch' : None, 'iocBoot' : None, 'architectures' : [], 'connection' : info.connection_variable}
+        # Without an executable the search stops at the architecture directory
+        if info.executable_path is not None and os.path.isfile(info.executable_path):
+            entry['executable'] = info.executable_path
+            entry['arch'] = index.get_default_architecture(ioc_type)
+        entry['architectures'] = [arch for arch, path in sorted(index.get_driver_scan(ioc_type)[1].items()) if os.path.isfile(path)]
+        if info.iocBoot_path is not None and os.path.basename(info.iocBoot_path) != 'iocBoot':
+            entry['iocBoot'] = info.iocBoot_path
+        drivers[ioc_type] = entry
+    return drivers
+
+
+def compare_bundles(bin_tops, max_workers=None):
+    """Scans several bundles concurrently, and collects the drivers found in each
+
+    Parameters
+    ----------
+    bin_tops : list of str
+        paths to the bundles
+    max_workers : int
+        maximum number of bundles scanned in parallel
+
+    Returns
+    -------
+    matrix : dict of str -> dict of str -> dict
+        entry from scan_bundle_drivers for each driver and bundle, None for bundles without the driver
+    errors : dict of str -> str
+        reason each bundle that could not be scanned was skipped
+    """
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        scans = dict(zip(bin_tops, executor.map(scan_bundle_drivers, bin_tops)))
+
+    errors = {}
+    for bin_top, drivers in scans.items():
+        if not os.path.exists(bin_top):
+            errors[bin_top] = 'bundle location does not exist'
+        elif drivers is None:
+            errors[bin_top] = 'no binaries found'
+    matrix = {}
+    for ioc_type in sorted(set([ioc_type for drivers in scans.values() if drivers is not None for ioc_type in drivers])):
+        matrix[ioc_type] = {bin_top : (drivers or {}).get(ioc_type) for bin_top, drivers in scans.items()}
+    return matrix, errors
+
+
+def search_bundle_for_drivers(bin_tops, as_json=False, max_workers=None):
+    """Prints the drivers found in one or more bundles, as a driver by bundle table or as JSON
+
+    Returns
+    -------
+    found : bool
+        False if any of the bundles could not be scanned
+    """
+
+    if isinstance(bin_tops, str):
+        bin_tops = [bin_tops]
+    matrix, errors = compare_bundles(bin_tops, max_workers=max_workers)
+    if as_json:
+        initIOC_print(json.dumps({'bundles' : bin_tops, 'errors' : errors, 'drivers' : matrix}, indent=4))
+        return len(errors) == 0
+
+    for i, bin_top in enumerate(bin_tops, 1):
+        initIOC_print('Bundle [{}]: {}{}'.format(i, bin_top, '' if bin_top not in errors else ' - ERROR - {}'.format(errors[bin_top])))
+    initIOC_print('\nDetected driver executables, with architecture and iocBoot directory. Drivers marked with * differ between bundles:\n+{}'.format('-' * 50))
+    for ioc_type, entries in matrix.items():
+        cells = []
+        for bin_top in bin_tops:
+            entry = entries[bin_top]
+            if entry is None:
+                cells.append('-')
+            elif entry['executable'] is None:
+                cells.append('no executable')
+            else:
+                cells.append('{} ({})'.format(', '.join(entry['architectures']), os.path.basename(entry['iocBoot']) if entry['iocBoot'] is not None else 'no iocBoot'))
+        differs = len(set([cell for cell, bin_top in zip(cells, bin_tops) if bin_top not in errors])) > 1
+        initIOC_print('+{}{:<16} - {}'.format('*' if differs else ' ', ioc_type, ' | '.join(['[{}] {:<32}'.format(i, cell) for i, cell in enumerate(cells, 1)]).rstrip()))
+        if len(bin_tops) == 1 and entries[bin_tops[0]] is not None and entries[bin_tops[0]]['executable'] is not None:
+            initIOC_print('|   {}'.format(entries[bin_tops[0]]['executable']))
+            if entries[bin_tops[0]]['connection'] is not None:
+                initIOC_print('|   connection parameter: {}'.format(entries[bin_tops[0]]['connection']))
+    return len(errors) == 0
+
+
 # Run the script
 def main():
 
     try:
         arguments = parse_args()
         if arguments['searchbundle'] is not None:
-            initIOC_print('\nSearching for driver executables...\n')
-            bin_top = arguments['searchbundle']
-            if not os.path.exists(bin_top):
-                initIOC_print('Selected bundle location does not exist.')
+            if not arguments['json']:
+                initIOC_print('\nSearching for driver executables...\n')
+            found = search_bundle_for_drivers(arguments['searchbundle'], as_json=arguments['json'], max_workers=arguments['workers'])
+            if not arguments['json']:
+                initIOC_print('')
+            exit(0 if found else -1)
+
+        if arguments['benchmark_boot'] is not None:
+            if platform == 'win32':
+                initIOC_print('ERROR - The boot time benchmark relies on shebang lines, and does not run on windows.')
+                exit(-1)
+            log = initIOC_print if not arguments['json'] else discard_log
+            try:
+                report = benchmark_boot_times(arguments['benchmark_boot'], modes=arguments['boot_modes'], num_iocs=arguments['boot_iocs'], modules=arguments['boot_modules'], includes=arguments['boot_includes'], log=log)
+            except ValueError as e:
+                initIOC_print('ERROR - {}'.format(e))
+                exit(-1)
+            if arguments['json']:
+                initIOC_print(json.dumps(report, indent=4))
             else:
-                _ = search_bundle_for_drivers(bin_top)
-            initIOC_print('')
+                initIOC_print('')
+                print_boot_benchmark(report)
+            if arguments['report'] is not None:
+                with open(arguments['report'], 'w') as report_fp:
+                    json.dump(report, report_fp, indent=4)
+            exit(0 if report['success'] else -1)
+
+        options = GenerationOptions(set_lib_path=arguments['setlibrarypath'],
+                                    use_template=arguments['template'],
+                                    with_deps=not arguments['minimal'],
+                                    use_links=arguments['links'],
+                                    output_archive=arguments['output_archive'],
+                                    partition=arguments['partition'],
+                                    max_workers=arguments['workers'],
+                                    config_cache=arguments['config_cache'],
+                                    fsync=arguments['fsync'],
+                                    autosave=arguments['autosave'],
+                                    command_timeout=arguments['command_timeout'],
+                                    shard=arguments['shard'])
+
+        if arguments['serve']:
+            if not run_server(arguments['socket'], max_workers=arguments['workers']):
+                exit(-1)
             exit()
 
-        if arguments['configure'] is not None:
+        if arguments['submit'] is not None:
+            configuration = read_cli_config(arguments['submit'], arguments['config_cache'])
+            # The server does not share our working directory
+            configuration['ioc_dir'] = os.path.abspath(configuration['ioc_dir'])
+            configuration['bundle_location'] = os.path.abspath(configuration['bundle_location'])
+            if options.output_archive is not None:
+                options.output_archive = os.path.abspath(options.output_archive)
             try:
-                configuration = read_ioc_config(arguments['configure'])
-                actions = []
-                for ioc in configuration['iocs']:
-                    actions.append(IOCAction(ioc, configuration['beamline_prefix']))
-                manager = IOCActionManager(configuration['ioc_dir'], configuration['bundle_location'], arguments['setlibrarypath'], arguments['template'], not arguments['minimal'], arguments['links'])
-                for action in actions:
-                    # Add parameters to environment variables
-                    action.epics_environment['ENGINEER'] = configuration['engineer']
-                    action.epics_environment['HOSTNAME'] = configuration['hostname']
-                    action.epics_environment['EPICS_CA_ADDR_LIST'] = configuration['ca_address_ip']
-            except KeyError:
-                initIOC_print('ERROR - Configure file could not be parsed successfully. Please ensure that it is valid!')
+                result = submit_job(configuration, options, arguments['socket'])
+            except OSError as e:
+                initIOC_print('ERROR - Could not connect to initIOC server on {}: {}'.format(arguments['socket'], e))
                 exit(-1)
-        
-            print_start_message()
-            init_iocs_cli(actions, manager)
-            global WITH_YAML
-            if WITH_YAML:
-                for action in actions:
-                    with open(os.path.join(manager.ioc_top, action.ioc_name, 'initIOCs.yml'), 'w') as config_file:
-                        yaml.safe_dump(configuration, config_file)
-            else:
-                initIOC_print('Python yaml library not installed!')
+            for error in result['errors']:
+                initIOC_print('ERROR - {}'.format(error))
+            if not result['success']:
+                exit(-1)
+            exit()
+
+        if arguments['rollback']:
+            configuration = read_ioc_dir_config(arguments, '--rollback')
+            if not rollback_run(configuration['ioc_dir']):
+                exit(-1)
+            exit()
+
+        if arguments['snapshot'] or arguments['list_snapshots'] or arguments['restore_snapshot'] is not None:
+            configuration = read_ioc_dir_config(arguments, '--snapshot, --list-snapshots and --restore-snapshot')
+            if not manage_snapshots(configuration['ioc_dir'], arguments['snapshot'], arguments['list_snapshots'], arguments['restore_snapshot']):
+                exit(-1)
+            exit()
+
+        if arguments['verify']:
+            configuration = read_ioc_dir_config(arguments, '--verify')
+            problems = verify_iocs(configuration['ioc_dir'], max_workers=arguments['workers'])
+            if len(problems) == 0 or any([len(ioc_problems) > 0 for ioc_problems in problems.values()]):
+                exit(-1)
+            exit()
+
+        if arguments['retarget'] is not None:
+            configuration = read_ioc_dir_config(arguments, '--retarget')
+            results = retarget_iocs(configuration['ioc_dir'], os.path.abspath(arguments['retarget']), dry_run=arguments['dry_run'], max_workers=arguments['workers'])
+            if len(results) == 0 or any([result.error is not None for result in results]):
+                exit(-1)
+            exit()
+
+        if arguments['configure'] is not None:
+            # Every way the run can end, ex. an invalid configuration, still leaves a sample in the metrics file
+            result = None
+            metrics_written = False
+            log = initIOC_print
+            events = None
+            if arguments['events']:
+                # stdout only carries events, so that it can be parsed line by line
+                def log(text):
+                    print(text, file=sys.stderr)
+                events = make_event_writer(sys.stdout)
+            try:
+                configuration = read_cli_config(arguments['configure'], arguments['config_cache'], log=log)
+
+                if arguments['watch'] and options.output_archive is not None:
+                    log('ERROR - IOCs written into an archive cannot be watched.')
+                    exit(-1)
+
+                filesystem = None
+                if arguments['simulate_latency'] is not None:
+                    try:
+                        latencies = parse_latency_spec(arguments['simulate_latency'])
+                    except ValueError as e:
+                        log('ERROR - Invalid --simulate-latency {}: {}'.format(arguments['simulate_latency'], e))
+                        exit(-1)
+                    if arguments['simulate_concurrency'] is not None and arguments['simulate_concurrency'] < 1:
+                        log('ERROR - --simulate-concurrency must be at least 1.')
+                        exit(-1)
+                    filesystem = LatencyFileSystem(latencies=latencies, max_concurrent=arguments['simulate_concurrency'])
+
+                if events is None:
+                    print_start_message()
+                result = generate(configuration, options, log=log, events=events, filesystem=filesystem)
+                for error in result.errors:
+                    log('ERROR - {}'.format(error))
+                if not WITH_YAML:
+                    log('Python yaml library not installed!')
+                if events is not None:
+                    events({'event' : 'done', 'success' : result.success, 'errors' : result.errors, 'time' : time.time()})
+                if arguments['report'] is not None:
+                    try:
+                        write_run_report(result, arguments['report'])
+                    except OSError as e:
+                        log('ERROR - Could not write report {}: {}'.format(arguments['report'], e))
+                        exit(-1)
+                if arguments['metrics_file'] is not None:
+                    metrics_written = True
+                    if not write_cli_metrics_file(result, arguments['metrics_file'], log):
+                        exit(-1)
+                if arguments['watch'] and len(result.errors) == 0:
+                    BundleWatcher(configuration, options, log=log).run()
+                elif not result.success:
+                    exit(-1)
+            finally:
+                if arguments['metrics_file'] is not None and not metrics_written:
+                    write_cli_metrics_file(result, arguments['metrics_file'], log)
         else:
             ioc_top, bin_top = prompt_for_top_dirs()
             manager = IOCActionManager(ioc_top, bin_top, arguments['setlibrarypath'], arguments['template'], not arguments['minimal'], arguments['links'])
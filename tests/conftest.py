@@ -0,0 +1,50 @@
+import os
+import pytest
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+@pytest.fixture
+def make_config():
+    """
+    Fixture that returns a function building a generation configuration
+    with simulated detector IOCs cam-sim1, cam-sim2, ...
+
+    Parameters of the returned function
+    -----------------------------------
+    ioc_dir : str
+        IOC top directory
+    bundle : str
+        bundle location, the standard test bundle by default
+    num_iocs : int
+        number of simulated detector IOCs
+    with_missing : bool
+        also add cam-missing, whose driver is not in the bundle
+
+    Returns
+    -------
+    make : callable
+        function returning the configuration as a dict, not yet validated
+    """
+
+    def make(ioc_dir, bundle=BUNDLE, num_iocs=1, with_missing=False):
+        iocs = [
+            {'name' : 'cam-sim{}'.format(i), 'type' : 'ADSimDetector', 'device_prefix' : '{{Sim-Cam:{}}}'.format(i), 'asyn_port' : 'SIM{}'.format(i), 'telnet_port' : 4000 + i, 'connection' : 'NA'}
+            for i in range(1, num_iocs + 1)
+        ]
+        if with_missing:
+            iocs.append({'name' : 'cam-missing', 'type' : 'ADMissing', 'device_prefix' : '{Missing-Cam:1}', 'asyn_port' : 'MIS1', 'telnet_port' : 4000, 'connection' : 'NA'})
+        config = {
+            'ioc_dir' :         ioc_dir,
+            'bundle_location' : bundle,
+            'beamline_prefix' : 'TEST1:',
+            'engineer' :        'J. Wlodek',
+            'hostname' :        'localhost',
+            'ca_address_ip' :   '127.0.0.255',
+            'iocs' :            iocs,
+        }
+        return config
+
+    return make
@@ -1,3 +1,4 @@
+import pytest
 import os
 import shutil
 import initIOCs
@@ -142,4 +143,60 @@ def test_generate_st_cmd():
     fp1.close()
     fp2.close()
     shutil.rmtree('testiocs')
-    os.chdir('..')
\ No newline at end of file
+    os.chdir('..')
+
+def test_shared_driver_environment():
+    ioc = {'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'}
+    action_A = initIOCs.IOCAction(ioc, 'TEST1:')
+    action_B = initIOCs.IOCAction(dict(ioc, name='cam-sim2', asyn_port='SIM2'), 'TEST1:')
+    action_C = initIOCs.IOCAction(dict(ioc, name='cam-sim3', asyn_port='SIM3'), 'TEST1:')
+    action_A.add_to_environment('epicsEnvSet("QSIZE",  "20")')
+    action_A.add_to_environment('epicsEnvSet("PORT",   "SIM1")')
+    action_A.epics_environment['EPICS_CA_ADDR_LIST'] = '127.0.0.255'
+    shared = action_A.freeze_driver_environment()
+    assert shared == {'QSIZE' : '20'}
+    with pytest.raises(TypeError):
+        shared['QSIZE'] = '10'
+
+    action_B.share_driver_environment(shared)
+    action_B.add_to_environment('epicsEnvSet("QSIZE",  "20")')
+    assert action_B.driver_environment is shared
+    assert action_B.epics_environment['QSIZE'] == '20'
+    assert action_B.epics_environment['PORT'] == 'SIM2'
+    assert action_B.epics_environment['EPICS_CA_ADDR_LIST'] == 'NA'
+
+    # A different value is written into a copy, leaving the shared layer unchanged
+    action_C.share_driver_environment(shared)
+    action_C.add_to_environment('epicsEnvSet("QSIZE",  "10")')
+    assert action_C.epics_environment['QSIZE'] == '10'
+    assert action_B.epics_environment['QSIZE'] == '20'
+    with pytest.raises(AttributeError):
+        action_A.unknown_attribute = True
+
+
+def test_driver_environment_frozen_once(tmp_path, make_config, monkeypatch):
+    frozen = []
+    freeze_driver_environment = initIOCs.IOCAction.freeze_driver_environment
+
+    def counting_freeze(self):
+        frozen.append(self.ioc_name)
+        return freeze_driver_environment(self)
+
+    monkeypatch.setattr(initIOCs.IOCAction, 'freeze_driver_environment', counting_freeze)
+    assert initIOCs.generate(make_config(str(tmp_path / 'iocs'), num_iocs=3), log=lambda text : None).success
+    # Only the first IOC of the type freezes its environment, the others share it
+    assert frozen == ['cam-sim1']
+
+
+def test_environment_order():
+    ioc = {'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'}
+    action = initIOCs.IOCAction(ioc, 'TEST1:')
+    action.epics_environment['ENGINEER'] = 'J. Wlodek'
+    action.epics_environment['HOSTNAME'] = 'localhost'
+    action.epics_environment['EPICS_CA_ADDR_LIST'] = '127.0.0.255'
+    action.add_to_environment('epicsEnvSet("QSIZE",  "20")')
+    action.add_to_environment('epicsEnvSet("XSIZE",  "1024")')
+    # Same order unique.cmd has always been written in
+    assert [env_var for env_var, _ in action.environment_items()] == ['PORT', 'IOC', 'EPICS_CA_AUTO_ADDR_LIST', 'EPICS_CA_ADDR_LIST', 'EPICS_CA_MAX_ARRAY_BYTES',
+                                                                      'PREFIX', 'CTPREFIX', 'IOCNAME', 'ENGINEER', 'HOSTNAME', 'QSIZE', 'XSIZE']
+    assert dict(action.environment_items())['EPICS_CA_ADDR_LIST'] == '127.0.0.255'
@@ -0,0 +1,59 @@
+import os
+import shutil
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SIM_BIN = os.path.join('support', 'areaDetector', 'ADSimDetector', 'iocs', 'simDetectorIOC', 'bin')
+
+
+def make_bundle(tmp_path):
+    """Copies the test bundle, adding a debug build of the simulated detector
+    """
+
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), bundle, symlinks=True)
+    shutil.copytree(os.path.join(bundle, SIM_BIN, 'linux-x86_64'), os.path.join(bundle, SIM_BIN, 'linux-x86_64-debug'), symlinks=True)
+    return bundle
+
+
+def read_file(path):
+    with open(path, 'r') as fp:
+        return fp.read()
+
+
+def test_index_all_architectures(tmp_path):
+    index = initIOCs.BundleIndex(make_bundle(tmp_path))
+    assert index.get_architectures('ADSimDetector') == ['linux-x86_64', 'linux-x86_64-debug']
+    # The default does not depend on listing order
+    assert index.get_default_architecture('ADSimDetector') == 'linux-x86_64'
+    assert index.find_driver_paths('ADSimDetector')[1].endswith(os.path.join('linux-x86_64', 'simDetectorApp'))
+    assert index.find_driver_paths('ADSimDetector', 'linux-x86_64-debug')[1].endswith(os.path.join('linux-x86_64-debug', 'simDetectorApp'))
+    assert index.find_driver_paths('ADSimDetector', 'linux-arm')[1] is None
+
+
+def test_per_ioc_architecture(tmp_path, make_config):
+    bundle = make_bundle(tmp_path)
+    ioc_dir = str(tmp_path / 'iocs')
+    config = make_config(ioc_dir, bundle, num_iocs=2)
+    config['arch'] = 'linux-x86_64-debug'
+    config['iocs'][0]['arch'] = 'linux-x86_64'
+    result = initIOCs.generate(config, initIOCs.GenerationOptions(set_lib_path=True), log=lambda text : None)
+    assert result.success
+
+    for ioc_name, arch in [('cam-sim1', 'linux-x86_64'), ('cam-sim2', 'linux-x86_64-debug')]:
+        other = 'linux-x86_64-debug' if arch == 'linux-x86_64' else 'linux-x86_64'
+        st_cmd = read_file(os.path.join(ioc_dir, ioc_name, 'st.cmd'))
+        assert os.path.join(SIM_BIN, arch, 'simDetectorApp') in st_cmd
+        assert os.path.join('lib', arch) + ':' in st_cmd
+        assert os.path.join('lib', other) + ':' not in st_cmd
+        assert 'epicsEnvSet("ARCH", "{}")'.format(arch) in read_file(os.path.join(ioc_dir, ioc_name, 'envPaths'))
+
+
+def test_missing_architecture(tmp_path, make_config):
+    bundle = make_bundle(tmp_path)
+    config = make_config(str(tmp_path / 'iocs'), bundle, num_iocs=2)
+    config['iocs'][1]['arch'] = 'linux-arm'
+    result = initIOCs.generate(config, log=lambda text : None)
+    assert [ioc_result.status for ioc_result in result.ioc_results] == ['created', 'failed']
+    assert 'linux-x86_64, linux-x86_64-debug' in result.ioc_results[1].messages[0]
@@ -0,0 +1,68 @@
+import os
+import tarfile
+import pytest
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def make_action(name):
+    ioc = {'name' : name, 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'}
+    action = initIOCs.IOCAction(ioc, 'TEST1:')
+    action.epics_environment['HOSTNAME'] = 'localhost'
+    return action
+
+
+def test_archive_output(tmp_path):
+    ioc_top = str(tmp_path / 'iocs')
+    archive_path = str(tmp_path / 'iocs.tar.gz')
+    output = initIOCs.TarArchiveOutput(archive_path, ioc_top)
+    manager = initIOCs.IOCActionManager(ioc_top, BUNDLE, False, False, True, False, output=output)
+    manager.process_action(make_action('cam-sim1'))
+    manager.process_action(make_action('cam-sim1'))
+    output.close()
+
+    # Nothing is written outside of the archive
+    assert not os.path.exists(ioc_top)
+    with tarfile.open(archive_path, 'r:gz') as archive:
+        members = {member.name : member for member in archive.getmembers()}
+        assert members['cam-sim1'].isdir()
+        assert members['cam-sim1/autosave'].isdir()
+        assert members['cam-sim1/st.cmd'].mode == 0o755
+        assert members['cam-sim1/envPaths'].mode == 0o644
+        assert 'NAME=cam-sim1' in archive.extractfile('cam-sim1/config').read().decode()
+        source = os.path.join(BUNDLE, 'support/areaDetector/ADSimDetector/iocs/simDetectorIOC/iocBoot/iocSimDetector/auto_settings.req')
+        with open(source, 'rb') as source_fp:
+            assert archive.extractfile('cam-sim1/auto_settings.req').read() == source_fp.read()
+        # Second IOC with the same name is rejected
+        assert archive.getnames().count('cam-sim1/st.cmd') == 1
+
+
+def test_archive_output_links(tmp_path):
+    ioc_top = str(tmp_path / 'iocs')
+    archive_path = str(tmp_path / 'iocs.tar')
+    output = initIOCs.TarArchiveOutput(archive_path, ioc_top)
+    manager = initIOCs.IOCActionManager(ioc_top, BUNDLE, False, False, True, True, output=output)
+    manager.process_action(make_action('cam-sim1'))
+    output.close()
+
+    with tarfile.open(archive_path, 'r:') as archive:
+        link = archive.getmember('cam-sim1/auto_settings.req')
+        assert link.issym()
+        assert link.linkname.endswith('iocSimDetector/auto_settings.req')
+
+
+def test_archive_chmod_unknown_path(tmp_path):
+    ioc_top = str(tmp_path / 'iocs')
+    output = initIOCs.TarArchiveOutput(str(tmp_path / 'iocs.tar'), ioc_top)
+    with output.open(os.path.join(ioc_top, 'cam-sim1', 'st.cmd')) as fp:
+        fp.write('iocInit\n')
+    output.chmod(os.path.join(ioc_top, 'cam-sim1', 'st.cmd'), 0o755)
+    output.finish()
+    # Members already in the archive, and paths never written, cannot change
+    for path in [os.path.join(ioc_top, 'cam-sim1', 'st.cmd'), os.path.join(ioc_top, 'cam-sim1', 'envPaths')]:
+        with pytest.raises(ValueError, match='envPaths|st.cmd'):
+            output.chmod(path, 0o755)
+    output.close()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SIM_DETECTOR = os.path.join('support', 'areaDetector', 'ADSimDetector')
+IOC_BOOT = os.path.join(SIM_DETECTOR, 'iocs', 'simDetectorIOC', 'iocBoot', 'iocSimDetector')
+
+
+def make_bundle(tmp_path):
+    """Copies the test bundle, adding the request files included by simDetector_settings.req
+    """
+
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), bundle, symlinks=True)
+    request_dir = os.path.join(bundle, SIM_DETECTOR, 'simDetectorApp', 'Db')
+    os.makedirs(request_dir)
+    with open(os.path.join(request_dir, 'simDetector_settings.req'), 'w') as fp:
+        fp.write('# Settings of the simulated detector\n$(P)$(R)GainX\nfile "ADBase_settings.req", P=$(P), R=$(R)\n')
+    with open(os.path.join(request_dir, 'ADBase_settings.req'), 'w') as fp:
+        fp.write('$(P)$(R)AcquireTime\n')
+    return bundle
+
+
+def test_parse_request_include():
+    assert initIOCs.parse_request_include('file "simDetector_settings.req", P=$(P), R=cam1:') == ('simDetector_settings.req', {'P' : '$(P)', 'R' : 'cam1:'})
+    assert initIOCs.parse_request_include('file NDPluginBase_settings.req P=$(P),R=ROI1:') == ('NDPluginBase_settings.req', {'P' : '$(P)', 'R' : 'ROI1:'})
+    assert initIOCs.parse_request_include('$(P)$(R)AcquireTime') is None
+    assert initIOCs.substitute_request_macros('$(P)$(R)AcquireTime', {'R' : 'cam1:'}) == '$(P)cam1:AcquireTime'
+
+
+def test_flatten_auto_settings(tmp_path, make_config):
+    bundle = make_bundle(tmp_path)
+    ioc_dir = str(tmp_path / 'iocs')
+    result = initIOCs.generate(make_config(ioc_dir, bundle), initIOCs.GenerationOptions(autosave='flatten'), log=lambda text : None)
+    assert result.success
+
+    with open(os.path.join(ioc_dir, 'cam-sim1', 'auto_settings.req'), 'r') as fp:
+        lines = fp.read().splitlines()
+    assert '$(P)cam1:GainX' in lines
+    assert '$(P)cam2:AcquireTime' in lines
+    assert not any(['simDetector_settings.req' in line for line in lines])
+    # Includes missing from the bundle are reported, and kept for autosave to search for at runtime
+    assert any([line.startswith('file "NDStdArrays_settings.req"') for line in lines])
+    warnings = [message for message in result.ioc_results[0].messages if 'NDStdArrays_settings.req' in message]
+    assert len(warnings) == 2
+    # The bundle copy is left untouched
+    with open(os.path.join(bundle, IOC_BOOT, 'auto_settings.req'), 'r') as fp:
+        assert 'file "simDetector_settings.req"' in fp.read()
+
+
+def test_prune_request_paths(tmp_path, make_config):
+    bundle = make_bundle(tmp_path)
+    st_base = os.path.join(bundle, IOC_BOOT, 'st_base.cmd')
+    with open(st_base, 'r') as fp:
+        text = fp.read()
+    with open(st_base, 'w') as fp:
+        fp.write(text.replace('set_requestfile_path("$(ADSIMDETECTOR)/simDetectorApp/Db")',
+                              'set_requestfile_path("$(ADSIMDETECTOR)/simDetectorApp/Db")\nset_requestfile_path("$(ADSIMDETECTOR)/iocs")'))
+
+    ioc_dir = str(tmp_path / 'iocs')
+    assert initIOCs.generate(make_config(ioc_dir, bundle), initIOCs.GenerationOptions(autosave='prune'), log=lambda text : None).success
+    with open(os.path.join(ioc_dir, 'cam-sim1', 'st_base.cmd'), 'r') as fp:
+        lines = fp.read().splitlines()
+    assert 'set_requestfile_path("$(ADSIMDETECTOR)/simDetectorApp/Db")' in lines
+    assert '#set_requestfile_path("$(ADSIMDETECTOR)/iocs")' in lines
+    # The request file itself is only flattened in flatten mode
+    with open(os.path.join(ioc_dir, 'cam-sim1', 'auto_settings.req'), 'r') as fp:
+        assert 'file "simDetector_settings.req"' in fp.read()
@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import tempfile
+import pytest
+import initIOCs
+
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason='stub IOCs are started through shebang lines')
+
+
+def test_percentile():
+    values = [0.5, 0.1, 0.4, 0.2, 0.3]
+    assert initIOCs.get_percentile(values, 50) == 0.3
+    assert initIOCs.get_percentile(values, 99) == 0.5
+    assert initIOCs.get_percentile(values, 1) == 0.1
+    assert initIOCs.get_percentile([], 50) is None
+
+
+@pytest.fixture
+def short_dir():
+    # pytest temporary directories are too deep for the stub executable to be started by a shebang line
+    path = tempfile.mkdtemp()
+    yield path
+    shutil.rmtree(path)
+
+
+def test_benchmark_boot_times(short_dir):
+    work_dir = os.path.join(short_dir, 'boot')
+    report = initIOCs.benchmark_boot_times(work_dir, modes=['shebang', 'lib-path'], num_iocs=3, modules=2, includes=3)
+    assert (report['benchmark'], report['success'], report['errors']) == ('boot', True, [])
+    assert report['parameters'] == {'iocs' : 3, 'modules' : 2, 'includes' : 3, 'modes' : ['shebang', 'lib-path'], 'timeout' : 60}
+
+    for mode in ['shebang', 'lib-path']:
+        mode_report = report['results'][mode]
+        assert mode_report['errors'] == []
+        assert (mode_report['booted'], mode_report['failed']) == (3, 0)
+        assert mode_report['missing'] == []
+        times = mode_report['time_to_init']
+        assert 0 < times['p50'] <= times['p90'] <= times['p99'] <= times['max']
+    # Setting the library path needs a bash wrapper
+    assert report['results']['shebang']['launcher'] == 'shebang'
+    assert report['results']['lib-path']['launcher'] == 'bash'
+    assert report['results']['lib-path']['lib_path_length'] > report['results']['shebang']['lib_path_length'] == 0
+
+    # The stub follows every include of the startup script up to iocInit
+    ioc_path = os.path.join(work_dir, 'shebang', 'cam-sim1')
+    boot = initIOCs.boot_iocs([ioc_path])[0]
+    assert boot['includes'] == 6
+    assert boot['time_to_init'] > 0
+
+    # An IOC that cannot be started is a failed boot, the others still boot
+    other_path = os.path.join(work_dir, 'shebang', 'cam-sim2')
+    os.chmod(os.path.join(other_path, 'st.cmd'), 0o644)
+    boots = initIOCs.boot_iocs([other_path, ioc_path])
+    assert boots[0]['time_to_init'] is None and 'Could not start IOC' in boots[0]['error']
+    assert boots[1]['time_to_init'] > 0
+
+    # The benchmark directory is replaced by the next run
+    report = initIOCs.benchmark_boot_times(work_dir, modes=['minimal'], num_iocs=1, modules=1, includes=1)
+    assert report['success']
+    assert sorted(os.listdir(work_dir)) == sorted([initIOCs.boot_benchmark_marker, 'bundle', 'minimal'])
+
+
+def test_benchmark_keeps_other_dirs(tmp_path):
+    # A directory the benchmark did not create is never removed
+    work_dir = tmp_path / 'data'
+    work_dir.mkdir()
+    (work_dir / 'results.txt').write_text('keep')
+    with pytest.raises(ValueError):
+        initIOCs.benchmark_boot_times(str(work_dir), modes=['shebang'], num_iocs=1)
+    assert os.listdir(str(work_dir)) == ['results.txt']
+
+
+def test_benchmark_shebang_limit(tmp_path, monkeypatch):
+    # A bundle too deep for a direct shebang would make the shebang mode use bash as well
+    work_dir = str(tmp_path / ('d' * initIOCs.KERNEL_PATH_LIMIT))
+    with pytest.raises(ValueError):
+        initIOCs.benchmark_boot_times(work_dir, modes=['shebang'], num_iocs=1)
+    assert not os.path.exists(work_dir)
+
+    # So would an interpreter too long for the shebang line of the stub executable
+    monkeypatch.setattr(initIOCs.sys, 'executable', '/' + 'p' * initIOCs.KERNEL_PATH_LIMIT)
+    bundle_path = str(tmp_path / 'bundle')
+    with pytest.raises(ValueError):
+        initIOCs.make_stub_bundle(bundle_path)
+    assert not os.path.exists(bundle_path)
@@ -1,8 +1,13 @@
 import pytest
 import os
+import re
+import shutil
 import initIOCs
 
 
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
 manager_flat = initIOCs.IOCActionManager('tests/testiocs', 'tests/test_bundle_flat', False, False, False, True)
 manager_standard = initIOCs.IOCActionManager('tests/testiocs', 'tests/test_bundle_standard', False, False, False, True)
 
@@ -39,3 +44,69 @@ def test_find_files_standard():
     assert sim_dbd == det_dbd
     assert sim_iocBoot == det_iocBoot
 
+
+
+def test_bundle_index_scans_once():
+    index = initIOCs.BundleIndex(os.path.join(TEST_DIR, 'test_bundle_standard'))
+    paths = index.find_driver_paths('ADSimDetector')
+    assert paths[1].endswith('bin/linux-x86_64/simDetectorApp')
+    assert index.find_driver_paths('ADSimDetector') is paths
+    assert index.find_driver_paths('ADMissing') == (None, None, None)
+    assert 'ADSimDetector' in index.list_module_dirs(index.areaDetector_path)
+    assert index.list_module_dirs(os.path.join(TEST_DIR, 'does_not_exist')) == []
+
+    # Managers created for other partitions share the same index
+    manager = initIOCs.IOCActionManager(os.path.join(TEST_DIR, 'testiocs'), os.path.join(TEST_DIR, 'test_bundle_standard'), False, False, False, True, bundle_index=index)
+    assert manager.partition(os.path.join(TEST_DIR, 'testiocs', 'host1')).bundle_index is index
+
+
+def test_compare_bundles(tmp_path):
+    standard = os.path.join(TEST_DIR, 'test_bundle_standard')
+    candidate = str(tmp_path / 'candidate')
+    shutil.copytree(standard, candidate, symlinks=True)
+    os.remove(os.path.join(candidate, 'support', 'areaDetector', 'ADSimDetector', 'iocs', 'simDetectorIOC', 'bin', 'linux-x86_64', 'simDetectorApp'))
+    missing = str(tmp_path / 'missing')
+
+    matrix, errors = initIOCs.compare_bundles([standard, candidate, missing])
+    assert errors == {missing : 'bundle location does not exist'}
+    sim = matrix['ADSimDetector']
+    assert sim[standard]['arch'] == 'linux-x86_64'
+    assert sim[standard]['iocBoot'].endswith(os.path.join('iocBoot', 'iocSimDetector'))
+    assert sim[candidate]['executable'] is None
+    assert sim[missing] is None
+
+
+def test_driver_registry(tmp_path, make_config):
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), bundle, symlinks=True)
+    iocBoot = os.path.join(bundle, 'support', 'areaDetector', 'ADSimDetector', 'iocs', 'simDetectorIOC', 'iocBoot', 'iocSimDetector')
+    with open(os.path.join(iocBoot, 'st_base.cmd'), 'r') as fp:
+        lines = fp.readlines()
+    with open(os.path.join(iocBoot, 'st_base.cmd'), 'w') as fp:
+        fp.writelines(lines[:1] + ['epicsEnvSet("SIM_IP", "10.0.0.1")\n'] + lines[1:])
+
+    index = initIOCs.BundleIndex(bundle)
+    registry = index.get_driver_registry()
+    assert index.get_driver_registry() is registry
+    # Drivers are only looked up as they are used
+    assert registry.get_connection_variable('ADSimDetector') == 'SIM_IP'
+    assert list(registry.found.keys()) == ['ADSimDetector'] and not registry.complete
+    assert registry.get('ADMissing') is None
+    assert registry.has_template('ADSimDetector') == ('ADSimDetector' in initIOCs.supported_drivers)
+    assert not registry.has_template('ADMissing')
+    assert registry.names() == ['ADSimDetector']
+    assert registry.complete
+    assert registry.drivers['ADCore'].executable_path is None
+    assert registry.drivers['ADSimDetector'].iocBoot_path == iocBoot
+    assert registry.get_connection_variable('ADSimDetector') == 'SIM_IP'
+    # The hard-coded table overrides detection for drivers not in the bundle
+    assert registry.get_connection_variable('ADEiger') == 'EIGER_IP'
+
+    # The connection parameter of each IOC replaces the value from the bundle
+    config = make_config(str(tmp_path / 'iocs'), bundle, num_iocs=2)
+    config['iocs'][0]['connection'] = '10.0.0.2'
+    assert initIOCs.generate(config, bundle_index=index, log=lambda text : None).success
+    with open(os.path.join(str(tmp_path / 'iocs'), 'cam-sim1', 'unique.cmd'), 'r') as fp:
+        assert re.search(r'epicsEnvSet\("SIM_IP", +"10.0.0.2"\)', fp.read()) is not None
+    with open(os.path.join(str(tmp_path / 'iocs'), 'cam-sim2', 'unique.cmd'), 'r') as fp:
+        assert re.search(r'epicsEnvSet\("SIM_IP", +"10.0.0.1"\)', fp.read()) is not None
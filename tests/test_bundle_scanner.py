@@ -0,0 +1,30 @@
+import os
+import pytest
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_scan_is_cached_per_bundle():
+    scanner = initIOCs.BundleScanner()
+    standard = os.path.join(TEST_DIR, 'test_bundle_standard')
+    flat = os.path.join(TEST_DIR, 'test_bundle_flat')
+    try:
+        assert scanner.get(standard) is None
+        registry = scanner.scan(standard).result(timeout=10)
+        assert registry.names() == ['ADSimDetector']
+        flat_registry = scanner.scan(flat).result(timeout=10)
+        assert flat_registry.bundle_index.binaries_flat
+
+        # Switching back returns the cached registry without scanning again
+        future = scanner.scan(standard)
+        assert future.done()
+        assert future.result() is registry
+        assert scanner.get(standard) is registry
+        assert scanner.scan(standard, refresh=True).result(timeout=10) is not registry
+
+        with pytest.raises(OSError):
+            scanner.scan(os.path.join(TEST_DIR, 'does_not_exist')).result(timeout=10)
+    finally:
+        scanner.close()
@@ -0,0 +1,79 @@
+import pytest
+import os
+import shutil
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SIM_DETECTOR = os.path.join('support', 'areaDetector', 'ADSimDetector')
+SIM_IOC_BOOT = os.path.join(SIM_DETECTOR, 'iocs', 'simDetectorIOC', 'iocBoot', 'iocSimDetector')
+
+
+def test_dependent_ioc_types():
+    bundle = os.path.join(TEST_DIR, 'test_bundle_standard')
+    index = initIOCs.BundleIndex(bundle)
+    watch_paths = index.get_watch_paths(['ADSimDetector', 'ADMissing'])
+    assert os.path.join(bundle, SIM_IOC_BOOT) in watch_paths
+    assert os.path.join(bundle, SIM_DETECTOR, 'iocs', 'simDetectorIOC', 'bin', 'linux-x86_64') in watch_paths
+    assert index.get_dependent_ioc_types(os.path.join(bundle, SIM_IOC_BOOT, 'st.cmd')) == set(['ADSimDetector'])
+    assert index.get_dependent_ioc_types(os.path.join(bundle, 'support', 'areaDetector', 'ADCore', 'lib')) == set(['ADSimDetector'])
+    assert index.get_dependent_ioc_types(os.path.join(TEST_DIR, 'CONFIGURE')) == set()
+
+
+@pytest.mark.parametrize('use_polling', [True, False])
+def test_watch_regenerates_ioc(tmp_path, make_config, use_polling):
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), bundle, symlinks=True)
+    ioc_dir = str(tmp_path / 'iocs')
+    configuration = initIOCs.validate_ioc_config(make_config(ioc_dir, bundle))
+    assert initIOCs.generate(configuration, log=lambda text : None).success
+    with open(os.path.join(ioc_dir, 'cam-sim1', 'autosave', 'auto_settings.sav'), 'w') as fp:
+        fp.write('TEST1:{Sim-Cam:1}cam1:AcquireTime 0.5\n')
+
+    watcher = initIOCs.BundleWatcher(configuration, debounce=0.2, poll_interval=0.05, use_polling=use_polling)
+    try:
+        assert watcher.wait_for_changes(timeout=0.1) == set()
+        with open(os.path.join(bundle, SIM_IOC_BOOT, 'st.cmd'), 'a') as fp:
+            fp.write('epicsEnvSet("REBUILT", "YES")\n')
+        changed = watcher.wait_for_changes(timeout=5)
+        assert os.path.join(bundle, SIM_IOC_BOOT, 'st.cmd') in changed
+        iocs = watcher.get_affected_iocs(changed)
+        assert [ioc['name'] for ioc in iocs] == ['cam-sim1']
+        results = watcher.regenerate(iocs)
+    finally:
+        watcher.watcher.close()
+
+    assert results[0].status == 'created'
+    with open(os.path.join(ioc_dir, 'cam-sim1', 'unique.cmd'), 'r') as fp:
+        assert 'REBUILT' in fp.read()
+    assert os.path.exists(os.path.join(ioc_dir, 'cam-sim1', 'autosave', 'auto_settings.sav'))
+    assert sorted(os.listdir(ioc_dir)) == [initIOCs.SnapshotStore.dir_name, 'cam-sim1']
+
+    # The previous version of the IOC was snapshotted before it was replaced
+    (name, manifest), = initIOCs.SnapshotStore(ioc_dir).list()
+    assert manifest['iocs'] == ['cam-sim1']
+    with open(os.path.join(ioc_dir, initIOCs.SnapshotStore.dir_name, name, 'cam-sim1', 'unique.cmd'), 'r') as fp:
+        assert 'REBUILT' not in fp.read()
+
+
+def test_regenerate_shard_and_locks(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    configuration = initIOCs.validate_ioc_config(make_config(ioc_dir, num_iocs=8))
+    options = initIOCs.GenerationOptions(shard='1/2')
+    assert initIOCs.generate(configuration, log=lambda text : None).success
+    shard = [action.ioc_name for action in initIOCs.select_shard(initIOCs.create_actions(configuration), 1, 2)]
+    assert 0 < len(shard) < 8
+
+    # A run generating into the IOC directory holds the lock of one IOC of the shard
+    lock = initIOCs.IOCLock(ioc_dir, shard[0])
+    assert lock.acquire()
+    watcher = initIOCs.BundleWatcher(configuration, options, poll_interval=0.05, use_polling=True)
+    try:
+        results = watcher.regenerate(configuration['iocs'])
+    finally:
+        watcher.watcher.close()
+        lock.release()
+    # Only the IOCs of the shard are regenerated
+    assert [result.ioc_name for result in results] == shard
+    assert [result.status for result in results] == ['locked'] + ['created'] * (len(shard) - 1)
+    assert sorted([name for name in os.listdir(ioc_dir) if not name.startswith('.')]) == sorted([ioc['name'] for ioc in configuration['iocs']])
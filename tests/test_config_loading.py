@@ -0,0 +1,98 @@
+import pytest
+import os
+import json
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def make_config():
+    config = {
+        'ioc_dir' :         'tests/testiocs',
+        'bundle_location' : 'tests/test_bundle_standard',
+        'beamline_prefix' : 'TEST1:',
+        'engineer' :        'J. Wlodek',
+        'hostname' :        'localhost',
+        'ca_address_ip' :   '127.0.0.255',
+        'iocs' : [
+            {'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'},
+            {'name' : 'cam-sim2', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:2}', 'asyn_port' : 'SIM2', 'telnet_port' : '4001', 'connection' : 'NA'},
+        ]
+    }
+    return config
+
+
+def test_read_yaml_config():
+    config = initIOCs.read_ioc_config(os.path.join(TEST_DIR, '..', 'initIOCs.yml'))
+    assert config['beamline_prefix'] == 'XF17BM-BI'
+    assert config['iocs'][0]['name'] == 'cam-sim1'
+    assert config['iocs'][0]['telnet_port'] == 4000
+
+
+def test_read_json_and_csv_config(tmp_path):
+    json_path = tmp_path / 'fleet.json'
+    json_path.write_text(json.dumps(make_config()))
+    csv_path = tmp_path / 'fleet.csv'
+    csv_path.write_text('ioc_dir,tests/testiocs\n'
+                        'bundle_location,tests/test_bundle_standard\n'
+                        'beamline_prefix,TEST1:\n'
+                        'engineer,J. Wlodek\n'
+                        'hostname,localhost\n'
+                        'ca_address_ip,127.0.0.255\n'
+                        ',,,,,\n'
+                        '# IOC table\n'
+                        'name,type,device_prefix,asyn_port,telnet_port,connection\n'
+                        'cam-sim1,ADSimDetector,{Sim-Cam:1},SIM1,4000,NA\n'
+                        'cam-sim2,ADSimDetector,{Sim-Cam:2},SIM2,4001,NA\n')
+    assert initIOCs.read_ioc_config(str(json_path)) == initIOCs.read_ioc_config(str(csv_path))
+
+
+def test_validation_reports_each_entry():
+    config = make_config()
+    del config['engineer']
+    del config['iocs'][0]['asyn_port']
+    config['iocs'][1]['telnet_port'] = 4000
+    config['iocs'][1]['name'] = 'cam-sim1'
+    with pytest.raises(initIOCs.ConfigurationError) as e:
+        initIOCs.validate_ioc_config(config)
+    assert len(e.value.errors) == 4
+    assert 'Missing required key "engineer"' in e.value.errors
+    assert 'iocs[0] (cam-sim1): missing required key "asyn_port"' in e.value.errors
+
+
+def test_config_cache(tmp_path):
+    config_path = tmp_path / 'fleet.json'
+    config_path.write_text(json.dumps(make_config()))
+    cache_dir = tmp_path / 'cache'
+    config = initIOCs.read_ioc_config(str(config_path), str(cache_dir))
+    cache_files = os.listdir(str(cache_dir))
+    assert len(cache_files) == 1
+    assert initIOCs.read_ioc_config(str(config_path), str(cache_dir)) == config
+
+    # Changing the file changes the hash, so the stale cache entry is not used.
+    modified = make_config()
+    modified['hostname'] = 'xf17bm-ioc1'
+    config_path.write_text(json.dumps(modified))
+    assert initIOCs.read_ioc_config(str(config_path), str(cache_dir))['hostname'] == 'xf17bm-ioc1'
+    assert len(os.listdir(str(cache_dir))) == 2
+
+
+@pytest.mark.parametrize('extension', ['json', 'csv'])
+def test_write_config(tmp_path, extension):
+    config = initIOCs.validate_ioc_config(make_config())
+    config['iocs'][1]['hostname'] = 'xf17bm-ioc2'
+    config_path = str(tmp_path / 'fleet.{}'.format(extension))
+    initIOCs.write_ioc_config(config, config_path)
+    assert initIOCs.read_ioc_config(config_path) == config
+
+
+def test_config_cache_schema_version(tmp_path, monkeypatch):
+    config_path = tmp_path / 'fleet.json'
+    config_path.write_text(json.dumps(make_config()))
+    cache_dir = tmp_path / 'cache'
+    initIOCs.read_ioc_config(str(config_path), str(cache_dir))
+    # Entries cached by an earlier validator are not reused
+    monkeypatch.setattr(initIOCs, 'config_schema_version', initIOCs.config_schema_version + 1)
+    initIOCs.read_ioc_config(str(config_path), str(cache_dir))
+    assert len(os.listdir(str(cache_dir))) == 2
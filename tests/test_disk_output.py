@@ -0,0 +1,109 @@
+import pytest
+import os
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def make_action(name):
+    ioc = {'name' : name, 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'}
+    action = initIOCs.IOCAction(ioc, 'TEST1:')
+    action.epics_environment['HOSTNAME'] = 'localhost'
+    return action
+
+
+def test_staged_output(tmp_path):
+    ioc_path = str(tmp_path / 'cam-sim1')
+    output = initIOCs.DiskOutput()
+    output.begin(ioc_path)
+    output.mkdir(ioc_path)
+    with output.open(os.path.join(ioc_path, 'st.cmd')) as fp:
+        fp.write('#!/bin/bash\n')
+    output.chmod(os.path.join(ioc_path, 'st.cmd'), 0o755)
+    # Nothing appears at the final location until the IOC is finished
+    assert output.exists(ioc_path)
+    assert not os.path.exists(ioc_path)
+    output.finish()
+    assert os.listdir(str(tmp_path)) == ['cam-sim1']
+    assert os.access(os.path.join(ioc_path, 'st.cmd'), os.X_OK)
+
+    output.begin(str(tmp_path / 'cam-sim2'))
+    output.mkdir(str(tmp_path / 'cam-sim2'))
+    output.discard()
+    assert os.listdir(str(tmp_path)) == ['cam-sim1']
+
+
+@pytest.mark.parametrize('fsync_policy', ['none', 'per-ioc', 'per-file'])
+def test_fsync_policy(tmp_path, monkeypatch, fsync_policy):
+    synced = []
+    monkeypatch.setattr(initIOCs.DiskOutput, 'sync', lambda self, path : synced.append(path))
+    ioc_top = str(tmp_path / 'iocs')
+    os.mkdir(ioc_top)
+    manager = initIOCs.IOCActionManager(ioc_top, BUNDLE, False, False, True, False, output=initIOCs.DiskOutput(fsync_policy), log=lambda text : None)
+    assert manager.process_action(make_action('cam-sim1')).status == 'created'
+    # The staging directory is gone once the IOC is moved into place
+    assert os.listdir(ioc_top) == ['cam-sim1']
+
+    staging_path = os.path.join(ioc_top, initIOCs.staging_dir_name, 'cam-sim1')
+    ioc_path = os.path.join(ioc_top, 'cam-sim1')
+    if fsync_policy == 'none':
+        assert synced == []
+    else:
+        files = [file for file in os.listdir(ioc_path) if os.path.isfile(os.path.join(ioc_path, file))]
+        assert sorted(synced[:-2]) == sorted([os.path.join(staging_path, file) for file in files])
+        assert synced[-2:] == [staging_path, ioc_top]
+
+
+def test_failed_ioc_is_discarded(tmp_path, monkeypatch):
+    def fail_config_file(self, action):
+        raise OSError('No space left on device')
+
+    monkeypatch.setattr(initIOCs.IOCActionManager, 'create_config_file', fail_config_file)
+    ioc_top = str(tmp_path / 'iocs')
+    os.mkdir(ioc_top)
+    output = initIOCs.DiskOutput()
+    manager = initIOCs.IOCActionManager(ioc_top, BUNDLE, False, False, True, False, output=output, log=lambda text : None)
+    assert manager.process_action(make_action('cam-sim1')).status == 'failed'
+    # Neither the staged IOC nor the staging directory is left behind
+    assert output.staged is None
+    assert os.listdir(ioc_top) == []
+
+
+def test_invalid_fsync_policy():
+    with pytest.raises(ValueError):
+        initIOCs.DiskOutput('always')
+    result = initIOCs.generate({}, initIOCs.GenerationOptions(fsync='always'))
+    assert not result.success
+
+
+def test_record_tree(tmp_path):
+    # IOCs cloned from ioc-template are written partly through the output, and partly by git
+    ioc_path = str(tmp_path / 'cam-sim1')
+    os.makedirs(os.path.join(ioc_path, 'iocBoot'))
+    output = initIOCs.DiskOutput()
+    with output.open(os.path.join(ioc_path, 'st.cmd')) as fp:
+        fp.write('#!/bin/bash\n')
+    with open(os.path.join(ioc_path, 'iocBoot', 'README'), 'w') as fp:
+        fp.write('cloned')
+    output.record_tree(ioc_path)
+    written = sorted(output.take_written())
+    assert written == [(os.path.join(ioc_path, 'iocBoot', 'README'), 6), (os.path.join(ioc_path, 'st.cmd'), 12)]
+
+
+def test_record_tree_in_memory():
+    filesystem = initIOCs.MemoryFileSystem()
+    filesystem.makedirs('/iocs/cam-sim1/iocBoot')
+    filesystem.write_text('/iocs/cam-sim1/iocBoot/README', 'cloned')
+    filesystem.symlink('iocBoot', '/iocs/cam-sim1/current')
+    output = initIOCs.DiskOutput(filesystem=filesystem)
+    output.record_tree('/iocs/cam-sim1')
+    assert sorted(output.take_written()) == [('/iocs/cam-sim1/current', 0), ('/iocs/cam-sim1/iocBoot/README', 6)]
+
+
+def test_path_is_under():
+    assert initIOCs.initIOC_path_is_under('/iocs/cam-sim1/st.cmd', '/iocs/cam-sim1')
+    assert initIOCs.initIOC_path_is_under('/iocs/cam-sim1', '/iocs/cam-sim1/')
+    assert not initIOCs.initIOC_path_is_under('/iocs/cam-sim10/st.cmd', '/iocs/cam-sim1')
+    assert initIOCs.initIOC_path_is_under('/iocs/cam-sim1' + os.sep + 'st.cmd', '/iocs/cam-sim1')
@@ -0,0 +1,79 @@
+import pytest
+import os
+import shutil
+import socketserver
+import threading
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def test_bundle_index_cache(tmp_path):
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(BUNDLE, bundle, symlinks=True)
+    cache = initIOCs.BundleIndexCache()
+    index = cache.get(bundle)
+    driver_paths = index.find_driver_paths('ADSimDetector')
+    assert cache.get(bundle) is index
+
+    # Rebuilding a driver changes the mtime of its bin directory
+    bin_dir = os.path.dirname(driver_paths[1])
+    os.rename(driver_paths[1], os.path.join(bin_dir, 'simDetectorApp.old'))
+    assert index.is_stale()
+    assert cache.get(bundle) is not index
+
+
+@pytest.mark.skipif(not hasattr(socketserver, 'UnixStreamServer'), reason='Unix domain sockets not supported')
+def test_submit_job(tmp_path, make_config):
+    socket_path = str(tmp_path / 's.sock')
+    server = initIOCs.GenerationServer(socket_path, max_workers=2, log=lambda text : None)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    try:
+        messages = []
+        ioc_dir = str(tmp_path / 'iocs')
+        result = initIOCs.submit_job(make_config(ioc_dir), initIOCs.GenerationOptions(), socket_path, log=messages.append)
+        assert result['success']
+        assert result['iocs'][0]['status'] == 'created'
+        assert 'Setup process for IOC cam-sim1' in messages
+        assert os.path.exists(os.path.join(ioc_dir, 'cam-sim1', 'st.cmd'))
+
+        # The second request reuses the warm bundle index
+        index = server.bundle_cache.get(BUNDLE)
+        result = initIOCs.submit_job(make_config(str(tmp_path / 'iocs2')), initIOCs.GenerationOptions(), socket_path, log=messages.append)
+        assert result['success']
+        assert server.bundle_cache.get(BUNDLE) is index
+
+        result = initIOCs.submit_job({'iocs' : []}, initIOCs.GenerationOptions(), socket_path, log=messages.append)
+        assert not result['success']
+        assert 'Missing required key "ioc_dir"' in result['errors']
+    finally:
+        server.shutdown()
+        server_thread.join()
+        server.server_close()
+
+
+def test_bundle_index_sibling_paths(tmp_path):
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(BUNDLE, bundle, symlinks=True)
+    index = initIOCs.BundleIndex(bundle + os.sep)
+    assert index.in_bundle(bundle)
+    assert index.in_bundle(os.path.join(bundle, 'base'))
+    # A directory next to the bundle sharing its name as a prefix is not cached
+    sibling = str(tmp_path / 'bundle-old')
+    os.makedirs(sibling)
+    assert not index.in_bundle(sibling)
+    index.scan_dir(sibling)
+    assert sibling not in index.dir_entries
+
+
+@pytest.mark.skipif(not hasattr(socketserver, 'UnixStreamServer'), reason='Unix domain sockets not supported')
+def test_run_server_keeps_other_files(tmp_path):
+    socket_path = str(tmp_path / 's.sock')
+    with open(socket_path, 'w') as fp:
+        fp.write('not a socket')
+    assert not initIOCs.run_server(socket_path)
+    with open(socket_path, 'r') as fp:
+        assert fp.read() == 'not a socket'
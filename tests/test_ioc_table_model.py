@@ -0,0 +1,67 @@
+import initIOCs
+import GUI_initIOCs
+
+
+def make_ioc(i, **values):
+    ioc = {'name' : 'cam-sim{}'.format(i), 'type' : 'ADSimDetector', 'device_prefix' : '{{Sim-Cam:{}}}'.format(i), 'asyn_port' : 'SIM{}'.format(i), 'telnet_port' : 4000 + i, 'connection' : 'NA'}
+    ioc.update(values)
+    return ioc
+
+
+def test_duplicate_detection():
+    model = GUI_initIOCs.IOCTableModel()
+    first, _ = model.add_row(make_ioc(1))
+    second, affected = model.add_row(make_ioc(2, telnet_port=4001))
+    assert affected == {first, second}
+    assert model.errors[first] == ['Telnet port 4001 is used more than once']
+
+    # Another IOC server may reuse the port
+    assert model.update_row(second, make_ioc(2, telnet_port=4001, hostname='xf17bm-ioc2')) == {first, second}
+    assert model.invalid_rows() == []
+
+    third, _ = model.add_row(make_ioc(1, telnet_port='port', connection=''))
+    assert model.errors[third] == ['Missing value for connection', 'IOC name cam-sim1 is used more than once', 'Telnet port must be a number between 1 and 65535']
+    assert model.remove_row(third) == {first}
+    assert model.invalid_rows() == []
+
+
+def test_duplicate_detection_effective_host():
+    model = GUI_initIOCs.IOCTableModel()
+    model.set_default_hostname('xf17bm-ioc1')
+    first, _ = model.add_row(make_ioc(1))
+    # Setting the top level hostname explicitly, in any case, is the same IOC server
+    second, _ = model.add_row(make_ioc(2, telnet_port=4001, hostname='XF17BM-IOC1'))
+    assert model.errors[first] == ['Telnet port 4001 is used more than once']
+
+    # Rows without a hostname move to the new top level hostname
+    assert model.set_default_hostname('xf17bm-ioc2') == {first, second}
+    assert model.invalid_rows() == []
+    assert model.set_default_hostname('xf17bm-ioc2') == set()
+
+
+def test_deferred_type_check():
+    model = GUI_initIOCs.IOCTableModel()
+    # Types are not checked while the bundle is scanned
+    first, _ = model.add_row(make_ioc(1, type='ADProsilica'))
+    second, _ = model.add_row(make_ioc(2))
+    assert model.invalid_rows() == []
+    assert model.set_known_types(['ADSimDetector']) == {first, second}
+    assert model.errors[first] == ['IOC type ADProsilica was not found in the bundle']
+    assert model.invalid_rows() == [first]
+    model.set_known_types(None)
+    assert model.invalid_rows() == []
+
+
+def test_round_trip_config(tmp_path):
+    model = GUI_initIOCs.IOCTableModel()
+    config = initIOCs.validate_ioc_config(dict(initIOCs.base_configuration, iocs=[make_ioc(i) for i in range(1, 2001)]))
+    config['iocs'][5]['hostname'] = 'xf17bm-ioc2'
+    row_ids = model.load_config(config)
+    assert len(row_ids) == 2000
+    assert model.invalid_rows() == []
+
+    top_level = {key : config[key] for key in initIOCs.required_config_keys}
+    assert initIOCs.validate_ioc_config(model.to_config(top_level)) == config
+    csv_path = str(tmp_path / 'fleet.csv')
+    initIOCs.write_ioc_config(model.to_config(top_level), csv_path)
+    assert initIOCs.read_ioc_config(csv_path) == config
@@ -0,0 +1,57 @@
+import os
+import json
+import time
+import threading
+import pytest
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def test_parse_latency_spec():
+    assert initIOCs.parse_latency_spec('nfs') == initIOCs.nfs_latencies
+    assert initIOCs.parse_latency_spec('stat=0.5, open=2') == {'stat' : 0.0005, 'open' : 0.002}
+    with pytest.raises(ValueError):
+        initIOCs.parse_latency_spec('stat=0.5,mount=2')
+    with pytest.raises(ValueError):
+        initIOCs.parse_latency_spec('stat=-1')
+    for latency in ['inf', 'nan', '-inf']:
+        with pytest.raises(ValueError):
+            initIOCs.parse_latency_spec('stat={}'.format(latency))
+
+
+def test_concurrency_limit():
+    memory = initIOCs.MemoryFileSystem()
+    filesystem = initIOCs.LatencyFileSystem(memory, {'stat' : 0.05}, max_concurrent=1)
+    threads = [threading.Thread(target=filesystem.exists, args=('/bundle',)) for _ in range(4)]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert time.monotonic() - start >= 0.2
+    stats = filesystem.get_stats()
+    assert stats['stat']['operations'] == 4
+    assert stats['stat']['wait'] > 0
+    assert stats['listdir']['operations'] == 0
+
+
+def test_generate_with_latency(tmp_path, make_config):
+    memory = initIOCs.MemoryFileSystem()
+    memory.load_tree(BUNDLE, '/bundle')
+    filesystem = initIOCs.LatencyFileSystem(memory, {'stat' : 0.0001, 'open' : 0.0002})
+    result = initIOCs.generate(make_config('/iocs', '/bundle', num_iocs=3), log=lambda text : None, filesystem=filesystem)
+    assert result.success
+    assert memory.exists('/iocs/cam-sim3/st.cmd')
+
+    # Operation counts are reported with the rest of the run
+    report_path = str(tmp_path / 'report.json')
+    initIOCs.write_run_report(result, report_path)
+    with open(report_path, 'r') as fp:
+        report = json.load(fp)
+    assert set(report['filesystem'].keys()) == set(initIOCs.filesystem_operations)
+    assert report['filesystem']['stat']['operations'] > 0
+    assert report['filesystem']['listdir']['latency'] == 0
+    assert report['filesystem']['open']['latency'] == pytest.approx(report['filesystem']['open']['operations'] * 0.0002)
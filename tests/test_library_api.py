@@ -0,0 +1,69 @@
+import os
+import threading
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def test_generate(tmp_path, make_config, capsys):
+    messages = []
+    ioc_dir = str(tmp_path / 'iocs')
+    result = initIOCs.generate(make_config(ioc_dir, with_missing=True), log=messages.append)
+    assert not result.success
+    created, failed = result.ioc_results
+    assert created.status == 'created'
+    assert created.executable_path.endswith('simDetectorApp')
+    assert failed.status == 'failed'
+    assert failed.messages == ['ERROR - Could not find binary for ADMissing, skipping...']
+    assert 'Setup process for IOC cam-sim1' in messages
+    assert os.path.exists(os.path.join(ioc_dir, 'cam-sim1', 'st.cmd'))
+    assert not os.path.exists(os.path.join(ioc_dir, 'cam-missing'))
+    # Nothing is printed when a log function is given
+    assert capsys.readouterr().out == ''
+
+    # Running again skips the existing IOC, which does not fail the run
+    config = make_config(ioc_dir, with_missing=True)
+    del config['iocs'][1]
+    result = initIOCs.generate(config)
+    assert result.ioc_results[0].status == 'skipped'
+    assert result.success
+
+
+def test_generate_ioc_exception(tmp_path, make_config, monkeypatch):
+    def fail_init_st_cmd(self, ioc_path, lib_path, executable_path):
+        raise OSError('Permission denied')
+
+    monkeypatch.setattr(initIOCs.IOCActionManager, 'initialize_st_base_file', fail_init_st_cmd)
+    messages = []
+    result = initIOCs.generate(make_config(str(tmp_path / 'iocs'), with_missing=True), log=messages.append)
+    assert not result.success
+    assert [ioc_result.status for ioc_result in result.ioc_results] == ['failed', 'failed']
+    assert result.ioc_results[0].messages == ['ERROR - Generating IOC cam-sim1 failed: Permission denied']
+
+
+def test_generate_invalid_config(make_config):
+    config = make_config('iocs', with_missing=True)
+    del config['iocs'][0]['name']
+    result = initIOCs.generate(config)
+    assert result.configuration is None
+    assert result.errors == ['iocs[0] (unnamed): missing required key "name"']
+
+
+def test_generate_concurrent(tmp_path, make_config):
+    index = initIOCs.BundleIndex(BUNDLE)
+    results = {}
+
+    def run(name):
+        results[name] = initIOCs.generate(make_config(str(tmp_path / name), with_missing=True), bundle_index=index)
+
+    threads = [threading.Thread(target=run, args=('run{}'.format(i),)) for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for name, result in results.items():
+        assert result.ioc_results[0].status == 'created'
+        with open(str(tmp_path / name / 'cam-sim1' / 'config'), 'r') as config_fp:
+            assert 'NAME=cam-sim1' in config_fp.read()
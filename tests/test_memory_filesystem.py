@@ -0,0 +1,76 @@
+import os
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def test_memory_filesystem_operations():
+    filesystem = initIOCs.MemoryFileSystem()
+    filesystem.makedirs('/bundle/iocBoot')
+    filesystem.write_text('/bundle/iocBoot/st.cmd', '< envPaths\n')
+    filesystem.symlink('iocBoot', '/bundle/current')
+    assert filesystem.read_lines('/bundle/current/st.cmd') == ['< envPaths\n']
+    assert filesystem.scandir('/bundle') == [('iocBoot', True, False), ('current', True, False)]
+    assert filesystem.islink('/bundle/current') and not filesystem.islink('/bundle/iocBoot')
+
+    mtime = filesystem.get_mtime('/bundle/iocBoot')
+    filesystem.copyfile('/bundle/iocBoot/st.cmd', '/bundle/iocBoot/st_base.cmd')
+    assert filesystem.get_mtime('/bundle/iocBoot') > mtime
+
+    # Renaming onto itself, also through a link to the parent, leaves the node in place
+    filesystem.rename('/bundle/iocBoot/st.cmd', '/bundle/current/st.cmd')
+    filesystem.rename('/bundle/iocBoot', '/bundle//iocBoot')
+    assert filesystem.read_lines('/bundle/iocBoot/st.cmd') == ['< envPaths\n']
+
+    filesystem.rename('/bundle/iocBoot', '/bundle/iocBoot2')
+    assert not filesystem.exists('/bundle/current/st.cmd')
+    assert filesystem.read_text('/bundle/iocBoot2/st_base.cmd') == '< envPaths\n'
+    filesystem.rmtree('/bundle')
+    assert filesystem.scandir('/') == []
+
+
+def test_move_and_remove_subtree():
+    filesystem = initIOCs.MemoryFileSystem()
+    filesystem.makedirs('/iocs/.staging-cam/db')
+    filesystem.write_text('/iocs/.staging-cam/db/cam.db', 'record')
+    filesystem.symlink('db', '/iocs/.staging-cam/current')
+    # A sibling sharing the name as a prefix is not part of the subtree
+    filesystem.makedirs('/iocs/.staging-cam2')
+    filesystem.write_text('/iocs/.staging-cam2/st.cmd', 'iocInit')
+    assert sorted([name for name, _ in filesystem.get_subtree('/iocs/.staging-cam', filesystem.nodes['/iocs/.staging-cam'])]) == \
+        ['/iocs/.staging-cam/current', '/iocs/.staging-cam/db', '/iocs/.staging-cam/db/cam.db']
+
+    filesystem.rename('/iocs/.staging-cam', '/iocs/cam')
+    assert filesystem.read_text('/iocs/cam/current/cam.db') == 'record'
+    assert sorted(name for name in filesystem.nodes if name.startswith('/iocs/')) == \
+        ['/iocs/.staging-cam2', '/iocs/.staging-cam2/st.cmd', '/iocs/cam', '/iocs/cam/current', '/iocs/cam/db', '/iocs/cam/db/cam.db']
+    filesystem.rmtree('/iocs/cam')
+    assert sorted(filesystem.nodes) == ['/', '/iocs', '/iocs/.staging-cam2', '/iocs/.staging-cam2/st.cmd']
+
+
+def test_generate_in_memory(tmp_path, make_config):
+    disk_dir = str(tmp_path / 'iocs')
+    assert initIOCs.generate(make_config(disk_dir), log=lambda text : None).success
+
+    filesystem = initIOCs.MemoryFileSystem()
+    filesystem.load_tree(BUNDLE, '/bundle')
+    result = initIOCs.generate(make_config('/iocs', '/bundle', num_iocs=1000), log=lambda text : None, filesystem=filesystem)
+    assert result.success
+    assert len(filesystem.scandir('/iocs')) == 1000
+    assert not os.path.exists('/iocs')
+
+    # IOCs match those generated on disk, apart from the bundle location and generation time
+    memory_dir = str(tmp_path / 'memory')
+    filesystem.dump_tree('/iocs/cam-sim1', memory_dir)
+    for file in sorted(os.listdir(os.path.join(disk_dir, 'cam-sim1'))):
+        disk_path = os.path.join(disk_dir, 'cam-sim1', file)
+        assert os.path.islink(disk_path) == os.path.islink(os.path.join(memory_dir, file))
+        # The saved configuration lists every IOC of the run
+        if os.path.isfile(disk_path) and not os.path.islink(disk_path) and file != 'initIOCs.yml':
+            with open(disk_path, 'r') as disk_fp, open(os.path.join(memory_dir, file), 'r') as memory_fp:
+                disk_lines = [line for line in disk_fp if 'Generated' not in line]
+                memory_lines = [line.replace('/bundle', BUNDLE) for line in memory_fp if 'Generated' not in line]
+            # Module order in envPaths follows directory listing order, which differs between backends
+            assert sorted(disk_lines) == sorted(memory_lines), file
@@ -0,0 +1,62 @@
+import os
+import pytest
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def make_action(name, hostname):
+    ioc = {'name' : name, 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'}
+    action = initIOCs.IOCAction(ioc, 'TEST1:')
+    action.epics_environment['HOSTNAME'] = hostname
+    return action
+
+
+def test_hostname_override_validation():
+    config = {'ioc_dir' : 'iocs', 'bundle_location' : BUNDLE, 'beamline_prefix' : 'TEST1:', 'engineer' : 'J. Wlodek', 'hostname' : 'localhost', 'ca_address_ip' : '127.0.0.255',
+        'iocs' : [
+            {'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4000, 'connection' : 'NA'},
+            {'name' : 'cam-sim2', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:2}', 'asyn_port' : 'SIM2', 'telnet_port' : 4000, 'connection' : 'NA', 'hostname' : 'host2'},
+        ]}
+    # The same telnet port may be reused on a different IOC server
+    validated = initIOCs.validate_ioc_config(config)
+    assert validated['iocs'][1]['hostname'] == 'host2'
+    assert 'hostname' not in validated['iocs'][0]
+
+    # Hostnames become directory and archive names, so paths are rejected
+    for hostname in ['../../etc', '/etc', '..', 'host 2']:
+        config['iocs'][1]['hostname'] = hostname
+        with pytest.raises(initIOCs.ConfigurationError) as e:
+            initIOCs.validate_ioc_config(config)
+        assert 'key "hostname" must be a host name' in e.value.errors[0]
+
+
+def test_partitioned_generation(tmp_path):
+    ioc_top = str(tmp_path / 'iocs')
+    manager = initIOCs.IOCActionManager(ioc_top, BUNDLE, False, False, False, False)
+    actions = [make_action('cam-sim1', 'host1'), make_action('cam-sim2', 'host2'), make_action('cam-sim3', 'host1')]
+    results = initIOCs.init_iocs_partitioned(actions, manager)
+    assert [result.status for result in results['host1']] == ['created', 'created']
+    assert [result.ioc_name for result in results['host2']] == ['cam-sim2']
+    assert sorted(os.listdir(os.path.join(ioc_top, 'host1'))) == ['cam-sim1', 'cam-sim3']
+    assert os.listdir(os.path.join(ioc_top, 'host2')) == ['cam-sim2']
+    with open(os.path.join(ioc_top, 'host2', 'cam-sim2', 'config'), 'r') as config_fp:
+        assert 'HOST=host2' in config_fp.read()
+
+
+def test_partition_archive_path():
+    assert initIOCs.get_partition_archive_path('out/iocs.tar.gz', 'host1') == os.path.join('out', 'iocs-host1.tar.gz')
+    assert initIOCs.get_partition_archive_path('iocs.tar', 'host1') == 'iocs-host1.tar'
+
+
+def test_partition_archive_error(tmp_path):
+    manager = initIOCs.IOCActionManager(str(tmp_path / 'iocs'), BUNDLE, False, False, False, False)
+    actions = [make_action('cam-sim1', 'host1'), make_action('cam-sim2', 'host2')]
+    # The archive of host2 cannot be created, as a directory is in its place
+    os.makedirs(str(tmp_path / 'out-host2.tar'))
+    results = initIOCs.init_iocs_partitioned(actions, manager, archive_path=str(tmp_path / 'out.tar'))
+    assert [result.status for result in results['host1']] == ['created']
+    assert [result.status for result in results['host2']] == ['failed']
+    assert 'Could not create archive' in results['host2'][0].messages[0]
@@ -0,0 +1,91 @@
+import os
+import shutil
+import tempfile
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_file(path):
+    with open(path, 'r') as fp:
+        return fp.read()
+
+
+def test_retarget(tmp_path, make_config):
+    old_bundle = str(tmp_path / 'old')
+    new_bundle = str(tmp_path / 'new')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), old_bundle, symlinks=True)
+    shutil.copytree(old_bundle, new_bundle, symlinks=True)
+    ioc_dir = str(tmp_path / 'iocs')
+    options = initIOCs.GenerationOptions(set_lib_path=True, partition=True)
+    config = make_config(ioc_dir, old_bundle, num_iocs=2)
+    config['iocs'][1]['hostname'] = 'xf17bm-ioc2'
+    assert initIOCs.generate(config, options, log=lambda text : None).success
+    ioc_paths = [os.path.join(ioc_dir, 'localhost', 'cam-sim1'), os.path.join(ioc_dir, 'xf17bm-ioc2', 'cam-sim2')]
+    unchanged = read_file(os.path.join(ioc_paths[0], 'st_base.cmd'))
+
+    results = initIOCs.retarget_iocs(ioc_dir, new_bundle, dry_run=True, log=lambda text : None)
+    assert [result.ioc_path for result in results] == ioc_paths
+    assert [len(result.changes) for result in results] == [6, 6]
+    assert old_bundle + '"' in read_file(os.path.join(ioc_paths[0], 'envPaths'))
+
+    results = initIOCs.retarget_iocs(ioc_dir, new_bundle, log=lambda text : None)
+    assert all([result.error is None for result in results])
+    for ioc_path in ioc_paths:
+        st_cmd = read_file(os.path.join(ioc_path, 'st.cmd'))
+        assert old_bundle + '/' not in st_cmd
+        assert new_bundle + '/support/areaDetector/ADSimDetector' in st_cmd
+        assert 'epicsEnvSet("BINARY_TOP", "{}")'.format(new_bundle) in read_file(os.path.join(ioc_path, 'envPaths'))
+        assert os.access(os.path.join(ioc_path, 'st.cmd'), os.X_OK)
+        assert '# Initial target bundle location: {}\n'.format(new_bundle) in read_file(os.path.join(ioc_path, 'unique.cmd'))
+    assert read_file(os.path.join(ioc_paths[0], 'st_base.cmd')) == unchanged
+
+    # Retargeting again finds nothing left to change
+    results = initIOCs.retarget_iocs(ioc_dir, new_bundle, log=lambda text : None)
+    assert [len(result.changes) for result in results] == [0, 0]
+
+
+def test_retarget_links(tmp_path, make_config):
+    old_bundle = str(tmp_path / 'old')
+    new_bundle = str(tmp_path / 'new')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), old_bundle, symlinks=True)
+    shutil.copytree(old_bundle, new_bundle, symlinks=True)
+    ioc_dir = str(tmp_path / 'iocs')
+    config = make_config(ioc_dir, old_bundle)
+    assert initIOCs.generate(config, initIOCs.GenerationOptions(use_links=True), log=lambda text : None).success
+
+    results = initIOCs.retarget_iocs(ioc_dir, new_bundle, log=lambda text : None)
+    assert results[0].error is None
+    assert os.readlink(os.path.join(ioc_dir, 'cam-sim1', 'envPaths')).startswith(new_bundle)
+    assert os.readlink(os.path.join(ioc_dir, 'cam-sim1', 'auto_settings.req')).startswith(new_bundle)
+
+
+def test_retarget_modules_and_long_path(tmp_path, make_config):
+    # pytest temporary paths are too long for a direct shebang into the test bundle
+    with tempfile.TemporaryDirectory() as short_dir:
+        retarget_modules_and_long_path(os.path.join(short_dir, 'old'), tmp_path, make_config)
+
+
+def retarget_modules_and_long_path(old_bundle, tmp_path, make_config):
+    new_bundle = str(tmp_path / ('long' * 30) / 'new')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), old_bundle, symlinks=True)
+    shutil.copytree(old_bundle, new_bundle, symlinks=True)
+    os.makedirs(os.path.join(new_bundle, 'support', 'motor'))
+    ioc_dir = str(tmp_path / 'iocs')
+    config = make_config(ioc_dir, old_bundle)
+    assert initIOCs.generate(config, log=lambda text : None).success
+    ioc_path = os.path.join(ioc_dir, 'cam-sim1')
+    st_cmd = read_file(os.path.join(ioc_path, 'st.cmd'))
+    assert st_cmd.startswith('#!' + old_bundle)
+
+    results = initIOCs.retarget_iocs(ioc_dir, new_bundle, log=lambda text : None)
+    assert results[0].error is None
+    # Modules added to the new bundle are added to envPaths, the architecture is kept
+    env_paths = read_file(os.path.join(ioc_path, 'envPaths'))
+    assert 'epicsEnvSet("MOTOR",' in env_paths
+    assert 'epicsEnvSet("ARCH", "linux-x86_64")' in env_paths
+    # The new executable path is too long for a shebang, so st.cmd calls it from bash
+    assert read_file(os.path.join(ioc_path, 'st.cmd')).startswith('#!/bin/bash\n')
+    assert read_file(os.path.join(ioc_path, 'st_base.cmd')) == st_cmd.split('\n', 2)[2]
+    assert os.access(os.path.join(ioc_path, 'st.cmd'), os.X_OK)
@@ -0,0 +1,131 @@
+import pytest
+import os
+import json
+import subprocess
+import sys
+import initIOCs
+
+
+def interrupted_run(config):
+    """Runs generation, interrupting it while the second IOC is being written
+    """
+
+    written = []
+    def log(text):
+        if text.startswith('Generating unique.cmd'):
+            written.append(text)
+            if len(written) == 2:
+                raise KeyboardInterrupt
+    with pytest.raises(KeyboardInterrupt):
+        initIOCs.generate(config, log=log)
+
+
+def test_resume_interrupted_run(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    interrupted_run(make_config(ioc_dir, num_iocs=3))
+    assert os.path.exists(os.path.join(ioc_dir, initIOCs.GenerationJournal.file_name))
+    # The staged files of the partially written IOC are discarded, nothing is moved into place
+    assert not os.path.exists(os.path.join(ioc_dir, initIOCs.staging_dir_name))
+    assert not os.path.exists(os.path.join(ioc_dir, 'cam-sim2'))
+
+    messages = []
+    result = initIOCs.generate(make_config(ioc_dir, num_iocs=3), log=messages.append)
+    assert result.success
+    assert 'IOC cam-sim1 was completed by the interrupted run, skipping.\n' in messages
+    for i in range(1, 4):
+        assert os.path.exists(os.path.join(ioc_dir, 'cam-sim{}'.format(i), 'unique.cmd'))
+    assert sorted(os.listdir(ioc_dir)) == ['cam-sim1', 'cam-sim2', 'cam-sim3']
+
+
+def test_resume_partially_moved_ioc(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    journal = initIOCs.GenerationJournal(ioc_dir)
+    os.mkdir(ioc_dir)
+    journal.record('mkdir', ioc_dir)
+    journal.record('start', os.path.join(ioc_dir, 'cam-sim1'))
+    os.mkdir(os.path.join(ioc_dir, 'cam-sim1'))
+    journal.close()
+
+    messages = []
+    assert initIOCs.generate(make_config(ioc_dir, num_iocs=3), log=messages.append).success
+    assert 'Removing IOC cam-sim1 left incomplete by the interrupted run...' in messages
+    assert os.path.exists(os.path.join(ioc_dir, 'cam-sim1', 'unique.cmd'))
+
+
+def test_rollback(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    interrupted_run(make_config(ioc_dir, num_iocs=3))
+    assert initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+    assert not os.path.exists(ioc_dir)
+
+    # IOCs that existed before the interrupted run are kept
+    os.mkdir(ioc_dir)
+    os.mkdir(os.path.join(ioc_dir, 'cam-other'))
+    interrupted_run(make_config(ioc_dir, num_iocs=3))
+    assert initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+    assert os.listdir(ioc_dir) == ['cam-other']
+    assert not initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+
+
+def write_journal(ioc_dir, owner):
+    os.makedirs(os.path.join(ioc_dir, 'cam-sim1'))
+    journal_path = os.path.join(ioc_dir, initIOCs.GenerationJournal.file_name)
+    with open(journal_path, 'w') as journal_fp:
+        journal_fp.write(json.dumps(dict(owner, event='owner')) + '\n')
+        journal_fp.write(json.dumps({'event' : 'start', 'path' : 'cam-sim1'}) + '\n')
+    return journal_path
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='only the journal age is checked on windows')
+def test_rollback_skips_running_run(tmp_path):
+    # A run still writing its journal, ex. another shard, is not rolled back
+    ioc_dir = str(tmp_path / 'running')
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    try:
+        journal_path = write_journal(ioc_dir, {'host' : initIOCs.socket.gethostname(), 'pid' : process.pid})
+        assert not initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+        # Even if it has been running for longer than stale_lock_age
+        os.utime(journal_path, (0, 0))
+        assert not initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+        assert os.path.exists(os.path.join(ioc_dir, 'cam-sim1'))
+    finally:
+        process.kill()
+        process.wait()
+    assert initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+    assert os.listdir(ioc_dir) == []
+
+    # Nor is a recent run on another host, until its journal is older than stale_lock_age
+    ioc_dir = str(tmp_path / 'other-host')
+    journal_path = write_journal(ioc_dir, {'host' : 'other-host', 'pid' : 1})
+    assert not initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+    os.utime(journal_path, (0, 0))
+    assert initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+
+    # Nor a run of this process that is still going
+    ioc_dir = str(tmp_path / 'this-process')
+    os.mkdir(ioc_dir)
+    journal = initIOCs.GenerationJournal(ioc_dir)
+    journal.record('start', os.path.join(ioc_dir, 'cam-sim1'))
+    assert not initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+    journal.close()
+    assert initIOCs.rollback_run(ioc_dir, log=lambda text : None)
+
+
+def test_mkdir_recorded_first(tmp_path, make_config, monkeypatch):
+    ioc_dir = str(tmp_path / 'iocs')
+    os.mkdir(ioc_dir)
+    journal_path = os.path.join(ioc_dir, initIOCs.GenerationJournal.file_name)
+    mkdir = initIOCs.LocalFileSystem.mkdir
+    recorded = []
+
+    def recording_mkdir(self, path):
+        # Write-ahead, the host directory is in the journal before it exists
+        if os.path.dirname(path) == ioc_dir and not os.path.basename(path).startswith('.'):
+            with open(journal_path, 'r') as journal_fp:
+                recorded.append('"{}"'.format(os.path.relpath(path, ioc_dir)) in journal_fp.read())
+        mkdir(self, path)
+
+    monkeypatch.setattr(initIOCs.LocalFileSystem, 'mkdir', recording_mkdir)
+    config = make_config(ioc_dir)
+    assert initIOCs.generate(config, initIOCs.GenerationOptions(partition=True), log=lambda text : None).success
+    assert recorded == [True]
@@ -0,0 +1,70 @@
+import os
+import sys
+import concurrent.futures
+import pytest
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+BUNDLE = os.path.join(TEST_DIR, 'test_bundle_standard')
+
+
+def read_metrics(metrics_path):
+    metrics = {}
+    with open(metrics_path, 'r') as fp:
+        for line in fp:
+            if not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                metrics[name] = float(value)
+    return metrics
+
+
+def test_metrics_file(tmp_path, make_config):
+    result = initIOCs.generate(make_config(str(tmp_path / 'iocs'), num_iocs=3, with_missing=True), log=lambda text : None)
+    metrics_dir = tmp_path / 'textfile'
+    metrics_dir.mkdir()
+    metrics_path = str(metrics_dir / 'initioc.prom')
+    with open(metrics_path, 'w') as fp:
+        fp.write('stale')
+    initIOCs.write_metrics_file(result, metrics_path)
+    assert os.listdir(str(metrics_dir)) == ['initioc.prom']
+
+    metrics = read_metrics(metrics_path)
+    assert metrics['initioc_run_success'] == 0
+    assert metrics['initioc_iocs{status="created"}'] == 3
+    assert metrics['initioc_iocs{status="failed"}'] == 1
+    assert metrics['initioc_bytes_written'] == sum([ioc_result.bytes_written for ioc_result in result.ioc_results]) > 0
+    for phase in initIOCs.generation_phases:
+        assert metrics['initioc_phase_duration_seconds_count{{phase="{}"}}'.format(phase)] == 3
+        assert metrics['initioc_phase_duration_seconds_bucket{{phase="{}",le="+Inf"}}'.format(phase)] == 3
+    # The driver is only scanned once, later IOCs reuse the cached listings and startup scripts
+    hits, misses = metrics['initioc_bundle_cache_lookups{result="hit"}'], metrics['initioc_bundle_cache_lookups{result="miss"}']
+    assert hits > 0 and misses > 0
+    assert metrics['initioc_bundle_cache_hit_ratio'] == hits / (hits + misses)
+
+
+def test_metrics_file_invalid_config(tmp_path, monkeypatch):
+    # A run that never starts is reported as failed, instead of leaving the last good sample in place
+    metrics_path = str(tmp_path / 'initioc.prom')
+    monkeypatch.setattr(sys, 'argv', ['initIOCs.py', '--configure', str(tmp_path / 'missing.yml'), '--metrics-file', metrics_path])
+    with pytest.raises(SystemExit):
+        initIOCs.main()
+    metrics = read_metrics(metrics_path)
+    assert metrics['initioc_run_success'] == 0
+    assert metrics['initioc_iocs{status="created"}'] == 0
+
+
+def test_bundle_scan_per_run(tmp_path, make_config):
+    # Runs sharing an index, ex. jobs of a server, each report only their own lookups
+    bundle_index = initIOCs.BundleIndex(BUNDLE)
+    initIOCs.generate(make_config(str(tmp_path / 'warm'), num_iocs=3, with_missing=True), log=lambda text : None, bundle_index=bundle_index)
+    expected = initIOCs.generate(make_config(str(tmp_path / 'single'), num_iocs=3, with_missing=True), log=lambda text : None, bundle_index=bundle_index).bundle_scan
+    assert expected['cache_misses'] == 0
+
+    def run(index):
+        return initIOCs.generate(make_config(str(tmp_path / 'iocs{}'.format(index)), num_iocs=3, with_missing=True), log=lambda text : None, bundle_index=bundle_index)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(run, range(4)))
+    for result in results:
+        assert (result.bundle_scan['cache_hits'], result.bundle_scan['cache_misses']) == (expected['cache_hits'], 0)
@@ -0,0 +1,67 @@
+import os
+import io
+import sys
+import json
+import tarfile
+import pytest
+import initIOCs
+
+
+def test_events_and_report(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    stream = io.StringIO()
+    result = initIOCs.generate(make_config(ioc_dir, with_missing=True), log=lambda text : None, events=initIOCs.make_event_writer(stream))
+    events = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert events[0]['event'] == 'start' and events[0]['iocs'] == ['cam-sim1', 'cam-missing']
+    assert [(event['event'], event.get('phase')) for event in events[1:]] == [('phase', 'locate'), ('phase', 'generate'), ('phase', 'configure'), ('phase', 'write'), ('ioc', None), ('ioc', None)]
+    assert events[-1]['ioc_name'] == 'cam-missing' and events[-1]['status'] == 'failed'
+
+    created = result.ioc_results[0]
+    assert sorted(created.durations.keys()) == ['configure', 'generate', 'locate', 'write']
+    assert 'st.cmd' in created.files and 'config' in created.files
+    sizes = sum([os.lstat(os.path.join(ioc_dir, 'cam-sim1', file)).st_size for file in created.files if not os.path.islink(os.path.join(ioc_dir, 'cam-sim1', file))])
+    assert created.bytes_written == sizes
+    assert result.ioc_results[1].files == [] and result.ioc_results[1].durations == {}
+
+    report_path = str(tmp_path / 'report.json')
+    initIOCs.write_run_report(result, report_path)
+    with open(report_path, 'r') as fp:
+        report = json.load(fp)
+    assert not report['success']
+    assert report['iocs'][0]['executable_path'] == created.executable_path
+    assert report['iocs'][1]['messages'] == ['ERROR - Could not find binary for ADMissing, skipping...']
+
+
+def test_archive_report(tmp_path, make_config):
+    archive_path = str(tmp_path / 'iocs.tar')
+    config = make_config(str(tmp_path / 'iocs'), with_missing=True)
+    del config['iocs'][1]
+    result = initIOCs.generate(config, initIOCs.GenerationOptions(output_archive=archive_path), log=lambda text : None)
+    with tarfile.open(archive_path) as tar:
+        # The configuration is saved into each IOC with the rest of its files
+        members = [member for member in tar.getmembers() if member.name.startswith('cam-sim1/') and not member.isdir()]
+    assert 'initIOCs.yml' in result.ioc_results[0].files or not initIOCs.WITH_YAML
+    assert sorted(result.ioc_results[0].files) == sorted([member.name[len('cam-sim1/'):] for member in members])
+    assert result.ioc_results[0].bytes_written == sum([member.size for member in members])
+
+
+def test_events_errors_on_stderr(tmp_path, make_config, monkeypatch, capsys):
+    # With --events, stdout only carries events, even when the run ends before generating IOCs
+    config_path = str(tmp_path / 'initIOCs.json')
+    with open(config_path, 'w') as fp:
+        json.dump({'iocs' : []}, fp)
+    monkeypatch.setattr(sys, 'argv', ['initIOCs.py', '--configure', config_path, '--events'])
+    with pytest.raises(SystemExit):
+        initIOCs.main()
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'is not valid' in captured.err
+
+    with open(config_path, 'w') as fp:
+        json.dump(make_config(str(tmp_path / 'iocs')), fp)
+    monkeypatch.setattr(sys, 'argv', ['initIOCs.py', '--configure', config_path, '--events', '--watch', '--output-archive', str(tmp_path / 'iocs.tar')])
+    with pytest.raises(SystemExit):
+        initIOCs.main()
+    captured = capsys.readouterr()
+    assert captured.out == ''
+    assert 'cannot be watched' in captured.err
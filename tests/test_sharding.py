@@ -0,0 +1,102 @@
+import os
+import json
+import subprocess
+import sys
+import concurrent.futures
+import pytest
+import initIOCs
+
+
+def test_select_shard(make_config):
+    assert initIOCs.parse_shard('2/4') == (2, 4)
+    for spec in ['0/4', '5/4', '2', 'a/b']:
+        with pytest.raises(ValueError):
+            initIOCs.parse_shard(spec)
+
+    actions = initIOCs.create_actions(initIOCs.validate_ioc_config(make_config('iocs', num_iocs=40)))
+    shards = [initIOCs.select_shard(actions, index, 4) for index in range(1, 5)]
+    names = [action.ioc_name for shard in shards for action in shard]
+    assert sorted(names) == sorted([action.ioc_name for action in actions])
+    assert all([len(shard) > 0 for shard in shards])
+    # Adding an IOC does not move the others between shards
+    assert initIOCs.select_shard(actions[:20], 3, 4) == [action for action in shards[2] if action in actions[:20]]
+
+
+@pytest.mark.skipif(sys.platform == 'win32', reason='only the lock age is checked on windows')
+def test_ioc_lock(tmp_path):
+    ioc_top = str(tmp_path)
+    lock = initIOCs.IOCLock(ioc_top, 'cam-sim1')
+    assert lock.acquire()
+    other = initIOCs.IOCLock(ioc_top, 'cam-sim1')
+    assert not other.acquire()
+    assert other.holder['pid'] == os.getpid()
+    lock.release()
+    assert other.acquire()
+    other.release()
+    assert os.listdir(ioc_top) == []
+
+    # A lock left by a process that exited on this host is broken
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    with open(lock.path, 'w') as lock_fp:
+        lock_fp.write(json.dumps({'host' : lock.owner['host'], 'pid' : process.pid, 'time' : 0}))
+    assert lock.acquire()
+    lock.release()
+
+    # A lock held by a running process on this host is kept, however old it is
+    with open(lock.path, 'w') as lock_fp:
+        lock_fp.write(json.dumps({'host' : lock.owner['host'], 'pid' : os.getpid(), 'time' : 0}))
+    os.utime(lock.path, (0, 0))
+    assert not lock.acquire()
+    os.remove(lock.path)
+
+    # A lock from another host is broken once it is older than stale_lock_age
+    with open(lock.path, 'w') as lock_fp:
+        lock_fp.write(json.dumps({'host' : 'other-host', 'pid' : 1, 'time' : 0}))
+    assert not lock.acquire()
+    os.utime(lock.path, (0, 0))
+    assert lock.acquire()
+    lock.release()
+
+
+def test_concurrent_shards(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    config = make_config(ioc_dir, num_iocs=12)
+    options = [initIOCs.GenerationOptions(shard='{}/3'.format(index)) for index in range(1, 4)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
+        results = list(executor.map(lambda shard_options : initIOCs.generate(config, shard_options, log=lambda text : None), options))
+    assert all([result.success for result in results])
+    assert sum([len(result.ioc_results) for result in results]) == 12
+    # Only the IOCs are left behind, no locks, journals or staging directories
+    assert sorted(os.listdir(ioc_dir)) == sorted([ioc['name'] for ioc in config['iocs']])
+
+
+def test_locked_ioc(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    os.makedirs(ioc_dir)
+    lock = initIOCs.IOCLock(ioc_dir, 'cam-sim2')
+    assert lock.acquire()
+    result = initIOCs.generate(make_config(ioc_dir, num_iocs=2), log=lambda text : None)
+    lock.release()
+    assert [ioc_result.status for ioc_result in result.ioc_results] == ['created', 'locked']
+    assert result.success
+    assert not os.path.exists(os.path.join(ioc_dir, 'cam-sim2'))
+
+
+def test_overlapping_runs(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    config = make_config(ioc_dir, num_iocs=3)
+    second = []
+    messages = []
+
+    def log(text):
+        # A second run over the same IOCs starts while the first one holds the lock of cam-sim2
+        if text == 'Setup process for IOC cam-sim2' and len(second) == 0:
+            second.append(initIOCs.generate(config, log=messages.append))
+
+    first = initIOCs.generate(config, initIOCs.GenerationOptions(shard='1/1'), log=log)
+    assert [ioc_result.status for ioc_result in first.ioc_results] == ['created', 'created', 'skipped']
+    assert [ioc_result.status for ioc_result in second[0].ioc_results] == ['skipped', 'locked', 'created']
+    assert first.success and second[0].success
+    assert not any([message.startswith('ERROR') and 'cam-sim2' in message for message in messages])
+    assert sorted(os.listdir(ioc_dir)) == ['cam-sim1', 'cam-sim2', 'cam-sim3']
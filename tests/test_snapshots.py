@@ -0,0 +1,66 @@
+import os
+import shutil
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def read_file(path):
+    with open(path, 'r') as fp:
+        return fp.read()
+
+
+def test_snapshot_and_restore(tmp_path, make_config):
+    ioc_dir = str(tmp_path / 'iocs')
+    assert initIOCs.generate(make_config(ioc_dir, num_iocs=2), log=lambda text : None).success
+    ioc_path = os.path.join(ioc_dir, 'cam-sim1')
+    with open(os.path.join(ioc_path, 'autosave', 'auto_settings.sav'), 'w') as fp:
+        fp.write('TEST1:{Sim-Cam:1}cam1:AcquireTime 0.5\n')
+    st_cmd = read_file(os.path.join(ioc_path, 'st.cmd'))
+
+    store = initIOCs.SnapshotStore(ioc_dir)
+    name = store.create([ioc_path], copy_files={ioc_path : ['st.cmd']})
+    snapshot_ioc = os.path.join(store.path, name, 'cam-sim1')
+    # Unchanged files share their inode, files that will change, editable and autosave files do not
+    assert os.path.samefile(os.path.join(ioc_path, 'NexusTemplate.xml'), os.path.join(snapshot_ioc, 'NexusTemplate.xml'))
+    assert not os.path.samefile(os.path.join(ioc_path, 'unique.cmd'), os.path.join(snapshot_ioc, 'unique.cmd'))
+    assert not os.path.samefile(os.path.join(ioc_path, 'st.cmd'), os.path.join(snapshot_ioc, 'st.cmd'))
+    assert not os.path.samefile(os.path.join(ioc_path, 'autosave', 'auto_settings.sav'), os.path.join(snapshot_ioc, 'autosave', 'auto_settings.sav'))
+    assert [snapshot[1]['iocs'] for snapshot in store.list()] == [['cam-sim1']]
+
+    with open(os.path.join(ioc_path, 'st.cmd'), 'w') as fp:
+        fp.write('broken\n')
+    shutil.rmtree(os.path.join(ioc_path, 'autosave'))
+    assert store.restore(name, log=lambda text : None)
+    assert read_file(os.path.join(ioc_path, 'st.cmd')) == st_cmd
+    assert os.path.exists(os.path.join(ioc_path, 'autosave', 'auto_settings.sav'))
+    assert os.access(os.path.join(ioc_path, 'st.cmd'), os.X_OK)
+    # Editing a restored script in place leaves the snapshot unchanged
+    unique_cmd = read_file(os.path.join(snapshot_ioc, 'unique.cmd'))
+    with open(os.path.join(ioc_path, 'unique.cmd'), 'a') as fp:
+        fp.write('epicsEnvSet("EDITED", "1")\n')
+    assert read_file(os.path.join(snapshot_ioc, 'unique.cmd')) == unique_cmd
+    assert [name for name in os.listdir(store.path) if name.startswith('.restore-')] == []
+    # The state before the restore was kept as well
+    assert [snapshot[0].endswith('before-restore') for snapshot in store.list()] == [False, True]
+    assert not store.restore('missing', log=lambda text : None)
+
+
+def test_retarget_snapshot(tmp_path, make_config):
+    old_bundle = str(tmp_path / 'old')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), old_bundle, symlinks=True)
+    new_bundle = str(tmp_path / 'new')
+    shutil.copytree(old_bundle, new_bundle, symlinks=True)
+    ioc_dir = str(tmp_path / 'iocs')
+    assert initIOCs.generate(make_config(ioc_dir, old_bundle, num_iocs=2), log=lambda text : None).success
+
+    initIOCs.retarget_iocs(ioc_dir, new_bundle, dry_run=True, log=lambda text : None)
+    assert initIOCs.SnapshotStore(ioc_dir).list() == []
+    initIOCs.retarget_iocs(ioc_dir, new_bundle, log=lambda text : None)
+    (name, manifest), = initIOCs.SnapshotStore(ioc_dir).list()
+    assert manifest['iocs'] == ['cam-sim1', 'cam-sim2']
+    assert old_bundle in read_file(os.path.join(ioc_dir, initIOCs.SnapshotStore.dir_name, name, 'cam-sim1', 'envPaths'))
+
+    assert initIOCs.manage_snapshots(ioc_dir, restore=name, log=lambda text : None)
+    assert old_bundle in read_file(os.path.join(ioc_dir, 'cam-sim1', 'envPaths'))
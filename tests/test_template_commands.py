@@ -0,0 +1,135 @@
+import os
+import sys
+import time
+import threading
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def test_command_timeout():
+    runner = initIOCs.CommandRunner(timeout=0.5)
+    start = time.monotonic()
+    # The child starts a grandchild, which is killed with it
+    result = runner.run([sys.executable, '-c', 'import subprocess, sys, time; print("started", flush=True); subprocess.call([sys.executable, "-c", "import time; time.sleep(30)"])'])
+    assert time.monotonic() - start < 10
+    assert result.timed_out and not result.succeeded()
+    assert result.output == 'started\n'
+    assert 'timed out' in result.describe()
+
+    result = runner.run([sys.executable, '-c', 'import sys; sys.stderr.write("failed"); sys.exit(3)'])
+    assert result.returncode == 3 and result.output == 'failed'
+    assert initIOCs.CommandRunner().run(['initIOC-missing-command']).returncode is None
+
+
+def test_command_concurrency_limit(monkeypatch):
+    runner = initIOCs.CommandRunner(max_concurrent=2)
+    running = []
+    peak = []
+    lock = threading.Lock()
+    class CountingPopen(initIOCs.subprocess.Popen):
+        def __init__(self, *args, **kwargs):
+            with lock:
+                running.append(self)
+                peak.append(len(running))
+            super().__init__(*args, **kwargs)
+
+        def communicate(self, *args, **kwargs):
+            try:
+                return super().communicate(*args, **kwargs)
+            finally:
+                with lock:
+                    running.remove(self)
+
+    monkeypatch.setattr(initIOCs.subprocess, 'Popen', CountingPopen)
+    threads = [threading.Thread(target=runner.run, args=([sys.executable, '-c', 'import time; time.sleep(0.2)'],)) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert max(peak) == 2
+
+
+def test_native_template_cleanup(tmp_path):
+    ioc_path = tmp_path / 'cam-sim1'
+    for directory in ['.git/objects', 'startupScripts', 'autosaveFiles', 'dependancyFiles', 'iocBoot']:
+        os.makedirs(str(ioc_path / directory))
+    for file in ['README.md', 'cleanup.sh', 'cleanup.bat', 'st.cmd', 'startupScripts/simSt.cmd']:
+        (ioc_path / file).write_text('')
+    # Git objects are read-only
+    (ioc_path / '.git' / 'objects' / 'pack').write_text('')
+    os.chmod(str(ioc_path / '.git' / 'objects' / 'pack'), 0o444)
+
+    messages = []
+    manager = initIOCs.IOCActionManager(str(tmp_path), os.path.join(TEST_DIR, 'test_bundle_standard'), False, True, True, False, log=messages.append)
+    action = initIOCs.IOCAction({'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4001, 'connection' : 'NA'}, 'TEST1:')
+    manager.cleanup_template(action, str(ioc_path))
+    assert sorted(os.listdir(str(ioc_path))) == ['iocBoot', 'st.cmd']
+    assert not any([message.startswith('WARNING') for message in messages])
+
+
+class TemplateCloneRunner:
+    """Command runner that creates a template checkout instead of cloning it"""
+
+    def __init__(self, with_autosave=True):
+        self.with_autosave = with_autosave
+        self.commands = []
+
+    def run(self, args, cwd=None, timeout=None, env=None):
+        self.commands.append(args)
+        ioc_path = args[-1]
+        directories = ['.git', 'startupScripts', 'dependancyFiles']
+        if self.with_autosave:
+            directories.append('autosaveFiles')
+        for directory in directories:
+            os.makedirs(os.path.join(ioc_path, directory))
+        files = {
+            'st.cmd' : '', 'unique.cmd' : '', 'envPaths' : '', 'config' : '', 'README.md' : '', 'cleanup.sh' : '', 'cleanup.bat' : '',
+            'startupScripts/simdetectorSt.cmd' : 'errlogInit(20000)\n< envPaths\nepicsEnvSet("PREFIX", "13SIM1:")\nsimDetectorConfig("$(PORT)", 1024, 1024, 1, 0, 0)\niocInit()\n',
+            'dependancyFiles/simdetector_extra.cmd' : 'dbpf("$(PREFIX)cam1:Acquire", "0")\n',
+        }
+        if self.with_autosave:
+            files['autosaveFiles/simdetector_settings.req'] = 'file "ADBase_settings.req", P=$(P), R=cam1:\n'
+        for name, text in files.items():
+            with open(os.path.join(ioc_path, name), 'w') as fp:
+                fp.write(text)
+        return initIOCs.CommandResult(args, 0)
+
+
+def test_template_process_action(tmp_path):
+    ioc_top = str(tmp_path / 'iocs')
+    manager = initIOCs.IOCActionManager(ioc_top, os.path.join(TEST_DIR, 'test_bundle_standard'), False, True, False, False, log=lambda text : None)
+    manager.command_runner = TemplateCloneRunner()
+    action = initIOCs.IOCAction({'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4001, 'connection' : 'NA'}, 'TEST1:')
+    action.epics_environment['HOSTNAME'] = 'localhost'
+    action.epics_environment['EPICS_CA_ADDR_LIST'] = '127.0.0.255'
+    action.epics_environment['ENGINEER'] = 'J. Wlodek'
+    result = manager.process_action(action)
+    assert result.status == 'created'
+    assert manager.command_runner.commands[0][:2] == ['git', 'clone']
+
+    ioc_path = os.path.join(ioc_top, 'cam-sim1')
+    contents = os.listdir(ioc_path)
+    for name in ['st.cmd', 'unique.cmd', 'envPaths', 'config', 'auto_settings.req', 'extra.cmd']:
+        assert name in contents
+    for name in initIOCs.template_cleanup_paths:
+        assert name not in contents
+    with open(os.path.join(ioc_path, 'envPaths')) as fp:
+        assert 'TOP' in fp.read()
+
+
+def test_template_failure_removes_clone(tmp_path):
+    ioc_top = str(tmp_path / 'iocs')
+    messages = []
+    manager = initIOCs.IOCActionManager(ioc_top, os.path.join(TEST_DIR, 'test_bundle_standard'), False, True, False, False, log=messages.append)
+    # Without autosaveFiles, generating the IOC fails after the clone
+    manager.command_runner = TemplateCloneRunner(with_autosave=False)
+    action = initIOCs.IOCAction({'name' : 'cam-sim1', 'type' : 'ADSimDetector', 'device_prefix' : '{Sim-Cam:1}', 'asyn_port' : 'SIM1', 'telnet_port' : 4001, 'connection' : 'NA'}, 'TEST1:')
+    action.epics_environment['HOSTNAME'] = 'localhost'
+    action.epics_environment['EPICS_CA_ADDR_LIST'] = '127.0.0.255'
+    action.epics_environment['ENGINEER'] = 'J. Wlodek'
+    result = manager.process_action(action)
+    assert result.status == 'failed'
+    assert not os.path.exists(os.path.join(ioc_top, 'cam-sim1'))
+    assert any([message.startswith('ERROR') for message in messages])
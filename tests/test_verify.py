@@ -0,0 +1,38 @@
+import os
+import shutil
+import initIOCs
+
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+SIM_DETECTOR = os.path.join('support', 'areaDetector', 'ADSimDetector')
+
+
+def test_expand_macros():
+    environment = {'ADCORE' : '$(AREA_DETECTOR)/ADCore', 'AREA_DETECTOR' : '/epics/support/areaDetector'}
+    assert initIOCs.expand_macros('< $(ADCORE)/iocBoot/commonPlugins.cmd', environment) == ('< /epics/support/areaDetector/ADCore/iocBoot/commonPlugins.cmd', [])
+    assert initIOCs.expand_macros('${QSIZE=20} $(PREFIX)', environment) == ('20 $(PREFIX)', ['PREFIX'])
+    assert initIOCs.parse_iocsh_command('dbLoadRecords("$(ADCORE)/db/NDFile.template", "P=$(PREFIX),R=cam1:")') == ('dbLoadRecords', ['$(ADCORE)/db/NDFile.template', 'P=$(PREFIX),R=cam1:'])
+    # Blank lines, and lines of empty quotes, have no command
+    for line in ['', '   \n', '""', "''"]:
+        assert initIOCs.parse_iocsh_command(line) == (None, [])
+
+
+def test_verify_iocs(tmp_path, make_config):
+    bundle = str(tmp_path / 'bundle')
+    shutil.copytree(os.path.join(TEST_DIR, 'test_bundle_standard'), bundle, symlinks=True)
+    ioc_dir = str(tmp_path / 'iocs')
+    assert initIOCs.generate(make_config(ioc_dir, bundle, num_iocs=2), log=lambda text : None).success
+
+    problems = initIOCs.verify_iocs(ioc_dir, log=lambda text : None)
+    assert list(problems.keys()) == [os.path.join(ioc_dir, 'cam-sim1'), os.path.join(ioc_dir, 'cam-sim2')]
+    missing_template = os.path.join(bundle, SIM_DETECTOR, 'db', 'simDetector.template')
+    assert any([problem.endswith('dbLoadRecords file not found: {}'.format(missing_template)) for problem in problems[os.path.join(ioc_dir, 'cam-sim1')]])
+    assert any(['included file not found' in problem for problem in problems[os.path.join(ioc_dir, 'cam-sim1')]])
+    # The dbd file and autosave request file exist, so they are not reported
+    assert not any(['simDetectorApp.dbd' in problem or 'auto_settings.req' in problem for problem in problems[os.path.join(ioc_dir, 'cam-sim1')]])
+
+    # Adding the missing files to the bundle resolves the problems
+    os.makedirs(os.path.join(bundle, SIM_DETECTOR, 'db'))
+    open(missing_template, 'w').close()
+    problems = initIOCs.verify_iocs(ioc_dir, log=lambda text : None)
+    assert not any([missing_template in problem for problem in problems[os.path.join(ioc_dir, 'cam-sim1')]])